@@ -1,11 +1,15 @@
-from flask import Flask
 import os
 import logging
+from flask import Flask
 from .services.todo_service import TodoService
 from .controllers.todo_controller import todo_bp
 from .filters import register_filters
+from .cli import register_cli
+from .metrics import register_metrics
+from .compression import register_compression
+from .metrics.profiler import register_profiling
 from .bootstrap import AppInitializer
-from app.constants import KEY_DATA_FILE, KEY_SECRET_KEY, KEY_LOG_LEVEL
+from app.constants import KEY_DATA_FILE, KEY_SQLITE_FILE, KEY_SECRET_KEY, KEY_LOG_LEVEL, KEY_STORAGE_MODE, KEY_JOURNAL_COMPACT_THRESHOLD, KEY_STREAM_INDEX, KEY_METRICS_DIR, KEY_PROFILE_DIR, KEY_PROFILE_SLOW_MS, KEY_PROFILE_SAMPLE_PERCENT, KEY_PROFILE_INTERVAL_MS, KEY_ASGI_THREADS, KEY_COMMIT_WINDOW_MS, KEY_FSYNC_POLICY, KEY_ROW_CACHE_BYTES, KEY_ARCHIVE_AFTER_DAYS, KEY_COMPRESS_MIN_BYTES, KEY_COMPRESS_CACHE_BYTES, KEY_GZIP_LEVEL, KEY_BROTLI_LEVEL, KEY_ZSTD_LEVEL, STORAGE_MODE_JSON, FSYNC_BATCHED, DEFAULT_DATA_FILE, DEFAULT_SQLITE_FILE
 
 def create_app(config: dict | None = None) -> Flask:
     # Initialize the Flask application
@@ -13,7 +17,40 @@ def create_app(config: dict | None = None) -> Flask:
     # Assign global variables from environment variables
     app.config.from_mapping(
         # Data file location
-        DATA_FILE=os.getenv(KEY_DATA_FILE, "data/todos.json"),
+        DATA_FILE=os.getenv(KEY_DATA_FILE, DEFAULT_DATA_FILE),
+        # SQLite database location (used by the "sqlite" storage mode)
+        SQLITE_FILE=os.getenv(KEY_SQLITE_FILE, DEFAULT_SQLITE_FILE),
+        # Storage mode: "json" rewrites the data file on every change,
+        # "journal" appends changes to a journal next to the data file,
+        # "sqlite" stores todos in the SQLite database
+        STORAGE_MODE=os.getenv(KEY_STORAGE_MODE, STORAGE_MODE_JSON),
+        # Number of journal records that triggers folding them into the data file
+        JOURNAL_COMPACT_THRESHOLD=int(os.getenv(KEY_JOURNAL_COMPACT_THRESHOLD, "1000")),
+        # Days after which completed todos move from the data file to the
+        # archive file ("json" and "journal" modes), 0 keeps them all in it
+        ARCHIVE_AFTER_DAYS=float(os.getenv(KEY_ARCHIVE_AFTER_DAYS, "30")),
+        # Time a write waits for concurrent changes to share its commit
+        COMMIT_WINDOW_MS=float(os.getenv(KEY_COMMIT_WINDOW_MS, "0")),
+        # Which commits are flushed to disk: "always", "batched" (at most
+        # once a second) or "never" (left to the operating system)
+        FSYNC_POLICY=os.getenv(KEY_FSYNC_POLICY, FSYNC_BATCHED),
+        # Stream the index page to the client while its rows are produced
+        STREAM_INDEX=os.getenv(KEY_STREAM_INDEX, "false").lower() in ("1", "true", "yes"),
+        # Directory shared by the workers of one server for adding up their
+        # metrics, without it /metrics reports the answering worker only
+        METRICS_DIR=os.getenv(KEY_METRICS_DIR),
+        # Memory for rendered rows of the index page, 0 turns the cache off
+        ROW_CACHE_BYTES=int(os.getenv(KEY_ROW_CACHE_BYTES, str(4 * 1024 * 1024))),
+        # HTML responses of at least this size are compressed for clients
+        # accepting gzip, or brotli and zstd when those modules are installed
+        COMPRESS_MIN_BYTES=int(os.getenv(KEY_COMPRESS_MIN_BYTES, "1024")),
+        GZIP_LEVEL=int(os.getenv(KEY_GZIP_LEVEL, "6")),
+        BROTLI_LEVEL=int(os.getenv(KEY_BROTLI_LEVEL, "5")),
+        ZSTD_LEVEL=int(os.getenv(KEY_ZSTD_LEVEL, "3")),
+        # Memory for compressed pages kept for reuse, 0 turns the cache off
+        COMPRESS_CACHE_BYTES=int(os.getenv(KEY_COMPRESS_CACHE_BYTES, str(16 * 1024 * 1024))),
+        # Number of requests asgi.py runs at the same time
+        ASGI_THREADS=int(os.getenv(KEY_ASGI_THREADS, "32")),
         # Secret key for signing session cookies, generating CSRF tokens, etc
         SECRET_KEY=os.getenv(KEY_SECRET_KEY, "dev"),
         # Enable CSRF protection
@@ -28,10 +65,29 @@ def create_app(config: dict | None = None) -> Flask:
     log_level = getattr(logging, log_level_name, logging.DEBUG)
     app.logger.setLevel(log_level)
 
+    # Read profiling options from environment (default: off). Profiles are
+    # written to PROFILE_DIR for requests slower than PROFILE_SLOW_MS and
+    # for PROFILE_SAMPLE_PERCENT of all requests.
+    app.config.setdefault(KEY_PROFILE_DIR, os.getenv(KEY_PROFILE_DIR))
+    app.config.setdefault(KEY_PROFILE_SLOW_MS, float(os.getenv(KEY_PROFILE_SLOW_MS, "0")))
+    app.config.setdefault(KEY_PROFILE_SAMPLE_PERCENT, float(os.getenv(KEY_PROFILE_SAMPLE_PERCENT, "0")))
+    # Stack sampling interval used for the slow request profiles
+    app.config.setdefault(KEY_PROFILE_INTERVAL_MS, float(os.getenv(KEY_PROFILE_INTERVAL_MS, "5")))
+    register_profiling(app)
+
     # Register Jinja template filters
     register_filters(app)
 
+    # Request timing and the /metrics endpoint
+    register_metrics(app)
+
+    # Compressed HTML responses, runs before the metrics hook
+    register_compression(app)
+
     # App wiring (services + routes)
     AppInitializer.init_app(app)
 
+    # "flask todos import/export" commands
+    register_cli(app)
+
     return app
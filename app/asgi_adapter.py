@@ -0,0 +1,33 @@
+import asyncio
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """
+    Serves a WSGI application to an ASGI server, running every request on
+    a thread of its own, at most max_requests at the same time.
+
+    The plain WsgiToAsgi runs every request on one shared thread, so a
+    request waiting on the disk would hold up all others. Within a
+    ThreadSensitiveContext asgiref runs it on a thread of the request
+    instead.
+    """
+
+    def __init__(self, wsgi_application, max_requests: int):
+        super().__init__(wsgi_application)
+        self.max_requests = max_requests
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    def _requests(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_requests)
+        return self._slots
+
+    async def __call__(self, scope, receive, send):
+        async with self._requests(), ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
@@ -1,7 +1,12 @@
+import hashlib
 from flask import Flask
 from .services.todo_service import TodoService
 from .controllers.todo_controller import todo_bp
-from app.constants import KEY_DATA_FILE
+from .repositories.todo_repository import TodoRepository
+from .repositories.file_todo_repository import FileTodoRepository
+from .repositories.snapshot_todo_repository import SnapshotTodoRepository
+from .repositories.sqlite_todo_repository import SqliteTodoRepository
+from app.constants import KEY_DATA_FILE, KEY_SQLITE_FILE, KEY_STORAGE_MODE, KEY_JOURNAL_COMPACT_THRESHOLD, KEY_COMMIT_WINDOW_MS, KEY_FSYNC_POLICY, KEY_ARCHIVE_AFTER_DAYS, STORAGE_MODE_SQLITE, STORAGE_MODE_SNAPSHOT
 
 
 class AppInitializer:
@@ -12,7 +17,45 @@ class AppInitializer:
     @staticmethod
     def init_app(app: Flask) -> None:
         # Initialize services
-        app.todo_service = TodoService(app.config[KEY_DATA_FILE])
+        app.todo_service = TodoService(AppInitializer.create_repository(app))
+        # Part of every ETag, so cached pages are not reused after a deploy
+        # that changed how they render
+        app.template_digest = AppInitializer.template_digest(app)
 
         # Register blueprints
         app.register_blueprint(todo_bp)
+
+    @staticmethod
+    def create_repository(app: Flask) -> TodoRepository:
+        """
+        Select the storage repository configured by STORAGE_MODE.
+        """
+        if app.config[KEY_STORAGE_MODE] == STORAGE_MODE_SQLITE:
+            return SqliteTodoRepository(app.config[KEY_SQLITE_FILE], fsync_policy=app.config[KEY_FSYNC_POLICY])
+        if app.config[KEY_STORAGE_MODE] == STORAGE_MODE_SNAPSHOT:
+            return SnapshotTodoRepository(
+                app.config[KEY_DATA_FILE],
+                commit_window_ms=app.config[KEY_COMMIT_WINDOW_MS],
+                fsync_policy=app.config[KEY_FSYNC_POLICY],
+            )
+
+        return FileTodoRepository(
+            app.config[KEY_DATA_FILE],
+            storage_mode=app.config[KEY_STORAGE_MODE],
+            journal_compact_threshold=app.config[KEY_JOURNAL_COMPACT_THRESHOLD],
+            commit_window_ms=app.config[KEY_COMMIT_WINDOW_MS],
+            fsync_policy=app.config[KEY_FSYNC_POLICY],
+            archive_after_days=app.config[KEY_ARCHIVE_AFTER_DAYS],
+        )
+
+    @staticmethod
+    def template_digest(app: Flask) -> str:
+        """
+        Digest of the sources of all templates.
+        """
+        digest = hashlib.blake2b(digest_size=8)
+        for name in sorted(app.jinja_env.list_templates()):
+            source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+            digest.update(name.encode())
+            digest.update(source.encode())
+        return digest.hexdigest()
@@ -0,0 +1,64 @@
+import sys
+from contextlib import nullcontext
+from typing import ContextManager, TextIO
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from .services.todo_transfer import FORMAT_CSV, FORMAT_NDJSON, IMPORT_CHUNK_SIZE, MEDIA_TYPES, export_todos, import_todos
+from app.constants import CHARACTER_ENCODING
+
+todos_cli = AppGroup("todos", help="Import and export todos.")
+
+
+def _format(path: str, fmt: str | None) -> str:
+    """
+    The format given, or the one the file name ends with (NDJSON otherwise).
+    """
+    if fmt:
+        return fmt
+    return FORMAT_CSV if path.lower().endswith("." + FORMAT_CSV) else FORMAT_NDJSON
+
+
+def _open(path: str, mode: str) -> ContextManager[TextIO]:
+    """
+    Open a file for the csv module, or stdin/stdout for "-".
+    """
+    if path == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, encoding=CHARACTER_ENCODING, newline="")
+
+
+@todos_cli.command("import")
+@click.argument("path", default="-")
+@click.option("--format", "fmt", type=click.Choice(list(MEDIA_TYPES)), help="Input format, by default from the file name.")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=IMPORT_CHUNK_SIZE, show_default=True, help="Todos added per write.")
+def import_command(path: str, fmt: str | None, chunk_size: int) -> None:
+    """
+    Add the todos of an NDJSON or CSV file, or of stdin with "-".
+    """
+    with _open(path, "r") as stream:
+        result = import_todos(current_app.todo_service, stream, _format(path, fmt), chunk_size)
+    for rejected in result.errors:
+        click.echo(f"line {rejected.line}: {rejected.error}", err=True)
+    click.echo(f"Imported {result.imported} todos, rejected {result.rejected} records.", err=True)
+    if result.rejected:
+        sys.exit(1)
+
+
+@todos_cli.command("export")
+@click.argument("path", default="-")
+@click.option("--format", "fmt", type=click.Choice(list(MEDIA_TYPES)), help="Output format, by default from the file name.")
+def export_command(path: str, fmt: str | None) -> None:
+    """
+    Write all todos, oldest first, to an NDJSON or CSV file, or to stdout with "-".
+    """
+    with _open(path, "w") as out:
+        for text in export_todos(current_app.todo_service.iter_all(), _format(path, fmt)):
+            out.write(text)
+
+
+def register_cli(app: Flask) -> None:
+    """
+    Register the "flask todos" commands.
+    """
+    app.cli.add_command(todos_cli)
@@ -0,0 +1,175 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+from flask import Flask, Response, current_app, request, session
+from app.constants import KEY_COMPRESS_MIN_BYTES, KEY_COMPRESS_CACHE_BYTES, KEY_GZIP_LEVEL, KEY_BROTLI_LEVEL, KEY_ZSTD_LEVEL
+
+# Brotli and Zstandard are used when installed, gzip is always there
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    # Python 3.14 and later
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# Encodings in the order they are preferred when the client accepts
+# several equally
+ENCODING_ZSTD = "zstd"
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+
+Compress = Callable[[bytes, int], bytes]
+
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    if hasattr(zstd, "ZstdCompressor"):
+        return zstd.ZstdCompressor(level=level).compress(data)
+    return zstd.compress(data, level=level)
+
+
+def available_encodings() -> dict[str, Compress]:
+    """
+    The content encodings this installation can produce, preferred first.
+    """
+    encodings: dict[str, Compress] = {}
+    if zstd is not None:
+        encodings[ENCODING_ZSTD] = _zstd_compress
+    if brotli is not None:
+        encodings[ENCODING_BROTLI] = lambda data, level: brotli.compress(data, quality=level)
+    # No modification time, so the same page always compresses the same
+    encodings[ENCODING_GZIP] = lambda data, level: gzip.compress(data, compresslevel=level, mtime=0)
+    return encodings
+
+
+class CompressedPages:
+    """
+    LRU cache of compressed page bodies with their headers.
+
+    Keys hold the ETag of the page, which changes with the data version,
+    the list options and anything else the page depends on, so an entry
+    never goes stale. Entries are evicted least recently used first once
+    their bodies exceed max_bytes in total. A max_bytes of 0 turns the
+    cache off.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[bytes, list[tuple[str, str]]]] = OrderedDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> tuple[bytes, list[tuple[str, str]]] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, body: bytes, headers: list[tuple[str, str]]) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[0])
+            self._entries[key] = (body, headers)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+# Headers a cached page is sent with again
+CACHED_HEADERS = ("Content-Type", "Content-Encoding", "Vary", "ETag", "Last-Modified", "Cache-Control")
+
+
+def _negotiate() -> str | None:
+    """
+    The encoding to send the current response in, None for none.
+    """
+    return request.accept_encodings.best_match(list(current_app.compress_encodings))
+
+
+def _cache_key(etag: str, encoding: str) -> tuple:
+    # The links in the page depend on where the app is mounted
+    return etag, request.script_root, encoding
+
+
+def cached_page(etag: str) -> Response | None:
+    """
+    The compressed page with this ETag in the encoding the client accepts,
+    if it was cached. Sent as it is, without rendering or compressing.
+    """
+    encoding = _negotiate()
+    if encoding is None:
+        return None
+    entry = current_app.compressed_pages.get(_cache_key(etag, encoding))
+    if entry is None:
+        return None
+    current_app.metrics.inc("todo_compressed_responses_total", encoding=encoding, cache="hit")
+    body, headers = entry
+    return current_app.response_class(body, headers=headers)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress an HTML response of at least COMPRESS_MIN_BYTES in the best
+    encoding the client accepts, and cache it if it has an ETag and sets
+    nothing for the client.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype != "text/html"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < current_app.config[KEY_COMPRESS_MIN_BYTES]:
+        return response
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+
+    compressed = current_app.compress_encodings[encoding](body, current_app.compress_levels[encoding])
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    current_app.metrics.inc("todo_compressed_responses_total", encoding=encoding, cache="miss")
+    current_app.metrics.inc("todo_compressed_bytes_saved_total", len(body) - len(compressed))
+
+    etag, _ = response.get_etag()
+    # A page that changed the session (a new CSRF token) or sets a cookie
+    # belongs to this client only
+    if etag is not None and not session.modified and "Set-Cookie" not in response.headers:
+        # The compressed body is another representation of the same page,
+        # which a weak ETag allows
+        response.set_etag(etag, weak=True)
+        headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+        current_app.compressed_pages.put(_cache_key(etag, encoding), compressed, headers)
+    return response
+
+
+def register_compression(app: Flask) -> None:
+    """
+    Compress HTML responses for clients that accept it.
+    """
+    app.compress_encodings = available_encodings()
+    app.compress_levels = {
+        ENCODING_ZSTD: app.config[KEY_ZSTD_LEVEL],
+        ENCODING_BROTLI: app.config[KEY_BROTLI_LEVEL],
+        ENCODING_GZIP: app.config[KEY_GZIP_LEVEL],
+    }
+    app.compressed_pages = CompressedPages(app.config[KEY_COMPRESS_CACHE_BYTES])
+    app.after_request(compress_response)
@@ -1,4 +1,32 @@
 KEY_DATA_FILE="DATA_FILE"
+KEY_SQLITE_FILE="SQLITE_FILE"
 KEY_SECRET_KEY="SECRET_KEY"
 KEY_LOG_LEVEL="LOG_LEVEL"
-CHARACTER_ENCODING="utf-8"
\ No newline at end of file
+KEY_STORAGE_MODE="STORAGE_MODE"
+KEY_JOURNAL_COMPACT_THRESHOLD="JOURNAL_COMPACT_THRESHOLD"
+KEY_STREAM_INDEX="STREAM_INDEX"
+KEY_METRICS_DIR="METRICS_DIR"
+KEY_PROFILE_DIR="PROFILE_DIR"
+KEY_PROFILE_SLOW_MS="PROFILE_SLOW_MS"
+KEY_PROFILE_SAMPLE_PERCENT="PROFILE_SAMPLE_PERCENT"
+KEY_PROFILE_INTERVAL_MS="PROFILE_INTERVAL_MS"
+KEY_ASGI_THREADS="ASGI_THREADS"
+KEY_COMMIT_WINDOW_MS="COMMIT_WINDOW_MS"
+KEY_FSYNC_POLICY="FSYNC_POLICY"
+KEY_ROW_CACHE_BYTES="ROW_CACHE_BYTES"
+KEY_ARCHIVE_AFTER_DAYS="ARCHIVE_AFTER_DAYS"
+KEY_COMPRESS_MIN_BYTES="COMPRESS_MIN_BYTES"
+KEY_COMPRESS_CACHE_BYTES="COMPRESS_CACHE_BYTES"
+KEY_GZIP_LEVEL="GZIP_LEVEL"
+KEY_BROTLI_LEVEL="BROTLI_LEVEL"
+KEY_ZSTD_LEVEL="ZSTD_LEVEL"
+CHARACTER_ENCODING="utf-8"
+DEFAULT_DATA_FILE="data/todos.json"
+DEFAULT_SQLITE_FILE="data/todos.sqlite3"
+STORAGE_MODE_JSON="json"
+STORAGE_MODE_JOURNAL="journal"
+STORAGE_MODE_SQLITE="sqlite"
+STORAGE_MODE_SNAPSHOT="snapshot"
+FSYNC_ALWAYS="always"
+FSYNC_BATCHED="batched"
+FSYNC_NEVER="never"
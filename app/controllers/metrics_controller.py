@@ -0,0 +1,9 @@
+from flask import Blueprint, current_app
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.get("/metrics")
+def metrics():
+    # Include the latest values of this worker in the shared totals
+    current_app.metrics.sync(force=True)
+    return current_app.response_class(current_app.metrics.export(), mimetype="text/plain; version=0.0.4")
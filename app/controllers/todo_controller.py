@@ -1,28 +1,146 @@
-from flask import Blueprint, current_app, request, redirect, url_for, render_template, abort
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+from flask import Blueprint, Response, current_app, g, request, session, redirect, url_for, render_template, abort, make_response, stream_with_context
+import hashlib
+import io
 import logging
+from dataclasses import asdict
+from datetime import date, datetime, time, UTC
+from typing import Callable
 from ..forms.todo_form import TodoForm
+from ..forms.bulk_forms import BulkActionForm, BulkAddForm
+from ..models.bulk_result import BulkResult
+from ..metrics import timed
+from ..compression import cached_page
 from ..forms.list_options_form import ListOptionsForm
+from ..forms.list_options_resolver import ListOptionsResolver
+from ..models.list_options import today_ordinal
+from ..repositories.todo_repository import VersionConflict
+from ..services.todo_transfer import FORMAT_NDJSON, MEDIA_TYPES, export_todos, import_todos
+from app.constants import KEY_STREAM_INDEX, CHARACTER_ENCODING
 
 todo_bp = Blueprint("todo", __name__)
 logger = logging.getLogger(__name__)
 
+# Resolves the query string of the index page, shared by all requests
+list_options_resolver = ListOptionsResolver()
+
+# Header carrying the CSRF token of requests without a form
+CSRF_HEADER = "X-CSRFToken"
+
+# Number of template output pieces sent per chunk when streaming
+STREAM_BUFFER_SIZE = 64
+
+def _stream_template(template_name: str, **context):
+    """
+    Render a template as a stream of chunks instead of one buffered string.
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return app.response_class(stream_with_context(stream), mimetype="text/html")
+
+def _etag(*parts) -> str:
+    """
+    Strong ETag from the template digest and the given version parts.
+    """
+    key = ":".join(str(part) for part in (current_app.template_digest, *parts))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def _with_validators(response: Response, etag: str, last_modified: datetime | None) -> Response:
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers and proxies may keep the page but have to revalidate it
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag: str, last_modified: datetime | None) -> Response | None:
+    """
+    Return a 304 response when the client already has this version.
+
+    If-None-Match takes precedence over If-Modified-Since, which only has
+    second precision.
+    """
+    if request.if_none_match:
+        # Weak comparison, compressed pages carry the ETag as a weak one
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return _with_validators(current_app.response_class(status=304), etag, last_modified)
+
+def _token_window() -> datetime | None:
+    """
+    Start of the current half of the CSRF token lifetime, None if tokens do
+    not expire. Pages embedding a token are reused within one window only,
+    so they never carry an expired token.
+    """
+    limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    if not limit:
+        return None
+    now = datetime.now(UTC).timestamp()
+    return datetime.fromtimestamp(now - now % (limit / 2), UTC)
+
 @todo_bp.get("/")
 def index():
-    # Filter/sort GET form (no CSRF)
-    list_options_form = ListOptionsForm(request.args)
-    invalid = False
+    # The page only depends on the stored todos and the query string, so a
+    # client holding the current version is answered before any work
+    data_version = current_app.todo_service.version()
+    # The bulk form carries a CSRF token bound to the session
+    csrf_session = session.get(current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token"), "")
+    # Due windows move on at midnight, and so does the page
+    today = today_ordinal()
+    midnight = datetime.combine(date.fromordinal(today), time(), UTC)
+    modified = max(data_version.modified, midnight) if data_version.modified else midnight
+    # The CSRF token of the bulk form expires, the page moves on twice as often
+    token_window = _token_window()
+    if token_window is not None:
+        modified = max(modified, token_window)
+    etag = _etag(data_version.version, today, token_window, request.query_string.decode(), csrf_session)
+    not_modified = _not_modified(etag, modified)
+    if not_modified is not None:
+        return not_modified
+    # Without a CSRF token yet the page creates one for this session, it
+    # cannot come from the cache
+    if csrf_session or not current_app.config["WTF_CSRF_ENABLED"]:
+        cached = cached_page(etag)
+        if cached is not None:
+            return cached
+
+    # Invalid filters fall back to the defaults, with a notice
+    with timed("form"):
+        list_options, valid = list_options_resolver.resolve(request.args)
+    invalid = not valid
+    # Names the profile of this request, if it gets profiled
+    g.list_options = list_options
 
-    if not list_options_form.validate():
-        invalid = True
-        list_options_form.set_defaults()
+    if current_app.config[KEY_STREAM_INDEX]:
+        # Header and filter form go out first, rows follow as they are read
+        page = current_app.todo_service.stream_filtered(list_options)
+        render = _stream_template
+    else:
+        with timed("query"):
+            page = current_app.todo_service.list_filtered(list_options)
+        render = render_template
 
-    todos = current_app.todo_service.list_filtered(list_options_form.to_model())
-    return render_template(
+    due_counts = current_app.todo_service.due_counts(list_options)
+    response = make_response(render(
         "index.html",
-        todos=todos,
-        list_options_form=list_options_form,
+        todos=page.items,
+        page=page,
+        due_counts=due_counts,
+        list_options=list_options,
+        # Only renders the filter widgets, the options are resolved above
+        list_options_form=ListOptionsForm.for_options(list_options),
+        bulk_form=BulkActionForm(),
         invalid=invalid,
-    )
+    ))
+    return _with_validators(response, etag, modified)
 
 @todo_bp.route("/add", methods=["GET", "POST"])
 def add():
@@ -34,11 +152,26 @@ def add():
 
 @todo_bp.get("/view/<int:todo_id>")
 def view(todo_id: int):
+    # Last-Modified comes from the collection, so it may be later than the
+    # last change of this todo, never earlier
+    data_version = current_app.todo_service.version()
+    try:
+        etag = _etag(todo_id, current_app.todo_service.todo_version(todo_id))
+    except KeyError:
+        abort(404)
+    not_modified = _not_modified(etag, data_version.modified)
+    if not_modified is not None:
+        return not_modified
+    cached = cached_page(etag)
+    if cached is not None:
+        return cached
+
     try:
         todo = current_app.todo_service.get(todo_id)
     except KeyError:
         abort(404)
-    return render_template("view.html", todo=todo)
+    response = make_response(render_template("view.html", todo=todo))
+    return _with_validators(response, etag, data_version.modified)
 
 @todo_bp.route("/update/<int:todo_id>", methods=["GET", "POST"])
 def update(todo_id: int):
@@ -54,27 +187,45 @@ def update(todo_id: int):
         todo_form.process(obj=todo)
 
     if todo_form.validate_on_submit():
-        current_app.todo_service.update(todo_form.to_model(todo_id))
+        try:
+            current_app.todo_service.update(todo_form.to_model(todo_id), todo_form.expected_version())
+        except KeyError:
+            abort(404)
+        except VersionConflict:
+            # Keep the submitted changes, show them next to the stored todo.
+            # Saving again overwrites the version shown.
+            current = _current(todo_id)
+            todo_form.version.data = current.version
+            return render_template("update.html", form=todo_form, todo=current, conflict=True), 409
         return redirect(url_for("todo.view", todo_id=todo_id))
 
     return render_template("update.html", form=todo_form, todo=todo)
 
-@todo_bp.get("/complete/<int:todo_id>")
-def complete(todo_id: int):
+def _current(todo_id: int):
     try:
-        current_app.todo_service.set_completed(todo_id, True)
+        return current_app.todo_service.get(todo_id)
     except KeyError:
         abort(404)
-    return redirect(url_for("todo.index"))
 
-@todo_bp.get("/incomplete/<int:todo_id>")
-def incomplete(todo_id: int):
+def _set_completed(todo_id: int, completed: bool):
+    # The links carry the version they were rendered at, links without one
+    # change whatever is stored
     try:
-        current_app.todo_service.set_completed(todo_id, False)
+        current_app.todo_service.set_completed(todo_id, completed, request.args.get("version", type=int))
     except KeyError:
         abort(404)
+    except VersionConflict:
+        return render_template("view.html", todo=_current(todo_id), conflict=True), 409
     return redirect(url_for("todo.index"))
 
+@todo_bp.get("/complete/<int:todo_id>")
+def complete(todo_id: int):
+    return _set_completed(todo_id, True)
+
+@todo_bp.get("/incomplete/<int:todo_id>")
+def incomplete(todo_id: int):
+    return _set_completed(todo_id, False)
+
 @todo_bp.get("/delete/<int:todo_id>")
 def delete(todo_id: int):
     try:
@@ -82,3 +233,90 @@ def delete(todo_id: int):
     except KeyError:
         abort(404)
     return redirect(url_for("todo.index"))
+
+# -------------------------
+# Bulk changes
+# -------------------------
+@todo_bp.route("/add/bulk", methods=["GET", "POST"])
+def add_bulk():
+    bulk_add_form = BulkAddForm()
+    if bulk_add_form.validate_on_submit():
+        current_app.todo_service.add_many(bulk_add_form.to_model())
+        return redirect(url_for("todo.index"))
+    return render_template("add_bulk.html", form=bulk_add_form)
+
+def _bulk_change(change: Callable[[list[int]], BulkResult]):
+    """
+    Apply a change to the todos selected with the bulk form.
+
+    Clients asking for JSON get the ids that were changed and the ones
+    that were not found, browsers are sent back to the list.
+    """
+    bulk_form = BulkActionForm()
+    if not bulk_form.validate_on_submit():
+        abort(400)
+
+    result = change(bulk_form.to_model())
+    if result.not_found:
+        logger.info("Bulk change skipped missing todos %s", result.not_found)
+    if request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json":
+        return asdict(result)
+    return redirect(url_for("todo.index"))
+
+@todo_bp.post("/bulk/complete")
+def complete_bulk():
+    return _bulk_change(lambda ids: current_app.todo_service.set_completed_many(ids, True))
+
+@todo_bp.post("/bulk/incomplete")
+def incomplete_bulk():
+    return _bulk_change(lambda ids: current_app.todo_service.set_completed_many(ids, False))
+
+@todo_bp.post("/bulk/delete")
+def delete_bulk():
+    return _bulk_change(current_app.todo_service.delete_many)
+
+# -------------------------
+# Import / export
+# -------------------------
+@todo_bp.get("/export")
+def export():
+    """
+    Stream all todos as NDJSON, or as CSV with ?format=csv.
+    """
+    fmt = request.args.get("format", FORMAT_NDJSON)
+    if fmt not in MEDIA_TYPES:
+        abort(400)
+    todos = current_app.todo_service.iter_all()
+    return Response(
+        export_todos(todos, fmt),
+        mimetype=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=todos.{fmt}"},
+    )
+
+@todo_bp.post("/import")
+def import_():
+    """
+    Add the todos of an NDJSON or CSV request body, told apart by its
+    Content-Type, and report what was imported and rejected.
+
+    Like the forms it needs a CSRF token of the session, sent in the
+    X-CSRFToken header, since the body leaves no room for one.
+    """
+    formats = {media_type: fmt for fmt, media_type in MEDIA_TYPES.items()}
+    fmt = formats.get(request.mimetype)
+    if fmt is None:
+        abort(415)
+    if current_app.config["WTF_CSRF_ENABLED"]:
+        try:
+            validate_csrf(request.headers.get(CSRF_HEADER))
+        except ValidationError:
+            abort(400)
+    # The body is read while it is imported, it is never held as a whole
+    stream = io.TextIOWrapper(request.stream, encoding=CHARACTER_ENCODING, newline="")
+    try:
+        result = import_todos(current_app.todo_service, stream, fmt)
+    except UnicodeDecodeError:
+        # The chunks before the bad bytes stay imported
+        abort(400)
+    logger.info("Imported %d todos, rejected %d records", result.imported, result.rejected)
+    return asdict(result)
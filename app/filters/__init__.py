@@ -1,8 +1,13 @@
 from flask import Flask
 from .datetime_filters import format_utc
+from .row_cache import RowCache, todo_row
+from app.constants import KEY_ROW_CACHE_BYTES
 
 def register_filters(app: Flask) -> None:
     """
-    Register all Jinja template filters.
+    Register all Jinja template filters and helpers.
     """
     app.add_template_filter(format_utc, name="format_utc")
+    # Rows of the index table are rendered once per todo version
+    app.row_cache = RowCache(app.config[KEY_ROW_CACHE_BYTES], app.logger)
+    app.add_template_global(todo_row, name="todo_row")
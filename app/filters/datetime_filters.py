@@ -1,11 +1,11 @@
 from datetime import datetime
 
-def format_utc(value: str) -> str:
+def format_utc(value: str | datetime | None) -> str:
     """
-    Format an ISO-8601 UTC datetime string into a user-friendly format.
+    Format a UTC datetime, or an ISO-8601 UTC datetime string, into a user-friendly format.
     """
     if not value:
         return ""
 
-    dt = datetime.fromisoformat(value)
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value)
     return dt.strftime("%B %d, %Y at %H:%M UTC")
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from logging import Logger
+from typing import Callable, Hashable
+from flask import current_app, request
+from markupsafe import Markup
+from ..models.todo import Todo
+
+# Template of one row of the index table
+ROW_TEMPLATE = "_todo_row.html"
+
+# Number of lookups between two hit rate reports in the log
+LOG_EVERY = 1000
+
+
+class RowCache:
+    """
+    LRU cache of rendered table rows.
+
+    An entry holds the fragment of one row together with the version of the
+    todo it was rendered from, so a changed todo misses and replaces its
+    entry while all other rows are reused. Entries are evicted least
+    recently used first once their total size exceeds max_bytes, counting a
+    character as a byte as rows are mostly ASCII. A max_bytes of 0 turns
+    the cache off.
+
+    Every LOG_EVERY lookups the hit rate of those lookups is logged.
+    """
+
+    def __init__(self, max_bytes: int, logger: Logger | None = None):
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self._lock = threading.Lock()
+        # key -> (version, fragment)
+        self._entries: OrderedDict[Hashable, tuple[int, str]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int, render: Callable[[], str]) -> str:
+        """
+        Return the cached fragment of key at version, or render and cache it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] == version
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._report()
+        if hit:
+            return entry[1]
+
+        # Rendered outside the lock, a row rendered twice at once is harmless
+        fragment = render()
+        if len(fragment) <= self.max_bytes:
+            with self._lock:
+                self._put(key, version, fragment)
+        return fragment
+
+    def _put(self, key: Hashable, version: int, fragment: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+        self._entries[key] = (version, fragment)
+        self.size += len(fragment)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _report(self) -> None:
+        lookups = self.hits + self.misses
+        if lookups < LOG_EVERY:
+            return
+        if self.logger is not None:
+            self.logger.info(
+                "Row cache: %.1f%% of %d rows reused, %d rows in %d bytes cached",
+                100 * self.hits / lookups, lookups, len(self._entries), self.size,
+            )
+        self.hits = self.misses = 0
+
+
+def todo_row(todo: Todo) -> Markup:
+    """
+    The rendered index table row of a todo, from the row cache of the app.
+    """
+    app = current_app._get_current_object()
+    hit = True
+
+    def render() -> str:
+        nonlocal hit
+        hit = False
+        return app.jinja_env.get_template(ROW_TEMPLATE).render(t=todo)
+
+    # The links in the row depend on where the app is mounted
+    fragment = app.row_cache.get((todo.id, request.script_root), todo.version, render)
+    app.metrics.inc("todo_row_cache_lookups_total", result="hit" if hit else "miss")
+    return Markup(fragment)
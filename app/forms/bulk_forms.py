@@ -0,0 +1,59 @@
+from .base_form import BaseForm
+from .todo_form import IsoDateField
+from wtforms import SelectMultipleField, TextAreaField
+from wtforms.validators import DataRequired, Optional, ValidationError
+from ..models.todo import Todo
+
+# Same limit as the title of a single todo
+TITLE_MAX_LENGTH = 200
+
+class BulkActionForm(BaseForm):
+    """POST form with the ids of the todos selected on the index page.
+
+    Its CSRF token expires like any other. The index page is only reused
+    within the first half of a token's lifetime (see the index view).
+    """
+
+    # Checkboxes rendered per row, any id is accepted
+    ids = SelectMultipleField("Selected", coerce=int, validate_choice=False, validators=[Optional()])
+
+    def to_model(self) -> list[int]:
+        """
+        Return the selected ids.
+
+        Must be called only after validate()/validate_on_submit().
+        """
+        self.require_valid()
+        return list(self.ids.data or [])
+
+class BulkAddForm(BaseForm):
+    """Form adding one todo per line of text, all with the same due date."""
+
+    titles = TextAreaField(
+        "Titles (one per line)",
+        validators=[DataRequired(message="At least one title is required.")],
+    )
+    dueDate = IsoDateField(
+        "Due Date",
+        format="%Y-%m-%d",
+        validators=[Optional()],
+    )
+
+    def validate_titles(self, field):
+        for title in self._titles():
+            if len(title) > TITLE_MAX_LENGTH:
+                raise ValidationError(f"Each title must be at most {TITLE_MAX_LENGTH} characters long.")
+
+    def _titles(self) -> list[str]:
+        return [line.strip() for line in (self.titles.data or "").splitlines() if line.strip()]
+
+    def to_model(self) -> list[Todo]:
+        """
+        Create Todo models from validated form data.
+
+        Must be called only after validate()/validate_on_submit().
+        """
+        self.require_valid()
+
+        due_date = self.dueDate.data.isoformat() if self.dueDate.data else None
+        return [Todo(id=0, title=title, dueDate=due_date) for title in self._titles()]
@@ -1,7 +1,10 @@
 from .base_form import BaseForm
-from wtforms import SelectField
-from wtforms.validators import AnyOf, Optional
-from ..models.list_options import ListOptions, KEY_ALL, KEY_PENDING, KEY_COMPLETED, KEY_CREATED_AT, KEY_DUE_DATE, KEY_TITLE, KEY_ASC, KEY_DESC
+from wtforms import SelectField, StringField
+from wtforms.validators import AnyOf, Length, Optional, ValidationError
+from ..models.list_options import ListOptions, Status, SortKey, Order, Cursor, DueWindow, PAGE_SIZES, DEFAULT_PAGE_SIZE, KEY_ALL, KEY_PENDING, KEY_COMPLETED, KEY_CREATED_AT, KEY_DUE_DATE, KEY_TITLE, KEY_ASC, KEY_DESC, KEY_ANY_DUE, KEY_OVERDUE, KEY_DUE_TODAY, KEY_UPCOMING, KEY_NO_DUE_DATE
+
+# Longest search query accepted
+QUERY_MAX_LENGTH = 200
 
 class ListOptionsForm(BaseForm):
     """GET form for filtering/sorting on the index page.
@@ -23,6 +26,19 @@ class ListOptionsForm(BaseForm):
         validators=[Optional(), AnyOf([KEY_ALL, KEY_PENDING, KEY_COMPLETED])],
     )
 
+    due = SelectField(
+        "Due",
+        choices=[
+            (KEY_ANY_DUE, "Any time"),
+            (KEY_OVERDUE, "Overdue"),
+            (KEY_DUE_TODAY, "Today"),
+            (KEY_UPCOMING, "Next 7 days"),
+            (KEY_NO_DUE_DATE, "No due date"),
+        ],
+        default=KEY_ANY_DUE,
+        validators=[Optional(), AnyOf([KEY_ANY_DUE, KEY_OVERDUE, KEY_DUE_TODAY, KEY_UPCOMING, KEY_NO_DUE_DATE])],
+    )
+
     sort = SelectField(
         "Sort by",
         choices=[
@@ -44,11 +60,53 @@ class ListOptionsForm(BaseForm):
         validators=[Optional(), AnyOf([KEY_ASC, KEY_DESC])],
     )
 
+    page_size = SelectField(
+        "Per page",
+        choices=[(size, str(size)) for size in PAGE_SIZES],
+        coerce=int,
+        default=DEFAULT_PAGE_SIZE,
+        validators=[Optional(), AnyOf(PAGE_SIZES)],
+    )
+
+    # Opaque keyset cursor of the requested page, set by the pager links
+    cursor = StringField("Cursor", validators=[Optional()])
+
+    q = StringField("Search", validators=[Optional(), Length(max=QUERY_MAX_LENGTH)])
+
+    def validate_cursor(self, field):
+        try:
+            Cursor.decode(field.data)
+        except ValueError:
+            raise ValidationError("Invalid page cursor.")
+
+    @classmethod
+    def for_options(cls, list_options: ListOptions) -> "ListOptionsForm":
+        """
+        A form showing list options that were already resolved, to render
+        the filter widgets. Reads no request data and is not validated.
+        """
+        return cls(
+            formdata=None,
+            status=list_options.status.value,
+            due=list_options.due.value,
+            sort=list_options.sort.value,
+            order=list_options.order.value,
+            page_size=list_options.page_size,
+            cursor=list_options.cursor,
+            q=list_options.query,
+        )
+
     def set_defaults(self):
         """ Sets the form fields to default values """
-        self.status=KEY_ALL
-        self.sort=KEY_CREATED_AT
-        self.order=KEY_DESC
+        self.status.data=KEY_ALL
+        self.due.data=KEY_ANY_DUE
+        self.sort.data=KEY_CREATED_AT
+        self.order.data=KEY_DESC
+        self.page_size.data=DEFAULT_PAGE_SIZE
+        self.cursor.data=None
+        self.q.data=None
+        # The defaults are always a valid combination
+        self._is_valid = True
 
     def to_model(self) -> ListOptions:
         """
@@ -59,7 +117,11 @@ class ListOptionsForm(BaseForm):
         self.require_valid()
 
         return ListOptions(
-            status=self.status.data.strip().lower(),
-            sort=self.sort.data.strip().lower(),
-            order=self.order.data.strip().lower(),
+            status=Status(self.status.data.strip() or KEY_ALL),
+            sort=SortKey(self.sort.data.strip() or KEY_CREATED_AT),
+            order=Order(self.order.data.strip() or KEY_DESC),
+            page_size=self.page_size.data or DEFAULT_PAGE_SIZE,
+            cursor=(self.cursor.data or "").strip() or None,
+            query=(self.q.data or "").strip() or None,
+            due=DueWindow(self.due.data.strip() or KEY_ANY_DUE),
         )
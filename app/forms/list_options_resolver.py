@@ -0,0 +1,87 @@
+from dataclasses import replace
+from enum import StrEnum
+from itertools import product
+from typing import Mapping
+from ..models.list_options import ListOptions, Status, SortKey, Order, Cursor, DueWindow, PAGE_SIZES, DEFAULT_PAGE_SIZE
+from .list_options_form import QUERY_MAX_LENGTH
+
+
+class ListOptionsResolver:
+    """
+    Turns the query string of the index page into ListOptions without
+    building a ListOptionsForm, which is only needed to render the filter
+    widgets.
+
+    Accepts exactly what ListOptionsForm validation accepts: blank
+    parameters take their default, choices must match an allowed value,
+    page_size is parsed with int() like the form coerces it, and cursor and
+    q are checked the same way. Any invalid parameter resolves to the
+    options of ListOptionsForm.set_defaults().
+
+    Without cursor and query there are only a few hundred distinct options.
+    They are built once and shared, so most requests allocate none.
+    """
+
+    def __init__(self):
+        self._interned: dict[tuple, ListOptions] = {
+            (status, due, sort, order, page_size): ListOptions(
+                status=status, sort=sort, order=order, page_size=page_size, due=due,
+            )
+            for status, due, sort, order, page_size in product(Status, DueWindow, SortKey, Order, PAGE_SIZES)
+        }
+        self.default = self._interned[(Status.ALL, DueWindow.ANY, SortKey.CREATED_AT, Order.DESC, DEFAULT_PAGE_SIZE)]
+
+    @staticmethod
+    def _choice(args: Mapping[str, str], name: str, choices: type[StrEnum], default: StrEnum) -> StrEnum:
+        value = args.get(name)
+        if value is None or not value.strip():
+            return default
+        # Raises ValueError for anything but an exact value
+        return choices(value)
+
+    @staticmethod
+    def _page_size(value: str | None) -> int:
+        if value is None or not value.strip():
+            return DEFAULT_PAGE_SIZE
+        page_size = int(value)
+        if page_size not in PAGE_SIZES:
+            raise ValueError(f"Invalid page size: {page_size}")
+        return page_size
+
+    @staticmethod
+    def _cursor(value: str | None) -> str | None:
+        if value is None or not value.strip():
+            return None
+        Cursor.decode(value)
+        return value.strip()
+
+    @staticmethod
+    def _query(value: str | None) -> str | None:
+        if value is None or not value.strip():
+            return None
+        if len(value) > QUERY_MAX_LENGTH:
+            raise ValueError("Search too long")
+        return value.strip()
+
+    def resolve(self, args: Mapping[str, str]) -> tuple[ListOptions, bool]:
+        """
+        Return the list options of the query string args, and whether they
+        were valid.
+        """
+        try:
+            key = (
+                self._choice(args, "status", Status, Status.ALL),
+                self._choice(args, "due", DueWindow, DueWindow.ANY),
+                self._choice(args, "sort", SortKey, SortKey.CREATED_AT),
+                self._choice(args, "order", Order, Order.DESC),
+                self._page_size(args.get("page_size")),
+            )
+            cursor = self._cursor(args.get("cursor"))
+            query = self._query(args.get("q"))
+        except ValueError:
+            return self.default, False
+
+        options = self._interned[key]
+        if cursor is not None or query is not None:
+            options = replace(options, cursor=cursor, query=query)
+        return options, True
@@ -1,7 +1,7 @@
 from .base_form import BaseForm
 from datetime import datetime, date
-from wtforms import StringField, TextAreaField, DateField
-from wtforms.validators import DataRequired, Optional, Length
+from wtforms import StringField, TextAreaField, DateField, HiddenField
+from wtforms.validators import DataRequired, Optional, Length, Regexp
 from ..models.todo import Todo
 import logging
 
@@ -29,6 +29,15 @@ class TodoForm(BaseForm):
         format="%Y-%m-%d",
         validators=[Optional()],
     )
+    # Version of the todo the form was filled from, sent back with the
+    # changes so they are not saved over a newer version
+    version = HiddenField(validators=[Optional(), Regexp(r"^\d+$")])
+
+    def expected_version(self) -> int | None:
+        """
+        The version the changes were made at, None if the form has none.
+        """
+        return int(self.version.data) if self.version.data not in (None, "") else None
 
     def to_model(self, todo_id: int | None = None) -> Todo:
         """
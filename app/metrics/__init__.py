@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from flask import Flask, Response, current_app, g, has_app_context, has_request_context, request, before_render_template, template_rendered
+from .registry import MetricsRegistry
+from app.constants import KEY_METRICS_DIR
+
+
+def registry() -> MetricsRegistry | None:
+    """
+    Metrics of the current app, None outside of an app context, where a
+    repository used on its own has nothing to report to.
+    """
+    return current_app.metrics if has_app_context() else None
+
+
+def _add_server_timing(phase: str, seconds: float) -> None:
+    if has_request_context():
+        timings = g.setdefault("server_timing", {})
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Time a phase of the current request, for its Server-Timing header and
+    the phase latency histogram.
+    """
+    metrics = registry()
+    if metrics is None:
+        yield
+        return
+    with metrics.timed("todo_phase_duration_seconds", lambda seconds: _add_server_timing(phase, seconds), phase=phase):
+        yield
+
+
+def count(name: str, value: float = 1) -> None:
+    metrics = registry()
+    if metrics is not None:
+        metrics.inc(name, value)
+
+
+def register_metrics(app: Flask) -> None:
+    """
+    Time every request and its phases and serve the totals on /metrics.
+    Each app has a registry of its own, in app.metrics.
+    """
+    from ..controllers.metrics_controller import metrics_bp
+
+    app.metrics = metrics = MetricsRegistry(app.config[KEY_METRICS_DIR])
+
+    @app.before_request
+    def start_timer() -> None:
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response: Response) -> Response:
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        # For streamed responses this is the time until the body starts
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "unknown"
+        metrics.inc("todo_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.observe("todo_request_duration_seconds", elapsed, endpoint=endpoint)
+
+        timings = {**g.pop("server_timing", {}), "total": elapsed}
+        response.headers["Server-Timing"] = ", ".join(
+            f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in timings.items()
+        )
+        metrics.sync()
+        return response
+
+    def start_render(sender, template, context, **extra) -> None:
+        g.render_started = time.perf_counter()
+
+    def end_render(sender, template, context, **extra) -> None:
+        started = g.pop("render_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            metrics.observe("todo_phase_duration_seconds", elapsed, phase="render")
+            _add_server_timing("render", elapsed)
+
+    # Signals hold weak references, the local functions would be dropped
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
+
+    app.register_blueprint(metrics_bp)
@@ -0,0 +1,142 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from flask import Flask, current_app, g, request
+from app.constants import KEY_PROFILE_DIR, KEY_PROFILE_SLOW_MS, KEY_PROFILE_SAMPLE_PERCENT, KEY_PROFILE_INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.=+-]+")
+
+
+def _collapse(frame: FrameType) -> str:
+    """
+    Render a stack as one line of the collapsed format, outermost call first.
+    """
+    calls = []
+    while frame is not None:
+        code = frame.f_code
+        calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(calls))
+
+
+class StackSampler:
+    """
+    Samples the stacks of the threads serving requests from one background
+    thread, so the requests themselves run at full speed.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Thread id -> collapsed stack counts of the request it is serving
+        self._active: dict[int, Counter] = {}
+        self._pid: int | None = None
+
+    def start(self, thread_id: int) -> Counter:
+        # Threads do not survive a fork, start one per worker process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="stack-sampler", daemon=True).start()
+        stacks = Counter()
+        with self._lock:
+            self._active[thread_id] = stacks
+        return stacks
+
+    def stop(self, thread_id: int) -> None:
+        with self._lock:
+            self._active.pop(thread_id, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+def register_profiling(app: Flask) -> None:
+    """
+    Profile slow or sampled requests when PROFILE_DIR is set.
+
+    Requests slower than PROFILE_SLOW_MS get their sampled stacks written as
+    a .collapsed file (input of flame graph tools). PROFILE_SAMPLE_PERCENT
+    of the requests run under cProfile and are written as .pstats files.
+    Without PROFILE_DIR no hooks are installed at all.
+    """
+    if not app.config[KEY_PROFILE_DIR]:
+        return
+
+    directory = Path(app.config[KEY_PROFILE_DIR])
+    directory.mkdir(parents=True, exist_ok=True)
+    slow_ms = app.config[KEY_PROFILE_SLOW_MS]
+    sample_percent = app.config[KEY_PROFILE_SAMPLE_PERCENT]
+    sampler = StackSampler(app.config[KEY_PROFILE_INTERVAL_MS] / 1000) if slow_ms > 0 else None
+
+    @app.before_request
+    def start_profiling() -> None:
+        g.profile_started = time.perf_counter()
+        if sampler is not None:
+            g.profile_stacks = sampler.start(threading.get_ident())
+        if sample_percent > 0 and random.random() * 100 < sample_percent:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    # Teardown runs after a streamed body was sent, so it covers all of it
+    @app.teardown_request
+    def finish_profiling(exc: BaseException | None) -> None:
+        started = g.pop("profile_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+        stacks = None
+        if sampler is not None:
+            sampler.stop(threading.get_ident())
+            stacks = g.pop("profile_stacks", None)
+
+        if profiler is None and not (stacks and elapsed_ms >= slow_ms):
+            return
+        try:
+            name = _profile_name(elapsed_ms)
+            if profiler is not None:
+                profiler.dump_stats(directory / f"{name}.pstats")
+            if stacks and elapsed_ms >= slow_ms:
+                lines = (f"{stack} {samples}\n" for stack, samples in stacks.items())
+                (directory / f"{name}.collapsed").write_text("".join(lines))
+        except OSError:
+            logger.exception("Could not write the profile of %s", request.path)
+
+
+def _profile_name(elapsed_ms: float) -> str:
+    """
+    File name of a profile: time, worker, route, list options, number of
+    stored items and duration. Archived items are left out, counting them
+    would read the archive file.
+    """
+    parts = [time.strftime("%Y%m%dT%H%M%S"), str(os.getpid()), request.endpoint or "unknown"]
+    list_options = g.get("list_options")
+    if list_options is not None:
+        parts.append(f"{list_options.status}-{list_options.sort}-{list_options.order}-{list_options.page_size}")
+        if list_options.query:
+            parts.append(f"q={list_options.query}")
+    parts.append(f"{current_app.todo_service.count_unarchived()}items")
+    parts.append(f"{elapsed_ms:.0f}ms")
+    return _UNSAFE.sub("_", "-".join(parts))[:200]
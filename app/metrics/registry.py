@@ -0,0 +1,239 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+from app.constants import CHARACTER_ENCODING
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help) of every metric that is exported
+METRICS = {
+    "todo_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "todo_request_duration_seconds": ("histogram", "HTTP request latency by endpoint."),
+    "todo_phase_duration_seconds": ("histogram", "Time spent in request phases (load, form, query, render)."),
+    "todo_file_loads_total": ("counter", "Full loads of the data file."),
+    "todo_bytes_read_total": ("counter", "Bytes read from the data file and the journal."),
+    "todo_bytes_written_total": ("counter", "Bytes written to the data, meta and journal files."),
+    "todo_commits_total": ("counter", "Commits of changes to the storage."),
+    "todo_committed_changes_total": ("counter", "Changes carried by the commits, several per commit when grouped."),
+    "todo_fsyncs_total": ("counter", "Commits flushed to disk with fsync."),
+    "todo_archived_total": ("counter", "Completed todos moved from the data file to the archive file."),
+    "todo_compressed_responses_total": ("counter", "HTML responses sent compressed, by encoding and whether the compressed page was cached."),
+    "todo_compressed_bytes_saved_total": ("counter", "Bytes saved by compressing HTML responses."),
+    "todo_row_cache_lookups_total": ("counter", "Lookups of index table rows in the row cache, by result."),
+    "todo_items_scanned_total": ("counter", "Items walked to build list pages."),
+}
+
+# Files of other workers not written for this many seconds are left out of
+# the totals, their worker is gone or cannot be told from one that is
+STALE_AFTER_SECONDS = 24 * 60 * 60
+
+# Metric name plus sorted (label, value) pairs
+Key = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms of one worker process.
+
+    With a directory set, the values are also written to a file of their own
+    in it every sync_interval seconds, and export() adds up the files of all
+    workers sharing the directory, so every worker reports the totals. The
+    file is removed when the process exits. Files of processes that are no
+    longer running are removed by the next export, files not written for
+    stale_after seconds are left out.
+    """
+
+    def __init__(self, directory: str | None = None, sync_interval: float = 1.0, stale_after: float = STALE_AFTER_SECONDS):
+        self._lock = threading.Lock()
+        self._counters: dict[Key, float] = {}
+        # Per-bucket (not cumulative) counts, then the sum and the count
+        self._histograms: dict[Key, list[float]] = {}
+        self.sync_interval = sync_interval
+        self.stale_after = stale_after
+        self._synced = 0.0
+        self._file: Path | None = None
+        self.directory = directory
+
+    @property
+    def directory(self) -> Path | None:
+        return self._directory
+
+    @directory.setter
+    def directory(self, directory: str | None) -> None:
+        self.close()
+        self._directory = Path(directory) if directory else None
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(BUCKETS) + 3)
+            values[bisect_left(BUCKETS, seconds)] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    # -------------------------
+    # Sharing between workers
+    # -------------------------
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def sync(self, force: bool = False) -> None:
+        """
+        Write the values of this worker to its file in the shared directory,
+        at most once per sync_interval unless forced.
+        """
+        if self._directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced < self.sync_interval:
+            return
+        self._synced = now
+        if self._file is None:
+            # The start time keeps a restarted worker with a reused pid from
+            # overwriting the totals of its predecessor
+            self._file = self._directory / f"metrics-{os.getpid()}-{time.time_ns()}.json"
+            atexit.register(self.close)
+        tmp_path = self._file.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._snapshot()), encoding=CHARACTER_ENCODING)
+        os.replace(tmp_path, self._file)
+
+    def close(self) -> None:
+        """
+        Remove the file of this worker, its values leave the totals.
+        """
+        if self._file is None:
+            return
+        atexit.unregister(self.close)
+        self._file.unlink(missing_ok=True)
+        self._file = None
+
+    def _snapshots(self) -> Iterator[dict]:
+        yield self._snapshot()
+        if self._directory is None:
+            return
+        now = time.time()
+        for path in self._directory.glob("metrics-*.json"):
+            if path == self._file:
+                continue
+            if not _running(path):
+                # Its process died without removing it
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                if now - path.stat().st_mtime > self.stale_after:
+                    continue
+                yield json.loads(path.read_text(encoding=CHARACTER_ENCODING))
+            except (FileNotFoundError, ValueError):
+                continue
+
+    # -------------------------
+    # Export
+    # -------------------------
+    def export(self) -> str:
+        """
+        Render the totals of all workers in the Prometheus text format.
+        """
+        counters: dict[Key, float] = {}
+        histograms: dict[Key, list[float]] = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot["counters"]:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = _key(name, labels)
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            else:
+                for (key_name, labels), values in sorted(histograms.items()):
+                    if key_name == name:
+                        lines.extend(_histogram_lines(name, labels, values))
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def timed(self, name: str, record: Callable[[float], None] | None = None, **labels) -> Iterator[None]:
+        """
+        Observe the duration of the with block in the histogram name, and
+        pass it to record if given.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(name, elapsed, **labels)
+            if record is not None:
+                record(elapsed)
+
+
+def _running(path: Path) -> bool:
+    """
+    Whether the process named in a metrics file name may still be running.
+    """
+    try:
+        pid = int(path.name.split("-")[1])
+    except (IndexError, ValueError):
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        pass
+    return True
+
+
+def _labels(labels: tuple[tuple[str, str], ...], *extra: tuple[str, str]) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _histogram_lines(name: str, labels: tuple, values: list[float]) -> Iterator[str]:
+    cumulative = 0
+    for bound, count in zip((*BUCKETS, float("inf")), values):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        yield f"{name}_bucket{_labels(labels, ('le', le))} {_number(cumulative)}"
+    yield f"{name}_sum{_labels(labels)} {_number(values[-2])}"
+    yield f"{name}_count{_labels(labels)} {_number(values[-1])}"
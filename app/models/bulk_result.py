@@ -0,0 +1,10 @@
+from dataclasses import dataclass, field
+
+@dataclass
+class BulkResult:
+    """
+    Outcome of a bulk change: the ids that were changed and the ids that
+    were not found, each in request order.
+    """
+    succeeded: list[int] = field(default_factory=list)
+    not_found: list[int] = field(default_factory=list)
@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+@dataclass(frozen=True)
+class DataVersion:
+    """
+    Version of the stored collection.
+
+    version increases with every change, modified is the time of the last
+    change (None while nothing was stored yet).
+    """
+    version: int = 0
+    modified: datetime | None = None
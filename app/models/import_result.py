@@ -0,0 +1,21 @@
+from dataclasses import dataclass, field
+
+@dataclass
+class RejectedRecord:
+    """
+    A record that was not imported: its line number and why.
+    """
+    line: int
+    error: str
+
+
+@dataclass
+class ImportResult:
+    """
+    Outcome of an import: the number of todos that were added and of the
+    records that were rejected. errors describes the first rejected records
+    only, so the result stays small however bad the input is.
+    """
+    imported: int = 0
+    rejected: int = 0
+    errors: list[RejectedRecord] = field(default_factory=list)
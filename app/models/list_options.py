@@ -1,4 +1,7 @@
+import base64
+import json
 from dataclasses import dataclass
+from datetime import datetime, UTC
 from enum import StrEnum
 
 KEY_ALL="all"
@@ -9,6 +12,16 @@ KEY_DUE_DATE="dueDate"
 KEY_TITLE="title"
 KEY_ASC="asc"
 KEY_DESC="desc"
+KEY_ANY_DUE="any"
+KEY_OVERDUE="overdue"
+KEY_DUE_TODAY="today"
+KEY_UPCOMING="upcoming"
+KEY_NO_DUE_DATE="none"
+
+PAGE_SIZES=(10, 25, 50, 100)
+DEFAULT_PAGE_SIZE=50
+# Days after today covered by DueWindow.UPCOMING
+UPCOMING_DAYS=7
 
 class Status(StrEnum):
     ALL = KEY_ALL
@@ -27,8 +40,102 @@ class Order(StrEnum):
     DESC = KEY_DESC
 
 
+class DueWindow(StrEnum):
+    ANY = KEY_ANY_DUE
+    OVERDUE = KEY_OVERDUE
+    TODAY = KEY_DUE_TODAY
+    UPCOMING = KEY_UPCOMING
+    NONE = KEY_NO_DUE_DATE
+
+
+# (first, end) date ordinals of a due window, None where it is open. The
+# window of items without a due date has no range.
+DueRange = tuple[int | None, int | None]
+
+def today_ordinal() -> int:
+    """
+    The ordinal of the current UTC date, which due windows are relative to.
+    """
+    return datetime.now(UTC).date().toordinal()
+
+def due_range(window: DueWindow, today: int) -> DueRange | None:
+    """
+    The due dates of a window, None for DueWindow.ANY and DueWindow.NONE.
+    Windows are computed from today on every call, so they move on at
+    midnight without touching the stored items.
+    """
+    return {
+        DueWindow.OVERDUE: (None, today),
+        DueWindow.TODAY: (today, today + 1),
+        DueWindow.UPCOMING: (today + 1, today + 1 + UPCOMING_DAYS),
+    }.get(window)
+
+
+# Type of the sort values in each segment of a listing, in every storage
+# mode: creation times as epoch microseconds, due dates as date ordinals
+# (0 in the segment without a due date) and titles as their case-folded
+# string
+SORT_VALUE_TYPES: dict[SortKey, tuple[type, ...]] = {
+    SortKey.CREATED_AT: (int,),
+    SortKey.DUE_DATE: (int, int),
+    SortKey.TITLE: (str,),
+}
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """
+    Keyset position of a page boundary in a sorted listing.
+
+    Holds the sort key value and id of the boundary item, so the next page
+    is found with a binary search instead of skipping an offset. A "before"
+    cursor selects the items preceding the boundary (the previous page).
+    """
+    sort: SortKey
+    segment: int
+    value: str | int
+    id: int
+    before: bool = False
+
+    def encode(self) -> str:
+        """
+        Encode the cursor as an opaque URL-safe token.
+        """
+        raw = json.dumps(
+            [str(self.sort), self.segment, self.value, self.id, int(self.before)],
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        """
+        Decode a token produced by encode(). Raises ValueError if it is
+        malformed, or if its segment or value do not fit its sort key.
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            sort, segment, value, todo_id, before = json.loads(raw)
+            types = SORT_VALUE_TYPES[SortKey(sort)]
+            # bool is an int too, but never a sort value
+            if not (type(segment) is int and 0 <= segment < len(types) and type(todo_id) is int):
+                raise ValueError("unexpected cursor field types")
+            if type(value) is not types[segment]:
+                raise ValueError("cursor value does not fit the sort key")
+            return cls(SortKey(sort), segment, value, todo_id, bool(before))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {token}") from e
+
+
 @dataclass(frozen=True)
 class ListOptions:
     status: Status = Status.ALL
     sort: SortKey = SortKey.CREATED_AT
     order: Order = Order.DESC
+    page_size: int = DEFAULT_PAGE_SIZE
+    # Opaque Cursor token of the page to show, None for the first page
+    cursor: str | None = None
+    # Search words, each matched as a word prefix in titles and descriptions
+    query: str | None = None
+    # Due date window the items are restricted to
+    due: DueWindow = DueWindow.ANY
@@ -1,19 +1,176 @@
-from dataclasses import dataclass, asdict
-from datetime import datetime, UTC
+from datetime import date, datetime, timedelta, UTC
 from typing import Optional
 
-@dataclass
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+MICROSECOND = timedelta(microseconds=1)
+
+def iso_to_epoch_us(value: str) -> int:
+    """
+    Convert an ISO-8601 datetime string to microseconds since the epoch.
+    Datetimes without a time zone are taken as UTC.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return (dt - EPOCH) // MICROSECOND
+
+def epoch_us_to_datetime(value: int) -> datetime:
+    return EPOCH + value * MICROSECOND
+
+def epoch_us_now() -> int:
+    return (datetime.now(UTC) - EPOCH) // MICROSECOND
+
+
 class Todo:
-    id: int
-    title: str
-    description: Optional[str] = None
-    dueDate: Optional[str] = None
-    isCompleted: bool = False
-    createdAt: str | None = None
+    """
+    A to-do item.
+
+    Slotted, so instances carry no per-instance __dict__. Dates are kept in
+    compact pre-parsed form (created time as epoch microseconds, due date as
+    a date ordinal) together with the case-folded title, which makes them
+    ready-made sort keys. The ISO string attributes and to_dict() keep the
+    JSON shape of the data file.
+
+    version starts at 1 and is increased by the storage on every change.
+
+    completedAt is when the storage last saw the todo completed, None while
+    it is pending or when the storage does not record it. It is not part of
+    to_dict(), the storage keeps it next to the other fields.
+
+    Listings return summaries, todos whose description was left in the
+    storage. Their description is None and detailsAt tells the storage where
+    to find it. Setting the description clears detailsAt.
+    """
+
+    __slots__ = (
+        "id", "_title", "titleKey", "_description", "detailsAt",
+        "dueDateOrdinal", "isCompleted", "createdAtUs", "version",
+        "completedAtUs",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        title: str,
+        description: Optional[str] = None,
+        dueDate: Optional[str] = None,
+        isCompleted: bool = False,
+        createdAt: str | None = None,
+        version: int = 1,
+        completedAt: str | None = None,
+    ):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.dueDate = dueDate
+        self.isCompleted = isCompleted
+        self.createdAt = createdAt
+        self.version = version
+        self.completedAt = completedAt
+
+    @classmethod
+    def from_fields(
+        cls,
+        id: int,
+        title: str,
+        titleKey: str,
+        description: Optional[str],
+        dueDateOrdinal: int | None,
+        isCompleted: bool,
+        createdAtUs: int,
+        version: int,
+    ) -> "Todo":
+        """
+        Build a todo from its pre-parsed fields, skipping the parsing of the
+        ISO strings.
+        """
+        todo = cls.__new__(cls)
+        todo.id = id
+        todo._title = title
+        todo.titleKey = titleKey
+        todo._description = description
+        todo.detailsAt = None
+        todo.dueDateOrdinal = dueDateOrdinal
+        todo.isCompleted = isCompleted
+        todo.createdAtUs = createdAtUs
+        todo.version = version
+        todo.completedAtUs = None
+        return todo
 
-    def __post_init__(self):
-        if self.createdAt is None:
-            self.createdAt = datetime.now(UTC).isoformat()
+    @property
+    def title(self) -> str:
+        return self._title
+
+    @title.setter
+    def title(self, value: str) -> None:
+        self._title = value
+        key = (value or "").casefold()
+        # Most titles are already case-folded, share the string then
+        self.titleKey = value if key == value else key
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._description
+
+    @description.setter
+    def description(self, value: Optional[str]) -> None:
+        self._description = value
+        self.detailsAt = None
+
+    @property
+    def dueDate(self) -> Optional[str]:
+        if self.dueDateOrdinal is None:
+            return None
+        return date.fromordinal(self.dueDateOrdinal).isoformat()
+
+    @dueDate.setter
+    def dueDate(self, value: Optional[str]) -> None:
+        if value:
+            self.dueDateOrdinal = date.fromisoformat(value).toordinal()
+        else:
+            self.dueDateOrdinal = None
+
+    @property
+    def createdAt(self) -> str:
+        return self.createdAtUtc.isoformat()
+
+    @createdAt.setter
+    def createdAt(self, value: str | None) -> None:
+        if value:
+            self.createdAtUs = iso_to_epoch_us(value)
+        else:
+            self.createdAtUs = epoch_us_now()
+
+    @property
+    def createdAtUtc(self) -> datetime:
+        return epoch_us_to_datetime(self.createdAtUs)
+
+    @property
+    def completedAt(self) -> str | None:
+        if self.completedAtUs is None:
+            return None
+        return epoch_us_to_datetime(self.completedAtUs).isoformat()
+
+    @completedAt.setter
+    def completedAt(self, value: str | None) -> None:
+        self.completedAtUs = iso_to_epoch_us(value) if value else None
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "dueDate": self.dueDate,
+            "isCompleted": self.isCompleted,
+            "createdAt": self.createdAt,
+            "version": self.version,
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Todo):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.to_dict().items())
+        return f"Todo({fields})"
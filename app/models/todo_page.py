@@ -0,0 +1,15 @@
+from dataclasses import dataclass, field
+from typing import Iterable
+from .todo import Todo
+
+@dataclass
+class TodoPage:
+    """
+    One page of a listing plus the cursor tokens of its neighbour pages.
+
+    items is a list, except for streamed pages where it is an iterator and
+    the cursors are set once it is exhausted.
+    """
+    items: Iterable[Todo] = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
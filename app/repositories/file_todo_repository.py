@@ -0,0 +1,1007 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, TextIO, TypeVar
+from pathlib import Path
+from ..models.bulk_result import BulkResult
+from ..models.data_version import DataVersion
+from ..models.todo import Todo, epoch_us_now
+from ..models.todo_page import TodoPage
+from ..models.list_options import Status, SortKey, Order, Cursor, DueWindow, today_ordinal
+from ..metrics import count, timed
+from .file_lock import LOCK_SUFFIX, file_lock
+from .group_commit import FsyncSchedule, GroupCommit, PendingChange, fsync_directory
+from .todo_collection import TodoCollection
+from .todo_repository import ITER_CHUNK_SIZE, TodoRepository, check_version
+from app.constants import CHARACTER_ENCODING, STORAGE_MODE_JSON, STORAGE_MODE_JOURNAL, FSYNC_NEVER
+
+logger = logging.getLogger(__name__)
+
+# (inode, size, mtime_ns) of a file, or None when the file does not exist
+FileStamp = tuple[int, int, int] | None
+
+JOURNAL_SUFFIX = ".journal"
+META_SUFFIX = ".meta"
+DETAILS_SUFFIX = ".details"
+ARCHIVE_SUFFIX = ".archive"
+# Generation in detailsAt of the descriptions of archived todos, which are
+# kept in a details file of the archive's own
+ARCHIVE_GENERATION = 0
+# A details file is rewritten once it holds more than twice the bytes of
+# the descriptions still in use, and at least this many
+DETAILS_COMPACT_MIN_BYTES = 64 * 1024
+
+OP_ADD = "add"
+OP_UPDATE = "update"
+OP_COMPLETE = "complete"
+OP_DELETE = "delete"
+# An archived todo moved back, added like OP_ADD
+OP_UNARCHIVE = "unarchive"
+# Records of the archive file
+OP_ARCHIVE = "archive"
+OP_RESTORE = "restore"
+
+DAY_US = 24 * 60 * 60 * 1_000_000
+
+Result = TypeVar("Result")
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _unarchived_ids(records: Iterable[dict]) -> list[int]:
+    """
+    Ids of the todos that journal records move back from the archive.
+    """
+    return [record["todo"]["id"] for record in records if record["op"] == OP_UNARCHIVE]
+
+
+def _entry(todo: Todo, description: str | None) -> dict:
+    """
+    The stored fields of a todo, with the given description.
+    """
+    item = todo.to_dict()
+    item["description"] = description
+    if todo.completedAtUs is not None:
+        item["completedAt"] = todo.completedAt
+    return item
+
+
+def _summary(todo: Todo) -> dict:
+    """
+    The data file entry of a todo, which leaves the description to the
+    details file.
+    """
+    item = _entry(todo, None)
+    del item["description"]
+    if todo.detailsAt is not None:
+        item["detailsAt"] = list(todo.detailsAt)
+    return item
+
+
+def _write_items(f: TextIO, todos: Iterable[Todo]) -> None:
+    """
+    Write the data file, one entry per line. json.dump() with indent falls
+    back to the pure Python encoder, encoding entry by entry keeps the C one.
+    """
+    f.write("[")
+    separator = "\n  "
+    for todo in todos:
+        f.write(separator)
+        f.write(json.dumps(_summary(todo)))
+        separator = ",\n  "
+    f.write("\n]\n" if separator != "\n  " else "]\n")
+
+
+def _from_item(item: dict) -> Todo:
+    """
+    Build a todo from a data file entry. Entries written before the details
+    file existed still hold their description.
+    """
+    details_at = item.pop("detailsAt", None)
+    todo = Todo(**item)
+    if details_at is not None:
+        todo.detailsAt = tuple(details_at)
+    return todo
+
+
+def _detailed(todo: Todo, description: str | None) -> Todo:
+    """
+    A copy of a todo with the given description.
+    """
+    detailed = Todo.from_fields(
+        todo.id, todo.title, todo.titleKey, description, todo.dueDateOrdinal,
+        todo.isCompleted, todo.createdAtUs, todo.version,
+    )
+    detailed.completedAtUs = todo.completedAtUs
+    return detailed
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters describing how the resident collection cache is used.
+
+    hits    - the cached collection was still valid and reused
+    misses  - there was no cached collection yet and the file was parsed
+    reloads - the files were changed by someone else and had to be re-read
+    """
+    hits: int = 0
+    misses: int = 0
+    reloads: int = 0
+
+
+class FileTodoRepository(TodoRepository):
+    """
+    Stores todos as a JSON list in a data file.
+
+    In "json" mode every change rewrites the data file. In "journal" mode
+    changes are appended to a journal next to it, and the data file only
+    holds the last compacted snapshot. Either way the parsed collection
+    stays resident and is only re-read when another process changed it.
+
+    The data file holds summaries only. Descriptions go to a details file of
+    JSON lines, which is appended to and referenced by (generation, offset,
+    length), so listing never reads them and get() reads just one. Once
+    it holds mostly replaced descriptions, a new generation is written.
+
+    Todos completed more than archive_after_days ago are moved out of the
+    data file into an archive file of JSON lines, which is only appended to
+    (by compact() aside) and only read by listings that include completed
+    todos. It holds summaries as well, their descriptions are appended to
+    an archive details file. Those merge it in, so the data file and everything reading just
+    pending todos only pay for the pending and recently completed ones.
+    Changing an archived todo moves it back first. A todo found in both
+    files (after a crash in between) counts as not archived.
+
+    Changes are read, applied and written under an exclusive lock file, so
+    the workers of a server never overwrite each other's changes. Changes
+    of concurrent threads are grouped into one write (see GroupCommit),
+    and fsync_policy decides which writes are flushed to disk.
+    """
+
+    def __init__(
+        self,
+        data_file: str,
+        storage_mode: str = STORAGE_MODE_JSON,
+        journal_compact_threshold: int = 1000,
+        commit_window_ms: float = 0,
+        fsync_policy: str = FSYNC_NEVER,
+        archive_after_days: float = 0,
+    ):
+        if storage_mode not in (STORAGE_MODE_JSON, STORAGE_MODE_JOURNAL):
+            raise ValueError(f"Unknown storage mode: {storage_mode}")
+
+        self.data_file_path = Path(data_file)
+        # In journal mode every change is appended to this file and folded
+        # into the data file (the snapshot) once it holds enough records.
+        self.journal_file_path = self.data_file_path.with_name(self.data_file_path.name + JOURNAL_SUFFIX)
+        # Collection metadata that is not part of the todos list: the highest
+        # id ever allocated and the collection version
+        self.meta_file_path = self.data_file_path.with_name(self.data_file_path.name + META_SUFFIX)
+        # Descriptions, in files named <data file>.details.<generation>
+        self.details_file_prefix = self.data_file_path.name + DETAILS_SUFFIX + "."
+        # Todos completed long ago, moved out of the data file
+        self.archive_file_path = self.data_file_path.with_name(self.data_file_path.name + ARCHIVE_SUFFIX)
+        # Descriptions of the archived todos. Only appended to, the ones moved
+        # back stay behind
+        self.archive_details_file_path = self.archive_file_path.with_name(self.archive_file_path.name + DETAILS_SUFFIX)
+        # Held by the worker reading, changing and writing the files
+        self.lock_file_path = self.data_file_path.with_name(self.data_file_path.name + LOCK_SUFFIX)
+        self.storage_mode = storage_mode
+        self.journal_compact_threshold = max(1, journal_compact_threshold)
+        # 0 keeps all todos in the data file
+        self.archive_after_days = archive_after_days
+
+        # Parsed collection kept resident between calls. It is revalidated
+        # against the data and meta file stamps, so changes made by other
+        # workers are picked up without re-parsing the file on every call.
+        self._cache: TodoCollection | None = None
+        self._cache_stamp: tuple[FileStamp, FileStamp] | None = None
+        # Journal inode, bytes already replayed and number of records in it
+        self._journal_inode: int | None = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        # Archived todos, loaded by the first listing that needs them, the
+        # archive file stamp they were read at, and the collection they were
+        # checked against for todos moved back
+        self._archive: TodoCollection | None = None
+        self._archive_stamp: FileStamp = None
+        self._archive_checked: TodoCollection | None = None
+        # Due window counts of the archive, with the archive file stamp and
+        # the day they were counted at
+        self._archive_due_counts: tuple[tuple[FileStamp, int], dict[DueWindow, int]] | None = None
+        self._lock = threading.RLock()
+        self.cache_stats = CacheStats()
+        self._group = GroupCommit(self._commit_group, commit_window_ms / 1000)
+        self._fsync = FsyncSchedule(fsync_policy)
+
+    # -------------------------
+    # Persistence helpers
+    # -------------------------
+    @staticmethod
+    def _file_stamp(path: Path) -> FileStamp:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _stamp(self) -> tuple[FileStamp, FileStamp]:
+        return (self._file_stamp(self.data_file_path), self._file_stamp(self.meta_file_path))
+
+    @staticmethod
+    def _write_atomically(path: Path, write: Callable[[TextIO], None], fsync: bool = False) -> FileStamp:
+        """
+        Write a file through a temporary file that is swapped in, so readers
+        never see a half-written file and every write gets a fresh stamp.
+        With fsync the file and the rename are flushed to disk.
+        Returns the stamp of the written file.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            # mkstemp creates the file owner-only, keep the usual mode
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w", encoding=CHARACTER_ENCODING) as f:
+                write(f)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+            os.replace(tmp_path, path)
+            if fsync:
+                fsync_directory(path.parent)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        count("todo_bytes_written_total", st.st_size)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _journal_stat(self) -> os.stat_result | None:
+        try:
+            return os.stat(self.journal_file_path)
+        except FileNotFoundError:
+            return None
+
+    def _load_meta(self) -> dict:
+        try:
+            with self.meta_file_path.open("r", encoding=CHARACTER_ENCODING) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_meta(self, collection: TodoCollection, fsync: bool = False) -> FileStamp:
+        meta = {
+            "lastId": collection.last_id,
+            "version": collection.version,
+            "modified": collection.modified.isoformat() if collection.modified else None,
+        }
+        return self._write_atomically(self.meta_file_path, lambda f: json.dump(meta, f), fsync)
+
+    def _load(self) -> TodoCollection:
+        with self._lock:
+            stamp = self._stamp()
+            journal = self._journal_stat()
+
+            if self._cache is not None and stamp == self._cache_stamp:
+                if journal is None and self._journal_inode is None:
+                    self.cache_stats.hits += 1
+                    return self._cache
+                if journal is not None and journal.st_ino == self._journal_inode:
+                    if journal.st_size == self._journal_offset:
+                        self.cache_stats.hits += 1
+                        return self._cache
+                    if journal.st_size > self._journal_offset:
+                        # Only new records were appended, replay just the tail
+                        self.cache_stats.reloads += 1
+                        self._replay_journal(self._cache)
+                        return self._cache
+
+            if self._cache is None:
+                self.cache_stats.misses += 1
+            else:
+                self.cache_stats.reloads += 1
+                logger.debug("Data file %s changed, reloading", self.data_file_path)
+
+            with timed("load"):
+                if stamp[0] is None:
+                    data = []
+                else:
+                    with self.data_file_path.open("r", encoding=CHARACTER_ENCODING) as f:
+                        data = json.load(f)
+                    count("todo_file_loads_total")
+                    count("todo_bytes_read_total", stamp[0][1])
+                meta = self._load_meta()
+                todos = TodoCollection(
+                    (_from_item(item) for item in data),
+                    last_id=meta.get("lastId", 0),
+                    version=meta.get("version", 0),
+                    modified=_parse_time(meta.get("modified")),
+                    details=self._read_details,
+                )
+                if self._cache is not None:
+                    # Mostly the same todos, rewritten by another worker
+                    todos.take_text_index(self._cache)
+
+            self._cache = todos
+            self._cache_stamp = stamp
+            self._journal_inode = journal.st_ino if journal is not None else None
+            self._journal_offset = 0
+            self._journal_records = 0
+            if journal is not None:
+                self._replay_journal(todos)
+            return todos
+
+    def _details_path(self, generation: int) -> Path:
+        if generation == ARCHIVE_GENERATION:
+            return self.archive_details_file_path
+        return self.data_file_path.with_name(f"{self.details_file_prefix}{generation}")
+
+    def _details_generations(self) -> list[int]:
+        generations = []
+        for path in self.data_file_path.parent.glob(self.details_file_prefix + "*"):
+            suffix = path.name[len(self.details_file_prefix):]
+            if suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    def _read_details(self, summaries: list[Todo]) -> dict[int, str]:
+        """
+        Read the descriptions of summaries from the details files, by id.
+        Raises FileNotFoundError if another worker has dropped their
+        generation meanwhile.
+        """
+        by_generation: dict[int, list[Todo]] = {}
+        for todo in summaries:
+            by_generation.setdefault(todo.detailsAt[0], []).append(todo)
+        descriptions = {}
+        for generation, todos in by_generation.items():
+            with self._details_path(generation).open("rb") as f:
+                for todo in sorted(todos, key=lambda t: t.detailsAt[1]):
+                    _, offset, length = todo.detailsAt
+                    f.seek(offset)
+                    descriptions[todo.id] = json.loads(f.read(length))["description"]
+                    count("todo_bytes_read_total", length)
+        return descriptions
+
+    def _store_details(self, todos: TodoCollection, fsync: bool) -> int:
+        """
+        Move the loaded descriptions out to the details file, and start a new
+        generation when the current one is mostly garbage. Returns the
+        generation in use.
+        """
+        generation = max(self._details_generations(), default=1)
+        path = self._details_path(generation)
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            size = 0
+        summaries = [todo for todo in todos if todo.detailsAt is not None]
+        live = sum(todo.detailsAt[2] for todo in summaries if todo.detailsAt[0] == generation)
+        loaded = [todo for todo in todos if todo.description is not None]
+
+        rewrite = size > max(2 * live, DETAILS_COMPACT_MIN_BYTES) or any(
+            todo.detailsAt[0] != generation for todo in summaries
+        )
+        if rewrite:
+            descriptions = self._read_details(summaries)
+            for todo in summaries:
+                todo.description = descriptions[todo.id]
+            loaded += summaries
+            generation += 1
+        self._append_details(generation, loaded, fsync)
+        return generation
+
+    def _append_details(self, generation: int, loaded: list[Todo], fsync: bool) -> None:
+        """
+        Append the descriptions of loaded todos to the details file of
+        generation, and leave the todos referring to them.
+        """
+        if not loaded:
+            return
+        lines = [
+            (json.dumps({"id": todo.id, "description": todo.description}, separators=(",", ":")) + "\n")
+            .encode(CHARACTER_ENCODING)
+            for todo in loaded
+        ]
+        path = self._details_path(generation)
+        # Appending leaves the entries other workers still refer to in place
+        with path.open("ab") as f:
+            offset = f.tell()
+            f.write(b"".join(lines))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        if fsync and offset == 0:
+            fsync_directory(path.parent)
+        count("todo_bytes_written_total", sum(map(len, lines)))
+        for todo, line in zip(loaded, lines):
+            todo.description = None
+            todo.detailsAt = (generation, offset, len(line))
+            offset += len(line)
+
+    def _load_archive(self, todos: TodoCollection) -> TodoCollection | None:
+        """
+        The archived todos, or None if nothing was archived yet. Leaves out
+        the ones also in todos, the collection of the data file.
+        """
+        stamp = self._file_stamp(self.archive_file_path)
+        if stamp is None:
+            self._archive = None
+            return None
+        if self._archive is None or stamp != self._archive_stamp:
+            with self.archive_file_path.open("rb") as f:
+                data = f.read()
+            count("todo_file_loads_total")
+            count("todo_bytes_read_total", len(data))
+            archived: dict[int, dict] = {}
+            # A line still being written has no trailing newline yet
+            for line in data[:data.rfind(b"\n") + 1].splitlines():
+                record = json.loads(line)
+                if record["op"] == OP_ARCHIVE:
+                    archived[record["todo"]["id"]] = record["todo"]
+                else:
+                    archived.pop(record["id"], None)
+            # Records written before the archive details file existed still
+            # hold their description
+            self._archive = TodoCollection(
+                (_from_item(item) for item in archived.values()),
+                details=self._read_details,
+            )
+            self._archive_stamp = stamp
+            self._archive_checked = None
+
+        # Moving a todo back puts it in the data file before the archive file
+        # records it. Journal replays drop the ones moved back meanwhile,
+        # a reloaded collection is checked once.
+        if self._archive_checked is not todos:
+            self._unarchive(todos)
+            self._archive_checked = todos
+        return self._archive
+
+    def _unarchive(self, todos: Iterable[Todo]) -> None:
+        """
+        Drop todos from the loaded archive, they are not archived anymore.
+        """
+        if self._archive is not None:
+            for todo in todos:
+                if todo.id in self._archive:
+                    self._archive.remove(todo.id)
+
+    def _append_archive(self, records: list[dict], fsync: bool = False) -> None:
+        """
+        Append records to the archive file. The caller has applied them to
+        the loaded archive already.
+        """
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        lines = lines.encode(CHARACTER_ENCODING)
+        stamp = self._file_stamp(self.archive_file_path)
+        try:
+            with self.archive_file_path.open("ab") as f:
+                f.write(lines)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+        except BaseException:
+            self._archive = None
+            raise
+        if fsync and stamp is None:
+            fsync_directory(self.archive_file_path.parent)
+        count("todo_bytes_written_total", len(lines))
+        # Skip rereading our own records, unless another worker appended
+        if self._archive is not None and stamp == self._archive_stamp:
+            self._archive_stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        else:
+            self._archive = None
+
+    def _archive_completed(self, todos: TodoCollection, fsync: bool, restored: Iterable[int] = ()) -> None:
+        """
+        Move the todos completed more than archive_after_days ago to the
+        archive file, except the restored ones. Completed todos without a
+        completion time, stored before it was recorded, get the current time.
+        """
+        if self.archive_after_days <= 0:
+            return
+        now = epoch_us_now()
+        cutoff = now - int(self.archive_after_days * DAY_US)
+        # Todos moved back by the changes being committed stay for now: their
+        # restore record follows this save and would cancel a new archive record
+        restored = set(restored)
+        expired = []
+        for _, todo_id in todos.ordering(True, SortKey.CREATED_AT, 0):
+            todo = todos.get(todo_id)
+            if todo.completedAtUs is None:
+                todo.completedAtUs = now
+            elif todo.completedAtUs <= cutoff and todo_id not in restored:
+                expired.append(todo)
+        if not expired:
+            return
+
+        expired = self._with_details(expired)
+        self._append_details(ARCHIVE_GENERATION, [todo for todo in expired if todo.description is not None], fsync)
+        if self._archive is not None:
+            for todo in expired:
+                self._archive.put(todo)
+        # Appended before the data file drops them, so a crash in between
+        # leaves them in both files rather than in neither
+        self._append_archive([{"op": OP_ARCHIVE, "todo": _summary(todo)} for todo in expired], fsync)
+        for todo in expired:
+            todos.remove(todo.id)
+        count("todo_archived_total", len(expired))
+
+    def _restore(self, todos: TodoCollection, todo_id: int) -> list[dict]:
+        """
+        Move an archived todo back to todos, so it can be changed. Returns
+        the journal record adding it there, or none if it is not archived.
+        """
+        if todo_id in todos:
+            return []
+        archive = self._load_archive(todos)
+        if archive is None or todo_id not in archive:
+            return []
+        # The description moves back along with it, the next save stores it
+        # in the details file of the data file
+        todo = self._with_details([archive.get(todo_id)])[0]
+        archive.remove(todo_id)
+        todos.put(todo)
+        return [{"op": OP_UNARCHIVE, "todo": _entry(todo, todo.description)}]
+
+    def _replay_journal(self, todos: TodoCollection) -> None:
+        """
+        Apply the journal records written after the current offset.
+
+        A record that is still being written by another worker has no
+        trailing newline yet and is left for the next load.
+        """
+        try:
+            with self.journal_file_path.open("rb") as f:
+                self._journal_inode = os.fstat(f.fileno()).st_ino
+                f.seek(self._journal_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+
+        count("todo_bytes_read_total", len(chunk))
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self._apply_record(todos, record)
+                self._journal_records += 1
+                if record["op"] == OP_UNARCHIVE and todos is self._archive_checked:
+                    # Moved back from the archive by another worker
+                    self._unarchive([todos.get(record["todo"]["id"])])
+        self._journal_offset += end
+
+    @staticmethod
+    def _apply_record(todos: TodoCollection, record: dict) -> None:
+        """
+        Apply one journal record to the collection.
+
+        Records are idempotent, so replaying one that is already applied
+        leaves the collection unchanged.
+        """
+        if record.get("v", 0) > todos.version:
+            todos.version = record["v"]
+            todos.modified = _parse_time(record.get("t"))
+
+        op = record["op"]
+        if op in (OP_ADD, OP_UNARCHIVE):
+            todos.put(Todo(**record["todo"]))
+            return
+
+        if record["id"] not in todos:
+            return
+
+        if op == OP_UPDATE:
+            todos.update(
+                record["id"],
+                title=record["title"],
+                description=record["description"],
+                dueDate=record["dueDate"],
+                version=record.get("version", 1),
+            )
+        elif op == OP_COMPLETE:
+            todos.update(
+                record["id"],
+                isCompleted=record["isCompleted"],
+                completedAt=record.get("completedAt"),
+                version=record.get("version", 1),
+            )
+        elif op == OP_DELETE:
+            todos.remove(record["id"])
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def _append_journal(self, records: tuple[dict, ...], fsync: bool = False) -> None:
+        # All records of one change go out in a single write
+        line = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        line = line.encode(CHARACTER_ENCODING)
+        if not self.journal_file_path.parent.is_dir():
+            self.journal_file_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.journal_file_path.open("ab") as f:
+            f.write(line)
+            f.flush()
+            if fsync:
+                # Also flushes the appends of earlier, unflushed commits
+                os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+            end = f.tell()
+        count("todo_bytes_written_total", len(line))
+
+        self._journal_records += len(records)
+        # Skip our own records on the next load, unless another worker appended
+        # in between: then the tail is replayed (records are idempotent).
+        if st.st_ino == self._journal_inode and end - len(line) == self._journal_offset:
+            self._journal_offset = end
+        elif self._journal_inode is None and end == len(line):
+            self._journal_inode = st.st_ino
+            self._journal_offset = end
+
+    def _commit(self, todos: TodoCollection, *records: dict) -> None:
+        """
+        Persist mutations that were already applied to todos with one write.
+        """
+        if not records:
+            return
+        with self._lock:
+            todos.touch()
+            for record in records:
+                record["v"] = todos.version
+                record["t"] = todos.modified.isoformat()
+            fsync = self._fsync.due()
+            if self.storage_mode == STORAGE_MODE_JOURNAL:
+                try:
+                    self._append_journal(records, fsync)
+                except BaseException:
+                    self._cache = None
+                    self._cache_stamp = None
+                    raise
+                if self._journal_records >= self.journal_compact_threshold:
+                    self._save(todos, fsync, _unarchived_ids(records))
+            else:
+                self._save(todos, fsync, _unarchived_ids(records))
+            count("todo_commits_total")
+            if fsync:
+                count("todo_fsyncs_total")
+
+    def _save(self, todos: TodoCollection, fsync: bool = False, restored: Iterable[int] = ()) -> None:
+        """
+        Write the whole collection to the data file and drop the journal,
+        whose records are now part of it. Todos restored by the commit being
+        saved are not archived again: their restore record follows this save
+        and would cancel a new archive record.
+        """
+        with self._lock:
+            try:
+                # Ensure parent directory exists
+                if not self.data_file_path.parent.is_dir():
+                    self.data_file_path.parent.mkdir(parents=True, exist_ok=True)
+                self._archive_completed(todos, fsync, restored)
+                # Descriptions go first, so the data file never refers to
+                # missing ones
+                generation = self._store_details(todos, fsync)
+                data_stamp = self._write_atomically(
+                    self.data_file_path,
+                    lambda f: _write_items(f, todos),
+                    fsync,
+                )
+                # The version goes last. A reader in between gets the new
+                # todos under the old version, never the old todos under the
+                # new one, which pages would then be cached under. The ids
+                # allocated meanwhile are in the data file, and the loaded
+                # collection counts them in its id high-water mark.
+                meta_stamp = self._save_meta(todos, fsync)
+                self.journal_file_path.unlink(missing_ok=True)
+                for old in self._details_generations():
+                    if old < generation:
+                        self._details_path(old).unlink(missing_ok=True)
+            except BaseException:
+                # The cached objects may already hold the unsaved changes
+                self._cache = None
+                self._cache_stamp = None
+                raise
+
+            self._cache = todos
+            self._cache_stamp = (data_stamp, meta_stamp)
+            self._journal_inode = None
+            self._journal_offset = 0
+            self._journal_records = 0
+
+    def compact(self) -> None:
+        """
+        Fold the journal into the data file, move all descriptions to the
+        details files and rewrite the archive file without the todos moved
+        back from it.
+
+        Afterwards the data file, the archive file and their details files
+        alone hold the whole collection, so they can be copied, backed up or used
+        with the plain JSON storage mode.
+        """
+        with self._lock, file_lock(self.lock_file_path):
+            todos = self._load()
+            self._save(todos)
+            archive = self._load_archive(todos)
+            if archive is not None:
+                self._append_details(ARCHIVE_GENERATION, [todo for todo in archive if todo.description is not None], False)
+                self._archive_stamp = self._write_atomically(
+                    self.archive_file_path,
+                    lambda f: f.writelines(
+                        json.dumps({"op": OP_ARCHIVE, "todo": _summary(todo)}) + "\n"
+                        for todo in archive
+                    ),
+                )
+
+    def _change(self, change: Callable[[TodoCollection], tuple[Result, list[dict]]]) -> Result:
+        """
+        Apply change to the latest collection and persist the journal records
+        it returns, together with the changes of concurrent threads.
+        """
+        return self._group.submit(change)
+
+    def _commit_group(self, changes: list[PendingChange]) -> None:
+        # Another worker may have changed the files up to the lock, _load()
+        # picks that up before the changes are applied
+        with self._lock, file_lock(self.lock_file_path):
+            todos = self._load()
+            records = []
+            for change in changes:
+                records += change.apply(todos) or ()
+            try:
+                self._commit(todos, *records)
+            except BaseException:
+                self._archive = None
+                raise
+            restored = _unarchived_ids(records)
+            if restored:
+                # Only once the todos are safely back in the data file
+                self._append_archive([{"op": OP_RESTORE, "id": todo_id} for todo_id in restored])
+            count("todo_committed_changes_total", len(changes))
+
+    @property
+    def last_id(self) -> int:
+        """
+        Highest id allocated so far, including deleted ones.
+        """
+        with self._lock:
+            return self._load().last_id
+
+    def version(self) -> DataVersion:
+        with self._lock:
+            todos = self._load()
+            return DataVersion(todos.version, todos.modified)
+
+    def todo_version(self, todo_id: int) -> int:
+        return self._reading(lambda todos: self._find(todos, todo_id).version)
+
+    def count(self) -> int:
+        def count_all(todos: TodoCollection) -> int:
+            archive = self._load_archive(todos)
+            return len(todos) + (len(archive) if archive is not None else 0)
+
+        return self._reading(count_all)
+
+    def count_unarchived(self) -> int:
+        return self._reading(len)
+
+    # -------------------------
+    # List / filter / sort
+    # -------------------------
+    def _reading(self, read: Callable[[TodoCollection], Result]) -> Result:
+        """
+        Run read on the collection, reloading it once if another worker
+        dropped the details file it refers to.
+        """
+        with self._lock:
+            try:
+                return read(self._load())
+            except FileNotFoundError:
+                self._cache = None
+                self._cache_stamp = None
+                return read(self._load())
+
+    def _with_details(self, todos: List[Todo]) -> List[Todo]:
+        """
+        Copies of todos with their descriptions. The stored todos are never
+        handed out, the next save moves their descriptions out.
+        """
+        descriptions = self._read_details([t for t in todos if t.detailsAt is not None])
+        return [_detailed(t, descriptions[t.id] if t.detailsAt is not None else t.description) for t in todos]
+
+    def _archive_for(self, todos: TodoCollection, status: Status) -> TodoCollection | None:
+        """
+        The archived todos a listing of status has to merge in. Pending
+        listings never read the archive file.
+        """
+        return None if status == Status.PENDING else self._load_archive(todos)
+
+    def _find(self, todos: TodoCollection, todo_id: int) -> Todo:
+        if todo_id not in todos:
+            archive = self._load_archive(todos)
+            if archive is not None and todo_id in archive:
+                return archive.get(todo_id)
+        return todos.get(todo_id)
+
+    def list_all(self) -> List[Todo]:
+        return self._reading(lambda todos: self._with_details(list(todos.ordered(
+            Status.ALL, SortKey.CREATED_AT, Order.DESC, self._load_archive(todos)
+        ))))
+
+    def iter_all(self) -> Iterator[Todo]:
+        # Keyset pages of the creation order, each read under the lock, so
+        # changes in between neither break the walk nor repeat items
+        def chunk(todos: TodoCollection) -> tuple[str | None, List[Todo]]:
+            page = todos.page(
+                Status.ALL, SortKey.CREATED_AT, Order.ASC, ITER_CHUNK_SIZE, cursor,
+                archive=self._load_archive(todos),
+            )
+            return page.next_cursor, self._with_details(page.items)
+
+        cursor = None
+        while True:
+            next_cursor, items = self._reading(chunk)
+            yield from items
+            if next_cursor is None:
+                return
+            cursor = Cursor.decode(next_cursor)
+
+    def list_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        # Walk the presorted ordering of the requested status and sort key,
+        # or of the search matches sorted on the fly. The items are summaries.
+        return self._reading(lambda todos: todos.page(
+            status, sort_key, order, page_size, cursor, query, due, self._archive_for(todos, status)
+        ))
+
+    def due_counts(self, status: Status) -> dict[DueWindow, int]:
+        def count(todos: TodoCollection) -> dict[DueWindow, int]:
+            counts = todos.due_counts(status)
+            if status != Status.PENDING:
+                for window, archived in self._archived_due_counts(todos).items():
+                    counts[window] += archived
+            return counts
+
+        return self._reading(count)
+
+    def _archived_due_counts(self, todos: TodoCollection) -> dict[DueWindow, int]:
+        """
+        Due window counts of the archived todos, all of them completed. They
+        only change with the archive file or the day, so the list page
+        counts them once per change instead of checking the archive against
+        every reloaded collection.
+        """
+        key = (self._file_stamp(self.archive_file_path), today_ordinal())
+        if key[0] is None:
+            return {}
+        if self._archive_due_counts is None or self._archive_due_counts[0] != key:
+            archive = self._load_archive(todos)
+            counts = archive.due_counts(Status.COMPLETED) if archive is not None else {}
+            self._archive_due_counts = (key, counts)
+        return self._archive_due_counts[1]
+
+    # -------------------------
+    # CRUD
+    # -------------------------
+    def get(self, todo_id: int) -> Todo:
+        return self._reading(lambda todos: self._with_details([self._find(todos, todo_id)])[0])
+
+    def add(
+        self,
+        todo: Todo
+    ) -> Todo:
+        return self._change(lambda todos: (todo, [self._add(todos, todo)]))
+
+    def update(
+        self,
+        updated_todo: Todo,
+        expected_version: int | None = None,
+    ) -> Todo:
+        def change(todos: TodoCollection) -> tuple[Todo, list[dict]]:
+            records = self._update(todos, updated_todo, expected_version)
+            return self._with_details([todos.get(updated_todo.id)])[0], records
+
+        return self._change(change)
+
+    def set_completed(self, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+        def change(todos: TodoCollection) -> tuple[Todo, list[dict]]:
+            records = self._set_completed(todos, todo_id, completed, expected_version)
+            return self._with_details([todos.get(todo_id)])[0], records
+
+        return self._change(change)
+
+    def delete(self, todo_id: int) -> None:
+        self._change(lambda todos: (None, self._delete(todos, todo_id)))
+
+    # -------------------------
+    # Bulk changes, applied in one pass and persisted with one write
+    # -------------------------
+    def add_many(self, new_todos: Iterable[Todo]) -> List[Todo]:
+        added = list(new_todos)
+        return self._change(lambda todos: (added, [self._add(todos, todo) for todo in added]))
+
+    def update_many(self, updated_todos: Iterable[Todo]) -> BulkResult:
+        by_id = {t.id: t for t in updated_todos}
+        return self._change_many(by_id, lambda todos, i: self._update(todos, by_id[i]))
+
+    def set_completed_many(self, todo_ids: Iterable[int], completed: bool) -> BulkResult:
+        return self._change_many(todo_ids, lambda todos, i: self._set_completed(todos, i, completed))
+
+    def delete_many(self, todo_ids: Iterable[int]) -> BulkResult:
+        return self._change_many(todo_ids, self._delete)
+
+    def _change_many(self, todo_ids: Iterable[int], change: Callable[[TodoCollection, int], list[dict]]) -> BulkResult:
+        def change_all(todos: TodoCollection) -> tuple[BulkResult, list[dict]]:
+            records = []
+            result = self._each(todo_ids, lambda todo_id: records.extend(change(todos, todo_id)))
+            return result, records
+
+        return self._change(change_all)
+
+    # -------------------------
+    # Changes of the resident collection, returning their journal records
+    # -------------------------
+    @staticmethod
+    def _add(todos: TodoCollection, todo: Todo) -> dict:
+        todo.id = todos.next_id()
+        # A copy, the caller keeps the description the next save moves out
+        todos.put(_detailed(todo, todo.description))
+        return {"op": OP_ADD, "todo": todo.to_dict()}
+
+    def _update(self, todos: TodoCollection, updated_todo: Todo, expected_version: int | None = None) -> list[dict]:
+        # Checked before moving an archived todo back, a refused change moves nothing
+        version = self._find(todos, updated_todo.id).version
+        check_version(updated_todo.id, version, expected_version)
+        records = self._restore(todos, updated_todo.id)
+        todo = todos.update(
+            updated_todo.id,
+            title=updated_todo.title,
+            description=updated_todo.description,
+            dueDate=updated_todo.dueDate,
+            version=version + 1,
+        )
+        return records + [{
+            "op": OP_UPDATE,
+            "id": todo.id,
+            "title": todo.title,
+            "description": todo.description,
+            "dueDate": todo.dueDate,
+            "version": todo.version,
+        }]
+
+    def _set_completed(
+        self, todos: TodoCollection, todo_id: int, completed: bool, expected_version: int | None = None
+    ) -> list[dict]:
+        check_version(todo_id, self._find(todos, todo_id).version, expected_version)
+        records = self._restore(todos, todo_id)
+        todo = todos.get(todo_id)
+        # Completing a completed todo again keeps its completion time
+        completed_at = None
+        if completed:
+            completed_at = todo.completedAtUs if todo.isCompleted else epoch_us_now()
+        todos.update(todo_id, isCompleted=bool(completed), completedAtUs=completed_at, version=todo.version + 1)
+        return records + [{
+            "op": OP_COMPLETE,
+            "id": todo.id,
+            "isCompleted": todo.isCompleted,
+            "completedAt": todo.completedAt,
+            "version": todo.version,
+        }]
+
+    def _delete(self, todos: TodoCollection, todo_id: int) -> list[dict]:
+        records = self._restore(todos, todo_id)
+        todos.remove(todo_id)
+        return records + [{"op": OP_DELETE, "id": todo_id}]
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Generic, TypeVar
+from app.constants import FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_NEVER
+
+State = TypeVar("State")
+Result = TypeVar("Result")
+Effect = TypeVar("Effect")
+
+# Least time in seconds between two fsyncs of the "batched" policy
+FSYNC_BATCH_INTERVAL = 1.0
+
+
+class PendingChange(Generic[State, Result, Effect]):
+    """
+    A change waiting to be committed with its group.
+
+    change(state) applies it and returns its result together with what has
+    to be persisted for it (journal records, a changed flag).
+    """
+
+    __slots__ = ("change", "result", "error", "done")
+
+    def __init__(self, change: Callable[[State], tuple[Result, Effect]]):
+        self.change = change
+        self.result: Result | None = None
+        self.error: BaseException | None = None
+        self.done = False
+
+    def apply(self, state: State) -> Effect | None:
+        """
+        Apply the change to state. An exception becomes the outcome of this
+        change only, the rest of the group goes on. Returns None then.
+        """
+        try:
+            self.result, effect = self.change(state)
+        except Exception as e:
+            self.error = e
+            return None
+        return effect
+
+    def outcome(self) -> Result:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class GroupCommit(Generic[State, Result, Effect]):
+    """
+    Coalesces changes submitted by concurrent threads into shared commits.
+
+    The first submitter becomes the leader: it waits window seconds for more
+    changes to arrive, then hands all queued changes to commit() at once and
+    wakes the others. Changes arriving while a commit is running queue up and
+    go out together with the next one, so under load every commit carries
+    many changes even without a window.
+
+    commit(changes) applies the changes with PendingChange.apply() and
+    persists them. If it raises, every change of the group fails with the
+    error.
+    """
+
+    def __init__(self, commit: Callable[[list[PendingChange[State, Result, Effect]]], None], window: float = 0.0):
+        self.commit = commit
+        self.window = window
+        self._condition = threading.Condition()
+        self._queue: list[PendingChange[State, Result, Effect]] = []
+        self._committing = False
+
+    def submit(self, change: Callable[[State], tuple[Result, Effect]]) -> Result:
+        pending = PendingChange(change)
+        with self._condition:
+            self._queue.append(pending)
+            while self._committing and not pending.done:
+                self._condition.wait()
+            if pending.done:
+                return pending.outcome()
+            self._committing = True
+
+        try:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._condition:
+                group, self._queue = self._queue, []
+            try:
+                self.commit(group)
+            except BaseException as e:
+                for queued in group:
+                    queued.error = e
+                raise
+            finally:
+                for queued in group:
+                    queued.done = True
+        finally:
+            with self._condition:
+                self._committing = False
+                self._condition.notify_all()
+        return pending.outcome()
+
+
+class FsyncSchedule:
+    """
+    Decides which commits are flushed to disk with fsync.
+
+    "always" flushes every commit before it returns. "batched" flushes the
+    first commit after FSYNC_BATCH_INTERVAL since the last flush, which also
+    flushes the journal appends before it. "never" leaves writing back to
+    the operating system.
+    """
+
+    def __init__(self, policy: str = FSYNC_NEVER):
+        if policy not in (FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_NEVER):
+            raise ValueError(f"Unknown fsync policy: {policy}")
+        self.policy = policy
+        self._synced = 0.0
+
+    def due(self) -> bool:
+        if self.policy == FSYNC_ALWAYS:
+            return True
+        if self.policy == FSYNC_BATCHED:
+            now = time.monotonic()
+            if now - self._synced >= FSYNC_BATCH_INTERVAL:
+                self._synced = now
+                return True
+        return False
+
+
+def fsync_directory(path: Path) -> None:
+    """
+    Flush a directory, making renames into it durable.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
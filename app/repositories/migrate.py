@@ -0,0 +1,36 @@
+"""
+One-shot migration of the JSON data file into a SQLite database.
+
+Usage: python -m app.repositories.migrate [DATA_FILE] [SQLITE_FILE]
+"""
+import os
+import sys
+from .file_todo_repository import FileTodoRepository
+from .sqlite_todo_repository import SqliteTodoRepository
+from app.constants import KEY_DATA_FILE, KEY_SQLITE_FILE, DEFAULT_DATA_FILE, DEFAULT_SQLITE_FILE
+
+
+def migrate_json_to_sqlite(data_file: str, db_file: str) -> int:
+    """
+    Copy all todos (including a pending journal) from the data file into an
+    empty SQLite database, keeping ids. Returns the number of todos copied.
+    """
+    source = FileTodoRepository(data_file)
+    target = SqliteTodoRepository(db_file)
+    if not target.is_empty():
+        raise RuntimeError(f"{db_file} already contains todos, refusing to migrate into it.")
+
+    todos = sorted(source.list_all(), key=lambda t: t.id)
+    return target.import_todos(todos, last_id=source.last_id)
+
+
+def main(argv: list[str]) -> int:
+    data_file = argv[1] if len(argv) > 1 else os.getenv(KEY_DATA_FILE, DEFAULT_DATA_FILE)
+    db_file = argv[2] if len(argv) > 2 else os.getenv(KEY_SQLITE_FILE, DEFAULT_SQLITE_FILE)
+    count = migrate_json_to_sqlite(data_file, db_file)
+    print(f"Migrated {count} todos from {data_file} to {db_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,228 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Sequence
+from ..models.todo import Todo
+from ..models.todo_page import TodoPage
+from ..models.list_options import SortKey, Cursor, DueWindow, DueRange, SORT_VALUE_TYPES, due_range
+from ..metrics import count
+
+# Sort key tuple of one item in an ordering: (sort value, id)
+OrderingKey = tuple[str | int, int]
+# Position of an item in a listing: (segment, ordering key)
+Position = tuple[int, OrderingKey]
+
+# Every ordering is split into segments that are walked one after another,
+# so items without a due date (segment 1) stay last in both sort directions.
+SEGMENTS = {sort_key: len(types) for sort_key, types in SORT_VALUE_TYPES.items()}
+
+# walk(start, backward, limit) yields up to limit items strictly after start
+# in listing order, or strictly before it in reverse order when backward is set
+Walk = Callable[[Position | None, bool, int], Iterable[tuple[Position, Todo]]]
+
+
+# ordering(completed, segment) returns the sorted due date ordering keys of
+# one segment of the items with the given completion state
+DueOrdering = Callable[[bool, int], Sequence[OrderingKey]]
+
+
+class KeySlice(Sequence):
+    """
+    Read-only view of a range of a sorted key sequence. The binary searches
+    of walk_runs() work on it without the range being copied.
+    """
+
+    __slots__ = ("keys", "start", "stop")
+
+    def __init__(self, keys: Sequence[OrderingKey], start: int, stop: int):
+        self.keys = keys
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, i: int) -> OrderingKey:
+        if not 0 <= i < self.stop - self.start:
+            raise IndexError(i)
+        return self.keys[self.start + i]
+
+
+def due_slice(keys: Sequence[OrderingKey], due: DueRange) -> KeySlice:
+    """
+    The keys of the dated segment of a due date ordering that fall in the
+    due range, found with two binary searches.
+    """
+    first, end = due
+    start = 0 if first is None else bisect_left(keys, (first,))
+    stop = len(keys) if end is None else bisect_left(keys, (end,))
+    return KeySlice(keys, start, stop)
+
+
+def due_runs(ordering: DueOrdering, states: list[bool], window: DueWindow, today: int) -> Callable[[int], list[Sequence[OrderingKey]]]:
+    """
+    Return runs(segment) for walk_runs() over the due date ordering of the
+    given states, restricted to a due window.
+    """
+    due = due_range(window, today)
+
+    def runs(segment: int) -> list[Sequence[OrderingKey]]:
+        if window == DueWindow.NONE:
+            # Items without a due date are the second segment as a whole
+            return [ordering(completed, segment) if segment == 1 else () for completed in states]
+        return [due_slice(ordering(completed, segment), due) if segment == 0 else () for completed in states]
+
+    return runs
+
+
+def run_ids(runs: Callable[[int], list[Sequence[OrderingKey]]], sort_key: SortKey) -> set[int]:
+    """
+    The ids of all items of the runs.
+    """
+    return {todo_id for segment in range(SEGMENTS[sort_key]) for keys in runs(segment) for _, todo_id in keys}
+
+
+def due_counts(ordering: DueOrdering, states: list[bool], today: int) -> dict[DueWindow, int]:
+    """
+    Count the items of the given states in each due window, with two binary
+    searches per window and state instead of a scan.
+    """
+    counts = {
+        window: sum(len(due_slice(ordering(completed, 0), due_range(window, today))) for completed in states)
+        for window in (DueWindow.OVERDUE, DueWindow.TODAY, DueWindow.UPCOMING)
+    }
+    counts[DueWindow.NONE] = sum(len(ordering(completed, 1)) for completed in states)
+    return counts
+
+
+def _run(keys: Sequence[OrderingKey], positions: range) -> Iterator[OrderingKey]:
+    for i in positions:
+        yield keys[i]
+
+
+def walk_runs(
+    runs: Callable[[int], list[Sequence[OrderingKey]]],
+    sort_key: SortKey,
+    reverse: bool,
+    start: Position | None = None,
+    backward: bool = False,
+) -> Iterator[Position]:
+    """
+    Yield (segment, ordering key) pairs in listing order, or in the opposite
+    order when backward is set, strictly after start. runs(segment) returns
+    the sorted key sequences that are merged into that segment.
+
+    Reaching the start position is a binary search in each run, so deep
+    positions cost the same as the beginning of the listing.
+    """
+    segments = range(SEGMENTS[sort_key])
+    if backward:
+        segments = reversed(segments)
+        reverse = not reverse
+
+    for segment in segments:
+        if start is not None and segment != start[0] and (segment < start[0]) != backward:
+            continue
+
+        merged_runs = []
+        for keys in runs(segment):
+            if start is None or segment != start[0]:
+                merged_runs.append(reversed(keys) if reverse else keys)
+            elif reverse:
+                merged_runs.append(_run(keys, range(bisect_left(keys, start[1]) - 1, -1, -1)))
+            else:
+                merged_runs.append(_run(keys, range(bisect_right(keys, start[1]), len(keys))))
+
+        merged = merged_runs[0] if len(merged_runs) == 1 else heapq.merge(*merged_runs, reverse=reverse)
+        for key in merged:
+            yield segment, key
+
+
+def paginate(
+    walk: Walk,
+    sort_key: SortKey,
+    page_size: int,
+    cursor: Cursor | None,
+    lazy: bool = False,
+) -> TodoPage:
+    """
+    Build one keyset page from a storage specific ordered walk.
+
+    With lazy set, the items of a forward page are pulled from the walk only
+    while the page is iterated, and the page cursors are final once the
+    items are exhausted. A cursor that does not belong to this sort key
+    starts from the first page.
+    """
+    if cursor is not None and (cursor.sort != sort_key or not 0 <= cursor.segment < SEGMENTS[sort_key]):
+        cursor = None
+    start = (cursor.segment, (cursor.value, cursor.id)) if cursor is not None else None
+    backward = cursor is not None and cursor.before
+
+    page = TodoPage()
+    items = _page_items(page, _counted(walk), sort_key, page_size, start, backward)
+    page.items = items if lazy and not backward else list(items)
+    return page
+
+
+def _counted(walk: Walk) -> Walk:
+    """
+    Wrap a walk to count the items it produces.
+    """
+    def counted(start: Position | None, backward: bool, limit: int) -> Iterator[tuple[Position, Todo]]:
+        scanned = 0
+        try:
+            for row in walk(start, backward, limit):
+                scanned += 1
+                yield row
+        finally:
+            count("todo_items_scanned_total", scanned)
+
+    return counted
+
+
+def _exists(walk: Walk, position: Position, backward: bool) -> bool:
+    return next(iter(walk(position, backward, 1)), None) is not None
+
+
+def _boundary(sort_key: SortKey, position: Position, before: bool) -> str:
+    segment, (value, todo_id) = position
+    return Cursor(sort_key, segment, value, todo_id, before).encode()
+
+
+def _page_items(
+    page: TodoPage,
+    walk: Walk,
+    sort_key: SortKey,
+    page_size: int,
+    start: Position | None,
+    backward: bool,
+) -> Iterator[Todo]:
+    """
+    Yield the items of the page and set its cursors along the way.
+    """
+    rows = walk(start, backward, page_size + 1)
+
+    if backward:
+        # A previous page is walked in reverse, so it has to be collected first
+        rows = list(rows)
+        more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        if rows:
+            if more:
+                page.prev_cursor = _boundary(sort_key, rows[0][0], True)
+            if _exists(walk, rows[-1][0], False):
+                page.next_cursor = _boundary(sort_key, rows[-1][0], False)
+        for _, todo in rows:
+            yield todo
+        return
+
+    rows = iter(rows)
+    last = None
+    for position, todo in islice(rows, page_size):
+        if last is None and start is not None and _exists(walk, position, True):
+            page.prev_cursor = _boundary(sort_key, position, True)
+        last = position
+        yield todo
+
+    if last is not None and next(rows, None) is not None:
+        page.next_cursor = _boundary(sort_key, last, False)
@@ -0,0 +1,518 @@
+"""
+Compact binary snapshot of a todo collection, read through mmap.
+
+Layout (little endian), every section aligned to 8 bytes:
+
+- header: magic, format version, counts, collection metadata and the
+  offsets of the sections below
+- records: one fixed-width record per todo, sorted by id
+- orderings: per completion state, sort key and segment, the record numbers
+  in sort order (uint32), preceded by a table of (offset, count) pairs
+- words: the sorted search words, each with its range in the postings
+- postings: the record numbers containing each word (uint32)
+- heap: the UTF-8 strings referenced by (offset, length) pairs
+
+Readers decode single records on demand, so listing a page or looking up
+an id touches a few pages of the mapping, not the whole collection.
+"""
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_left
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Iterator, Sequence
+from ..models.todo import Todo, epoch_us_to_datetime, EPOCH, MICROSECOND
+from ..models.list_options import SortKey
+from .group_commit import fsync_directory
+from .pagination import OrderingKey, SEGMENTS
+from .text_index import tokenize
+from .todo_collection import TodoCollection, ordering_keys
+
+MAGIC = b"TODOSNAP"
+FORMAT_VERSION = 1
+
+# magic, format version, todos, words, last id, collection version, modified
+# (epoch microseconds, -1 for none), offsets of records, orderings, words,
+# postings and heap
+HEADER = struct.Struct("<8sIIIqqq5Q")
+# id, created (epoch microseconds), due date ordinal (0 for none), completed,
+# version, then (offset, length) of title, title key and description
+RECORD = struct.Struct("<qqiBI6I")
+# offset and number of record numbers of one ordering
+ORDERING = struct.Struct("<QQ")
+# (offset, length) of the word in the heap, first posting and posting count
+WORD = struct.Struct("<IIII")
+# Length of a missing (None) string
+NONE = 0xFFFFFFFF
+# The heap of a changed snapshot is rewritten once it holds more than twice
+# the bytes of the strings still in use, and at least this many
+HEAP_COMPACT_MIN_BYTES = 64 * 1024
+
+# Fixed order of the orderings in the file
+ORDERING_SLOTS = [
+    (completed, sort_key, segment)
+    for completed in (False, True)
+    for sort_key, segments in SEGMENTS.items()
+    for segment in range(segments)
+]
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class _Heap:
+    """
+    The string heap of a snapshot being written, after the base bytes
+    copied from a previous snapshot.
+    """
+
+    def __init__(self, base: bytes = b""):
+        self.data = bytearray(base)
+        self._placed: dict[str, tuple[int, int]] = {}
+
+    def place(self, text: str | None) -> tuple[int, int]:
+        if text is None:
+            return 0, NONE
+        # Equal strings, like a title that is its own title key, are stored once
+        spot = self._placed.get(text)
+        if spot is None:
+            data = text.encode("utf-8")
+            spot = self._placed[text] = (len(self.data), len(data))
+            self.data.extend(data)
+        return spot
+
+
+def _pack_record(todo: Todo, heap: _Heap) -> bytes:
+    return RECORD.pack(
+        todo.id, todo.createdAtUs, todo.dueDateOrdinal or 0, todo.isCompleted, todo.version,
+        *heap.place(todo.title), *heap.place(todo.titleKey), *heap.place(todo.description),
+    )
+
+
+def write_snapshot(path: Path, collection: TodoCollection, fsync: bool = False) -> int:
+    """
+    Write the collection as a snapshot, replacing path atomically so mapped
+    readers keep their old copy. With fsync the file and the rename are
+    flushed to disk. Returns the number of bytes written.
+    """
+    todos = sorted(collection, key=lambda t: t.id)
+    numbers = {todo.id: i for i, todo in enumerate(todos)}
+
+    heap = _Heap()
+    records = b"".join(_pack_record(todo, heap) for todo in todos)
+
+    orderings = [
+        [numbers[todo_id] for _, todo_id in keys]
+        for keys in (collection.ordering(*slot) for slot in ORDERING_SLOTS)
+    ]
+
+    words = bytearray()
+    postings: list[int] = []
+    word_count = 0
+    for word, ids in collection.words():
+        words += WORD.pack(*heap.place(word), len(postings), len(ids))
+        postings.extend(sorted(numbers[todo_id] for todo_id in ids))
+        word_count += 1
+
+    buffer = _assemble(
+        len(todos), word_count, collection.last_id, collection.version, collection.modified,
+        records, orderings, words, postings, heap.data,
+    )
+    _publish(path, buffer, fsync)
+    return len(buffer)
+
+
+def _assemble(
+    todo_count: int,
+    word_count: int,
+    last_id: int,
+    version: int,
+    modified: datetime | None,
+    records: bytes,
+    orderings: list[list[int]],
+    words: bytes,
+    postings: list[int],
+    heap: bytes,
+) -> bytearray:
+    """
+    Lay the sections out in one buffer behind the header.
+    """
+    orderings = [struct.pack(f"<{len(numbers)}I", *numbers) for numbers in orderings]
+    records_at = _align(HEADER.size)
+    orderings_at = _align(records_at + len(records))
+    position = orderings_at + ORDERING.size * len(ORDERING_SLOTS)
+    table = bytearray()
+    for ordering in orderings:
+        position = _align(position)
+        table += ORDERING.pack(position, len(ordering) // 4)
+        position += len(ordering)
+    words_at = _align(position)
+    postings_at = _align(words_at + len(words))
+    heap_at = _align(postings_at + 4 * len(postings))
+
+    modified = (modified - EPOCH) // MICROSECOND if modified else -1
+    buffer = bytearray(heap_at + len(heap))
+    HEADER.pack_into(
+        buffer, 0,
+        MAGIC, FORMAT_VERSION, todo_count, word_count, last_id, version, modified,
+        records_at, orderings_at, words_at, postings_at, heap_at,
+    )
+    buffer[records_at:records_at + len(records)] = records
+    buffer[orderings_at:orderings_at + len(table)] = table
+    for (offset, _), ordering in zip(ORDERING.iter_unpack(table), orderings):
+        buffer[offset:offset + len(ordering)] = ordering
+    buffer[words_at:words_at + len(words)] = words
+    buffer[postings_at:postings_at + 4 * len(postings)] = struct.pack(f"<{len(postings)}I", *postings)
+    buffer[heap_at:] = heap
+    return buffer
+
+
+def _publish(path: Path, buffer: bytes, fsync: bool) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if fsync:
+            fsync_directory(path.parent)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+class _OrderingView(Sequence):
+    """
+    The ordering keys of one stored ordering, decoded on access.
+    """
+
+    def __init__(self, snapshot: "Snapshot", numbers: memoryview, sort_key: SortKey):
+        self._snapshot = snapshot
+        self._numbers = numbers
+        self._sort_key = sort_key
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __getitem__(self, i: int) -> OrderingKey:
+        return self._snapshot.ordering_key(self._numbers[i], self._sort_key)
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot file mapped into memory.
+
+    The mapping lives as long as the object, so a reader can finish with an
+    old snapshot while a new one is published under the same name.
+    """
+
+    def __init__(self, path: Path):
+        with path.open("rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._map)
+        (
+            magic, version, self.count, self._word_count, self.last_id, self.version, modified,
+            self._records_at, orderings_at, self._words_at, postings_at, self._heap_at,
+        ) = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a snapshot of format {FORMAT_VERSION}")
+        self.modified: datetime | None = epoch_us_to_datetime(modified) if modified >= 0 else None
+
+        self._orderings = {}
+        for slot, (offset, count) in zip(
+            ORDERING_SLOTS, ORDERING.iter_unpack(self._buffer[orderings_at:orderings_at + ORDERING.size * len(ORDERING_SLOTS)])
+        ):
+            self._orderings[slot] = self._buffer[offset:offset + 4 * count].cast("I")
+        self._postings = self._buffer[postings_at:self._heap_at].cast("I")
+
+    # -------------------------
+    # Records
+    # -------------------------
+    def _string(self, offset: int, length: int) -> str | None:
+        if length == NONE:
+            return None
+        start = self._heap_at + offset
+        return str(self._buffer[start:start + length], "utf-8")
+
+    def todo(self, number: int, details: bool = True) -> Todo:
+        """
+        Decode a record. Without details it is a summary and the description
+        is not read.
+        """
+        (
+            todo_id, created, due, completed, version,
+            title_at, title_length, key_at, key_length, description_at, description_length,
+        ) = RECORD.unpack_from(self._buffer, self._records_at + number * RECORD.size)
+        return Todo.from_fields(
+            id=todo_id,
+            title=self._string(title_at, title_length),
+            titleKey=self._string(key_at, key_length),
+            description=self._string(description_at, description_length) if details else None,
+            dueDateOrdinal=due or None,
+            isCompleted=bool(completed),
+            createdAtUs=created,
+            version=version,
+        )
+
+    def _id(self, number: int) -> int:
+        return struct.unpack_from("<q", self._buffer, self._records_at + number * RECORD.size)[0]
+
+    def find(self, todo_id: int) -> int | None:
+        """
+        Return the record number of a todo, or None if it is not stored.
+        """
+        number = bisect_left(range(self.count), todo_id, key=self._id)
+        if number < self.count and self._id(number) == todo_id:
+            return number
+        return None
+
+    def todos(self) -> Iterator[Todo]:
+        for number in range(self.count):
+            yield self.todo(number)
+
+    # -------------------------
+    # Orderings and search
+    # -------------------------
+    def ordering_key(self, number: int, sort_key: SortKey) -> OrderingKey:
+        todo_id, created, due, _, _, _, _, key_at, key_length, _, _ = RECORD.unpack_from(
+            self._buffer, self._records_at + number * RECORD.size
+        )
+        if sort_key == SortKey.CREATED_AT:
+            return created, todo_id
+        if sort_key == SortKey.DUE_DATE:
+            return due, todo_id
+        return self._string(key_at, key_length), todo_id
+
+    def segment(self, number: int, sort_key: SortKey) -> int:
+        if sort_key != SortKey.DUE_DATE:
+            return 0
+        due = struct.unpack_from("<i", self._buffer, self._records_at + number * RECORD.size + 16)[0]
+        return 0 if due else 1
+
+    def completed(self, number: int) -> bool:
+        return bool(self._buffer[self._records_at + number * RECORD.size + 20])
+
+    def ordering(self, completed: bool, sort_key: SortKey, segment: int) -> Sequence[OrderingKey]:
+        return _OrderingView(self, self._orderings[(completed, sort_key, segment)], sort_key)
+
+    def _word(self, i: int) -> str:
+        offset, length, _, _ = WORD.unpack_from(self._buffer, self._words_at + i * WORD.size)
+        return self._string(offset, length)
+
+    def search(self, query: str) -> set[int] | None:
+        """
+        Return the record numbers of the todos containing a word starting
+        with each word of the query, or None when the query has no words.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        matches = []
+        for term in dict.fromkeys(terms):
+            numbers = set()
+            i = bisect_left(range(self._word_count), term, key=self._word)
+            while i < self._word_count:
+                offset, length, first, count = WORD.unpack_from(self._buffer, self._words_at + i * WORD.size)
+                if not self._string(offset, length).startswith(term):
+                    break
+                numbers.update(self._postings[first:first + count])
+                i += 1
+            if not numbers:
+                return set()
+            matches.append(numbers)
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:])
+
+
+class SnapshotChanges:
+    """
+    Changes to a published snapshot, for writing the next one.
+
+    It offers the change methods of TodoCollection. A todo is decoded only
+    when a change reads it, and write_changes() copies all other records as
+    they are stored.
+    """
+
+    def __init__(self, base: Snapshot | None):
+        self.base = base
+        self.last_id = base.last_id if base is not None else 0
+        self.version = base.version if base is not None else 0
+        self.modified = base.modified if base is not None else None
+        # The new state of the todos that were added or changed, by id
+        self.changed: dict[int, Todo] = {}
+        # Ids of the deleted todos
+        self.removed: set[int] = set()
+        self._read: dict[int, Todo] = {}
+
+    def get(self, todo_id: int) -> Todo:
+        todo = self.changed.get(todo_id)
+        if todo is None:
+            todo = self._read.get(todo_id)
+        if todo is None:
+            number = self.base.find(todo_id) if self.base is not None and todo_id not in self.removed else None
+            if number is None:
+                raise KeyError(f"Todo {todo_id} not found")
+            todo = self._read[todo_id] = self.base.todo(number)
+        return todo
+
+    def touch(self) -> None:
+        self.version += 1
+        self.modified = datetime.now(UTC)
+
+    def next_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def put(self, todo: Todo) -> None:
+        self.changed[todo.id] = todo
+        self.removed.discard(todo.id)
+        if todo.id > self.last_id:
+            self.last_id = todo.id
+
+    def update(self, todo_id: int, **changes) -> Todo:
+        todo = self.get(todo_id)
+        for name, value in changes.items():
+            setattr(todo, name, value)
+        self.changed[todo_id] = todo
+        return todo
+
+    def remove(self, todo_id: int) -> Todo:
+        todo = self.get(todo_id)
+        self.changed.pop(todo_id, None)
+        self.removed.add(todo_id)
+        return todo
+
+    def collection(self) -> TodoCollection:
+        """
+        The changed snapshot as a collection, decoding every todo.
+        """
+        stored = self.base.todos() if self.base is not None else ()
+        todos = [todo for todo in stored if todo.id not in self.changed and todo.id not in self.removed]
+        return TodoCollection(
+            [*todos, *self.changed.values()], last_id=self.last_id, version=self.version, modified=self.modified
+        )
+
+
+def _live_bytes(snapshot: Snapshot) -> int:
+    """
+    The heap bytes of the strings a snapshot refers to, roughly: strings
+    shared by several references count once per reference.
+    """
+    live = 0
+    records = snapshot._buffer[snapshot._records_at:snapshot._records_at + snapshot.count * RECORD.size]
+    for *_, title_length, key_at, key_length, _, description_length in RECORD.iter_unpack(records):
+        live += title_length + key_length + (description_length if description_length != NONE else 0)
+    words = snapshot._buffer[snapshot._words_at:snapshot._words_at + snapshot._word_count * WORD.size]
+    return live + sum(length for _, length, _, _ in WORD.iter_unpack(words))
+
+
+def write_changes(path: Path, changes: SnapshotChanges, fsync: bool = False) -> int:
+    """
+    Write the snapshot changes were made to with the changes applied, like
+    write_snapshot(). Returns the number of bytes written.
+
+    The records of the untouched todos, their strings, orderings and
+    postings are copied from the base snapshot without decoding them, only
+    renumbered around the changed todos. Strings of changed or deleted
+    todos stay behind in the heap until it is mostly garbage, the whole
+    snapshot is then rewritten.
+    """
+    base = changes.base
+    if base is None or len(base._buffer) - base._heap_at > max(2 * _live_bytes(base), HEAP_COMPACT_MIN_BYTES):
+        return write_snapshot(path, changes.collection(), fsync)
+
+    heap = _Heap(base._buffer[base._heap_at:])
+    touched = {
+        number for todo_id in (*changes.changed, *changes.removed)
+        if (number := base.find(todo_id)) is not None
+    }
+    added = sorted(changes.changed.values(), key=lambda t: t.id)
+    # Record number in the base snapshot each added todo goes before
+    positions = [bisect_left(range(base.count), todo.id, key=base._id) for todo in added]
+
+    # Records: runs of untouched base records, with the added ones in between
+    renumber = [-1] * base.count
+    numbers: dict[int, int] = {}
+    records = bytearray()
+    start = number = 0
+    i = 0
+    for cut in sorted(touched | set(positions) | {base.count}):
+        if cut > start:
+            records += base._buffer[base._records_at + start * RECORD.size:base._records_at + cut * RECORD.size]
+            renumber[start:cut] = range(number, number + cut - start)
+            number += cut - start
+        while i < len(added) and positions[i] == cut:
+            numbers[added[i].id] = number
+            records += _pack_record(added[i], heap)
+            number += 1
+            i += 1
+        start = cut + 1 if cut in touched else cut
+
+    # Orderings: the base ones renumbered, the added todos inserted by key
+    inserts: dict[tuple[bool, SortKey, int], list[tuple[OrderingKey, int]]] = {}
+    for todo in added:
+        for sort_key, segment, key in ordering_keys(todo):
+            inserts.setdefault((todo.isCompleted, sort_key, segment), []).append((key, numbers[todo.id]))
+    orderings = []
+    for slot in ORDERING_SLOTS:
+        stored = base._orderings[slot]
+        view = base.ordering(*slot)
+        ordering = []
+        start = 0
+        for key, added_number in sorted(inserts.get(slot, ())):
+            at = bisect_left(view, key)
+            ordering.extend(n for n in (renumber[n] for n in stored[start:at]) if n >= 0)
+            ordering.append(added_number)
+            start = at
+        ordering.extend(n for n in (renumber[n] for n in stored[start:]) if n >= 0)
+        orderings.append(ordering)
+
+    # Words: the base ones with their postings renumbered, merged with the
+    # words of the added todos
+    added_words: dict[str, list[int]] = {}
+    for todo in added:
+        for word in dict.fromkeys((*tokenize(todo.title), *tokenize(todo.description))):
+            added_words.setdefault(word, []).append(numbers[todo.id])
+    word_inserts: dict[int, list[str]] = {}
+    for word in sorted(added_words):
+        word_inserts.setdefault(bisect_left(range(base._word_count), word, key=base._word), []).append(word)
+    words = bytearray()
+    postings: list[int] = []
+    word_count = 0
+
+    def add_word(spot: tuple[int, int], word_postings: list[int]) -> None:
+        nonlocal words, word_count
+        if word_postings:
+            words += WORD.pack(*spot, len(postings), len(word_postings))
+            postings.extend(word_postings)
+            word_count += 1
+
+    for w in range(base._word_count + 1):
+        stored_word = None
+        for word in word_inserts.get(w, ()):
+            if w < base._word_count and word == base._word(w):
+                # Merged into the stored word below
+                stored_word = word
+            else:
+                add_word(heap.place(word), added_words[word])
+        if w == base._word_count:
+            break
+        offset, length, first, posting_count = WORD.unpack_from(base._buffer, base._words_at + w * WORD.size)
+        word_postings = [n for n in (renumber[n] for n in base._postings[first:first + posting_count]) if n >= 0]
+        if stored_word is not None:
+            word_postings = sorted(word_postings + added_words[stored_word])
+        add_word((offset, length), word_postings)
+
+    buffer = _assemble(
+        number, word_count, changes.last_id, changes.version, changes.modified,
+        records, orderings, words, postings, heap.data,
+    )
+    _publish(path, buffer, fsync)
+    return len(buffer)
@@ -0,0 +1,294 @@
+import os
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, TypeVar
+from ..metrics import count
+from ..models.bulk_result import BulkResult
+from ..models.data_version import DataVersion
+from ..models.todo import Todo
+from ..models.todo_page import TodoPage
+from ..models.list_options import Status, SortKey, Order, Cursor, DueWindow, today_ordinal
+from .file_lock import LOCK_SUFFIX, file_lock
+from .file_todo_repository import FileTodoRepository
+from .group_commit import FsyncSchedule, GroupCommit, PendingChange
+from .pagination import Position, SEGMENTS, due_counts, due_runs, paginate, run_ids, walk_runs
+from .snapshot import Snapshot, SnapshotChanges, write_changes, write_snapshot
+from .todo_collection import TodoCollection
+from .todo_repository import TodoRepository, check_version
+from app.constants import FSYNC_NEVER
+
+SNAPSHOT_SUFFIX = ".snapshot"
+
+Result = TypeVar("Result")
+
+
+class SnapshotTodoRepository(TodoRepository):
+    """
+    Stores todos in a binary snapshot file next to the data file, which
+    every worker maps read-only into memory.
+
+    Reads decode just the records they return, so the workers share one
+    copy of the data through the page cache instead of each holding a parsed
+    collection. A change rebuilds the snapshot under an exclusive file lock
+    and publishes it by renaming it into place. Readers notice the new inode
+    and map the new file, while reads in flight finish on the old mapping.
+    Changes of concurrent threads share one rebuild (see GroupCommit).
+
+    On first use an existing JSON data file is imported.
+    """
+
+    def __init__(self, data_file: str, commit_window_ms: float = 0, fsync_policy: str = FSYNC_NEVER):
+        self.data_file_path = Path(data_file)
+        self.snapshot_file_path = self.data_file_path.with_name(self.data_file_path.name + SNAPSHOT_SUFFIX)
+        self.lock_file_path = self.snapshot_file_path.with_name(self.snapshot_file_path.name + LOCK_SUFFIX)
+        self._snapshot: Snapshot | None = None
+        self._lock = threading.Lock()
+        self._group = GroupCommit(self._commit_group, commit_window_ms / 1000)
+        self._fsync = FsyncSchedule(fsync_policy)
+
+    @contextmanager
+    def _writer_lock(self) -> Iterator[None]:
+        """
+        Serialize changes between the threads and the processes of a server.
+        """
+        with self._lock, file_lock(self.lock_file_path):
+            yield
+
+    def _current(self) -> Snapshot | None:
+        """
+        Return the mapping of the latest published snapshot.
+        """
+        try:
+            inode = os.stat(self.snapshot_file_path).st_ino
+        except FileNotFoundError:
+            if not self.data_file_path.exists():
+                return None
+            self._import_data_file()
+            inode = os.stat(self.snapshot_file_path).st_ino
+
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.inode != inode:
+            # Swapping the reference is atomic, readers holding the old
+            # snapshot keep using it until they are done
+            snapshot = self._snapshot = Snapshot(self.snapshot_file_path)
+            count("todo_file_loads_total")
+        return snapshot
+
+    def _import_data_file(self) -> None:
+        with self._writer_lock():
+            if self.snapshot_file_path.exists():
+                return
+            source = FileTodoRepository(str(self.data_file_path))
+            data_version = source.version()
+            collection = TodoCollection(
+                source.list_all(), last_id=source.last_id,
+                version=data_version.version, modified=data_version.modified,
+            )
+            count("todo_bytes_written_total", write_snapshot(self.snapshot_file_path, collection))
+
+    def _change(self, change: Callable[[SnapshotChanges], tuple[Result, bool]]) -> Result:
+        """
+        Apply change to the latest collection and publish the result as a new
+        snapshot if change reports that anything changed.
+        """
+        return self._group.submit(change)
+
+    def _commit_group(self, changes: list[PendingChange]) -> None:
+        # Imports the data file first if there is no snapshot yet, which
+        # takes the writer lock of its own
+        self._current()
+        with self._writer_lock():
+            # Only the todos the changes read are decoded
+            todos = SnapshotChanges(self._current())
+            changed = [change.apply(todos) for change in changes]
+            if any(changed):
+                todos.touch()
+                fsync = self._fsync.due()
+                count("todo_bytes_written_total", write_changes(self.snapshot_file_path, todos, fsync))
+                count("todo_commits_total")
+                count("todo_committed_changes_total", len(changes))
+                if fsync:
+                    count("todo_fsyncs_total")
+
+    def version(self) -> DataVersion:
+        snapshot = self._current()
+        if snapshot is None:
+            return DataVersion()
+        return DataVersion(snapshot.version, snapshot.modified)
+
+    def todo_version(self, todo_id: int) -> int:
+        return self.get(todo_id).version
+
+    def count(self) -> int:
+        snapshot = self._current()
+        return snapshot.count if snapshot is not None else 0
+
+    # -------------------------
+    # List / filter / sort
+    # -------------------------
+    def list_all(self) -> List[Todo]:
+        page = self._page(Status.ALL, SortKey.CREATED_AT, Order.DESC, max(self.count(), 1), None, None, DueWindow.ANY, lazy=False, details=True)
+        return list(page.items)
+
+    def iter_all(self) -> Iterator[Todo]:
+        # A published snapshot never changes, its records are decoded one by one
+        page = self._page(Status.ALL, SortKey.CREATED_AT, Order.ASC, max(self.count(), 1), None, None, DueWindow.ANY, lazy=True, details=True)
+        return iter(page.items)
+
+    def list_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        return self._page(status, sort_key, order, page_size, cursor, query, due, lazy=False)
+
+    def iter_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        # Records are decoded while the page is iterated
+        return self._page(status, sort_key, order, page_size, cursor, query, due, lazy=True)
+
+    @staticmethod
+    def _states(status: Status) -> list[bool]:
+        return {Status.PENDING: [False], Status.COMPLETED: [True]}.get(status, [False, True])
+
+    def due_counts(self, status: Status) -> dict[DueWindow, int]:
+        snapshot = self._current()
+        if snapshot is None:
+            return dict.fromkeys((DueWindow.OVERDUE, DueWindow.TODAY, DueWindow.UPCOMING, DueWindow.NONE), 0)
+        ordering = lambda completed, segment: snapshot.ordering(completed, SortKey.DUE_DATE, segment)
+        return due_counts(ordering, self._states(status), today_ordinal())
+
+    def _page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None,
+        query: str | None,
+        due: DueWindow,
+        lazy: bool,
+        details: bool = False,
+    ) -> TodoPage:
+        """
+        One page of todos, summaries unless details are asked for.
+        """
+        snapshot = self._current()
+        if snapshot is None:
+            return TodoPage()
+        states = self._states(status)
+        matches = snapshot.search(query) if query else None
+        window = None
+        if due != DueWindow.ANY:
+            ordering = lambda completed, segment: snapshot.ordering(completed, SortKey.DUE_DATE, segment)
+            window = due_runs(ordering, states, due, today_ordinal())
+        if window is not None and matches is None and sort_key == SortKey.DUE_DATE:
+            # The window is a range of the due date ordering
+            runs = window
+        elif window is None and matches is None:
+            def runs(segment: int) -> list:
+                return [snapshot.ordering(completed, sort_key, segment) for completed in states]
+        else:
+            if window is not None:
+                in_window = {snapshot.find(todo_id) for todo_id in run_ids(window, SortKey.DUE_DATE)}
+                matches = in_window if matches is None else matches & in_window
+            # The matches get their own ordering, sorted once for this page
+            segments = [[] for _ in range(SEGMENTS[sort_key])]
+            for number in matches:
+                if snapshot.completed(number) in states:
+                    segments[snapshot.segment(number, sort_key)].append(snapshot.ordering_key(number, sort_key))
+            for keys in segments:
+                keys.sort()
+            runs = lambda segment: [segments[segment]]
+
+        def walk(start: Position | None, backward: bool, limit: int) -> Iterator[tuple[Position, Todo]]:
+            for position in islice(walk_runs(runs, sort_key, order == Order.DESC, start, backward), limit):
+                yield position, snapshot.todo(snapshot.find(position[1][1]), details)
+
+        return paginate(walk, sort_key, page_size, cursor, lazy=lazy)
+
+    # -------------------------
+    # CRUD
+    # -------------------------
+    def get(self, todo_id: int) -> Todo:
+        snapshot = self._current()
+        number = snapshot.find(todo_id) if snapshot is not None else None
+        if number is None:
+            raise KeyError(f"Todo {todo_id} not found")
+        return snapshot.todo(number)
+
+    def add(self, todo: Todo) -> Todo:
+        return self.add_many([todo])[0]
+
+    def update(self, updated_todo: Todo, expected_version: int | None = None) -> Todo:
+        return self._change(lambda todos: (_update(todos, updated_todo, expected_version), True))
+
+    def set_completed(self, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+        return self._change(lambda todos: (_set_completed(todos, todo_id, completed, expected_version), True))
+
+    def delete(self, todo_id: int) -> None:
+        self._change(lambda todos: (todos.remove(todo_id), True))
+
+    # -------------------------
+    # Bulk changes, each batch published as one snapshot
+    # -------------------------
+    def add_many(self, todos: Iterable[Todo]) -> List[Todo]:
+        added = list(todos)
+
+        def change(collection: SnapshotChanges) -> tuple[List[Todo], bool]:
+            for todo in added:
+                todo.id = collection.next_id()
+                collection.put(todo)
+            return added, bool(added)
+
+        return self._change(change)
+
+    def update_many(self, updated_todos: Iterable[Todo]) -> BulkResult:
+        by_id = {t.id: t for t in updated_todos}
+        return self._change_many(by_id, lambda todos, todo_id: _update(todos, by_id[todo_id]))
+
+    def set_completed_many(self, todo_ids: Iterable[int], completed: bool) -> BulkResult:
+        return self._change_many(todo_ids, lambda todos, todo_id: _set_completed(todos, todo_id, completed))
+
+    def delete_many(self, todo_ids: Iterable[int]) -> BulkResult:
+        return self._change_many(todo_ids, lambda todos, todo_id: todos.remove(todo_id))
+
+    def _change_many(self, todo_ids: Iterable[int], change: Callable[[SnapshotChanges, int], object]) -> BulkResult:
+        def change_all(todos: SnapshotChanges) -> tuple[BulkResult, bool]:
+            result = self._each(todo_ids, lambda todo_id: change(todos, todo_id))
+            return result, bool(result.succeeded)
+
+        return self._change(change_all)
+
+
+def _update(todos: SnapshotChanges, updated_todo: Todo, expected_version: int | None = None) -> Todo:
+    version = todos.get(updated_todo.id).version
+    check_version(updated_todo.id, version, expected_version)
+    return todos.update(
+        updated_todo.id,
+        title=updated_todo.title,
+        description=updated_todo.description,
+        dueDate=updated_todo.dueDate,
+        version=version + 1,
+    )
+
+
+def _set_completed(todos: SnapshotChanges, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+    version = todos.get(todo_id).version
+    check_version(todo_id, version, expected_version)
+    return todos.update(todo_id, isCompleted=bool(completed), version=version + 1)
@@ -0,0 +1,505 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, UTC
+from pathlib import Path
+from typing import Iterable, Iterator, List
+from ..models.bulk_result import BulkResult
+from ..models.data_version import DataVersion
+from ..models.todo import Todo, epoch_us_to_datetime, iso_to_epoch_us
+from ..models.todo_page import TodoPage
+from ..models.list_options import Status, SortKey, Order, Cursor, DueWindow, due_range, today_ordinal
+from .pagination import Position, SEGMENTS, Walk, paginate
+from .text_index import tokenize, words
+from .todo_repository import ITER_CHUNK_SIZE, TodoRepository, VersionConflict
+from app.constants import FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_NEVER
+
+# The description is the last column. Reads of the other columns then stop
+# before it and never touch the overflow pages long descriptions spill into.
+TODOS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    titleKey TEXT NOT NULL,
+    dueDate TEXT,
+    isCompleted INTEGER NOT NULL DEFAULT 0,
+    createdAt TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    description TEXT
+);
+"""
+
+SCHEMA = TODOS_TABLE.format(name="todos") + """
+-- Single row holding the collection version, bumped by every write
+CREATE TABLE IF NOT EXISTS todos_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    modified TEXT
+);
+INSERT OR IGNORE INTO todos_meta (id, version, modified) VALUES (1, 0, NULL);
+-- Full-text index of titles and descriptions, kept in step by triggers. It
+-- indexes the words of text_index.tokenize(), which todo_words() joins with
+-- spaces, and the ascii tokenizer only splits them at the spaces again, so
+-- the words and the search terms are normalised by the same Python code.
+CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5 (
+    words, content='', tokenize='ascii'
+);
+CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+    INSERT INTO todos_fts (rowid, words) VALUES (new.id, todo_words(new.title, new.description));
+END;
+CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+    INSERT INTO todos_fts (todos_fts, rowid, words) VALUES ('delete', old.id, todo_words(old.title, old.description));
+END;
+CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF title, description ON todos BEGIN
+    INSERT INTO todos_fts (todos_fts, rowid, words) VALUES ('delete', old.id, todo_words(old.title, old.description));
+    INSERT INTO todos_fts (rowid, words) VALUES (new.id, todo_words(new.title, new.description));
+END;
+CREATE INDEX IF NOT EXISTS idx_todos_created ON todos (createdAt, id);
+CREATE INDEX IF NOT EXISTS idx_todos_due ON todos (dueDate, id);
+CREATE INDEX IF NOT EXISTS idx_todos_title ON todos (titleKey, id);
+CREATE INDEX IF NOT EXISTS idx_todos_status_created ON todos (isCompleted, createdAt, id);
+CREATE INDEX IF NOT EXISTS idx_todos_status_due ON todos (isCompleted, dueDate, id);
+CREATE INDEX IF NOT EXISTS idx_todos_status_title ON todos (isCompleted, titleKey, id);
+"""
+
+COLUMNS = "id, title, description, dueDate, isCompleted, createdAt, version"
+# Columns of the summaries returned by listings
+SUMMARY_COLUMNS = "id, title, dueDate, isCompleted, createdAt, version"
+
+# Per sort key, the (filter, sort column) of each ordering segment. Items
+# without a due date form their own segment ordered by id only.
+SEGMENT_SQL = {
+    SortKey.CREATED_AT: [("1", "createdAt")],
+    SortKey.DUE_DATE: [("dueDate IS NOT NULL", "dueDate"), ("dueDate IS NULL", None)],
+    SortKey.TITLE: [("1", "titleKey")],
+}
+
+# Per sort column, conversions of its stored text to the sort values of the
+# other storage modes and back, so a cursor means the same in every mode
+SORT_VALUES = {
+    "createdAt": (iso_to_epoch_us, lambda value: epoch_us_to_datetime(value).isoformat()),
+    "dueDate": (lambda value: date.fromisoformat(value).toordinal(), lambda value: date.fromordinal(value).isoformat()),
+}
+# Sort values of the other columns are used as they are
+SAME_SORT_VALUE = (lambda value: value, lambda value: value)
+
+STATUS_SQL = {
+    Status.PENDING: "isCompleted = 0",
+    Status.COMPLETED: "isCompleted = 1",
+}
+
+
+def _due_filter(due: DueWindow, today: int) -> tuple[str, list]:
+    """
+    The WHERE clause and parameters selecting the items of a due window.
+    Due dates are ISO strings, which compare like the dates.
+    """
+    if due == DueWindow.NONE:
+        return "dueDate IS NULL", []
+    bounds = due_range(due, today)
+    if bounds is None:
+        return "1", []
+    first, end = bounds
+    clauses, params = ["dueDate IS NOT NULL"], []
+    if first is not None:
+        clauses.append("dueDate >= ?")
+        params.append(date.fromordinal(first).isoformat())
+    if end is not None:
+        clauses.append("dueDate < ?")
+        params.append(date.fromordinal(end).isoformat())
+    return " AND ".join(clauses), params
+
+
+# SQLite's own setting for each fsync policy. In WAL mode NORMAL syncs at
+# checkpoints, so recent commits may be lost on power failure, not corrupted.
+SYNCHRONOUS = {FSYNC_ALWAYS: "FULL", FSYNC_BATCHED: "NORMAL", FSYNC_NEVER: "OFF"}
+
+
+def _to_todo(row: sqlite3.Row) -> Todo:
+    # Summaries are selected without the description
+    return Todo(
+        id=row["id"],
+        title=row["title"],
+        description=row["description"] if "description" in row.keys() else None,
+        dueDate=row["dueDate"],
+        isCompleted=bool(row["isCompleted"]),
+        createdAt=row["createdAt"],
+        version=row["version"],
+    )
+
+
+class SqliteTodoRepository(TodoRepository):
+    """
+    Stores todos in a SQLite database in WAL mode.
+
+    Filtering, sorting, keyset pagination and point lookups are answered by
+    SQL queries on indexed columns, so nothing is kept resident in the worker.
+    SQLite locks and syncs the writes itself, fsync_policy picks its
+    synchronous setting.
+    """
+
+    def __init__(self, db_file: str, fsync_policy: str = FSYNC_BATCHED):
+        if fsync_policy not in SYNCHRONOUS:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.db_file_path = Path(db_file)
+        self.synchronous = SYNCHRONOUS[fsync_policy]
+        # sqlite3 connections must not be shared between threads or forked
+        # processes, so every thread of every worker opens its own one.
+        self._local = threading.local()
+        conn = self._connection()
+        # Databases created before todos were versioned lack the column
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(todos)")]
+        if columns and "version" not in columns:
+            with conn:
+                conn.execute("ALTER TABLE todos ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            columns.append("version")
+        if columns and columns[-1] != "description":
+            self._move_description_last(conn)
+        trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'todos_fts_insert'").fetchone()
+        indexed = trigger is not None and "todo_words" in trigger["sql"]
+        if not indexed:
+            # Older databases indexed the text with SQLite's own tokenizer,
+            # or had no full-text index at all
+            with conn:
+                for trigger_name in ("todos_fts_insert", "todos_fts_delete", "todos_fts_update"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+                conn.execute("DROP TABLE IF EXISTS todos_fts")
+        conn.executescript(SCHEMA)
+        if not indexed:
+            # Index the rows stored before this full-text index existed
+            with conn:
+                conn.execute("INSERT INTO todos_fts (rowid, words) SELECT id, todo_words(title, description) FROM todos")
+
+    @staticmethod
+    def _move_description_last(conn: sqlite3.Connection) -> None:
+        """
+        Rebuild a todos table of older databases with the description as the
+        last column. Ids, the id counter and the full-text index stay valid.
+        """
+        names = "id, title, titleKey, dueDate, isCompleted, createdAt, version, description"
+        with conn:
+            seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'todos'").fetchone()
+            conn.execute(TODOS_TABLE.format(name="todos_rebuilt"))
+            conn.execute(f"INSERT INTO todos_rebuilt ({names}) SELECT {names} FROM todos")
+            # Dropping the table drops its triggers and indexes, SCHEMA
+            # creates them again
+            conn.execute("DROP TABLE todos")
+            conn.execute("ALTER TABLE todos_rebuilt RENAME TO todos")
+            if seq is not None:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'todos'", (seq[0],))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            if not self.db_file_path.parent.is_dir():
+                self.db_file_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_file_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # Used by the triggers keeping the full-text index up to date
+            conn.create_function("todo_words", 2, words, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _fetch(self, todo_id: int) -> Todo:
+        row = self._connection().execute(
+            f"SELECT {COLUMNS} FROM todos WHERE id = ?", (todo_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Todo {todo_id} not found")
+        return _to_todo(row)
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection) -> None:
+        """
+        Bump the collection version inside the current write transaction.
+        """
+        conn.execute(
+            "UPDATE todos_meta SET version = version + 1, modified = ? WHERE id = 1",
+            (datetime.now(UTC).isoformat(),),
+        )
+
+    def version(self) -> DataVersion:
+        row = self._connection().execute(
+            "SELECT version, modified FROM todos_meta WHERE id = 1"
+        ).fetchone()
+        modified = datetime.fromisoformat(row["modified"]) if row["modified"] else None
+        return DataVersion(row["version"], modified)
+
+    def todo_version(self, todo_id: int) -> int:
+        row = self._connection().execute(
+            "SELECT version FROM todos WHERE id = ?", (todo_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Todo {todo_id} not found")
+        return row["version"]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+
+    # -------------------------
+    # List / filter / sort
+    # -------------------------
+    def list_all(self) -> List[Todo]:
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM todos ORDER BY createdAt DESC, id DESC"
+        )
+        return [_to_todo(row) for row in rows]
+
+    def iter_all(self) -> Iterator[Todo]:
+        # Keyset chunks, so no read transaction stays open while the rows
+        # are consumed
+        rows = self._connection().execute(
+            f"SELECT {COLUMNS} FROM todos ORDER BY createdAt, id LIMIT ?", (ITER_CHUNK_SIZE,)
+        ).fetchall()
+        while rows:
+            yield from (_to_todo(row) for row in rows)
+            last = rows[-1]
+            rows = self._connection().execute(
+                f"SELECT {COLUMNS} FROM todos WHERE (createdAt, id) > (?, ?) ORDER BY createdAt, id LIMIT ?",
+                (last["createdAt"], last["id"], ITER_CHUNK_SIZE),
+            ).fetchall()
+
+    def list_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        return paginate(self._walk(status, sort_key, order, query, due), sort_key, page_size, cursor)
+
+    def iter_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        # Rows are fetched from the SQLite cursor while the page is iterated
+        return paginate(self._walk(status, sort_key, order, query, due), sort_key, page_size, cursor, lazy=True)
+
+    def due_counts(self, status: Status) -> dict[DueWindow, int]:
+        # Each count is a range of the (isCompleted, dueDate) index
+        today = today_ordinal()
+        counts = {}
+        for window in (DueWindow.OVERDUE, DueWindow.TODAY, DueWindow.UPCOMING, DueWindow.NONE):
+            due_filter, params = _due_filter(window, today)
+            counts[window] = self._connection().execute(
+                f"SELECT COUNT(*) FROM todos WHERE {STATUS_SQL.get(status, '1')} AND {due_filter}", params
+            ).fetchone()[0]
+        return counts
+
+    def _walk(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> Walk:
+        due_filter, filter_params = _due_filter(due, today_ordinal())
+        status_filter = f"{STATUS_SQL.get(status, '1')} AND {due_filter}"
+        # Every word of the query as a quoted prefix term. Words are letters
+        # and digits only, so they need no further escaping.
+        terms = " ".join(f'"{word}"*' for word in tokenize(query))
+        if terms:
+            status_filter += " AND id IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?)"
+            filter_params.append(terms)
+
+        def walk(start: Position | None, backward: bool, limit: int) -> Iterator[tuple[Position, Todo]]:
+            segments = range(SEGMENTS[sort_key])
+            reverse = order == Order.DESC
+            if backward:
+                segments = reversed(segments)
+                reverse = not reverse
+            direction, compare = ("DESC", "<") if reverse else ("ASC", ">")
+
+            for segment in segments:
+                if limit <= 0:
+                    return
+                if start is not None and segment != start[0] and (segment < start[0]) != backward:
+                    continue
+                segment_filter, column = SEGMENT_SQL[sort_key][segment]
+                from_column, to_column = SORT_VALUES.get(column, SAME_SORT_VALUE)
+                clauses = [status_filter, segment_filter]
+                params = list(filter_params)
+                if start is not None and segment == start[0]:
+                    value, todo_id = start[1]
+                    if column is None:
+                        clauses.append(f"id {compare} ?")
+                        params.append(todo_id)
+                    else:
+                        clauses.append(f"({column}, id) {compare} (?, ?)")
+                        params += [to_column(value), todo_id]
+                order_by = f"id {direction}" if column is None else f"{column} {direction}, id {direction}"
+                select = column or "0"
+                params.append(limit)
+
+                # Streamed pages may be walked by another thread than the
+                # one that created them, so the connection is looked up here
+                rows = self._connection().execute(
+                    f"SELECT {SUMMARY_COLUMNS}, {select} AS sortValue FROM todos"
+                    f" WHERE {' AND '.join(clauses)} ORDER BY {order_by} LIMIT ?",
+                    params,
+                )
+                for row in rows:
+                    limit -= 1
+                    yield (segment, (from_column(row["sortValue"]), row["id"])), _to_todo(row)
+
+        return walk
+
+    # -------------------------
+    # CRUD
+    # -------------------------
+    def get(self, todo_id: int) -> Todo:
+        return self._fetch(todo_id)
+
+    def add(self, todo: Todo) -> Todo:
+        return self.add_many([todo])[0]
+
+    def update(self, updated_todo: Todo, expected_version: int | None = None) -> Todo:
+        conn = self._connection()
+        with conn:
+            self._update(conn, updated_todo, expected_version)
+            self._touch(conn)
+            return self._fetch(updated_todo.id)
+
+    def set_completed(self, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+        conn = self._connection()
+        with conn:
+            self._set_completed(conn, todo_id, completed, expected_version)
+            self._touch(conn)
+            return self._fetch(todo_id)
+
+    def delete(self, todo_id: int) -> None:
+        conn = self._connection()
+        with conn:
+            self._delete(conn, todo_id)
+            self._touch(conn)
+
+    # -------------------------
+    # Bulk changes, each batch in one transaction
+    # -------------------------
+    def add_many(self, todos: Iterable[Todo]) -> List[Todo]:
+        todos = list(todos)
+        conn = self._connection()
+        with conn:
+            for todo in todos:
+                # AUTOINCREMENT never hands out the id of a deleted row again
+                cur = conn.execute(
+                    "INSERT INTO todos (title, titleKey, description, dueDate, isCompleted, createdAt)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (todo.title, todo.titleKey, todo.description,
+                     todo.dueDate, int(todo.isCompleted), todo.createdAt),
+                )
+                todo.id = cur.lastrowid
+            if todos:
+                self._touch(conn)
+        return todos
+
+    def update_many(self, updated_todos: Iterable[Todo]) -> BulkResult:
+        by_id = {t.id: t for t in updated_todos}
+        return self._change_many(by_id, lambda conn, todo_id: self._update(conn, by_id[todo_id]))
+
+    def set_completed_many(self, todo_ids: Iterable[int], completed: bool) -> BulkResult:
+        return self._change_many(todo_ids, lambda conn, todo_id: self._set_completed(conn, todo_id, completed))
+
+    def delete_many(self, todo_ids: Iterable[int]) -> BulkResult:
+        return self._change_many(todo_ids, self._delete)
+
+    def _change_many(self, todo_ids: Iterable[int], change) -> BulkResult:
+        conn = self._connection()
+        with conn:
+            result = self._each(todo_ids, lambda todo_id: change(conn, todo_id))
+            if result.succeeded:
+                self._touch(conn)
+        return result
+
+    # -------------------------
+    # Single row changes, raising KeyError for missing ids and
+    # VersionConflict for rows at another version than expected
+    # -------------------------
+    @staticmethod
+    def _not_changed(conn: sqlite3.Connection, todo_id: int, expected_version: int | None) -> Exception:
+        """
+        The error for an UPDATE of one row that changed nothing.
+        """
+        row = conn.execute("SELECT version FROM todos WHERE id = ?", (todo_id,)).fetchone()
+        if row is None:
+            return KeyError(f"Todo {todo_id} not found")
+        return VersionConflict(todo_id, expected_version, row[0])
+
+    @staticmethod
+    def _update(conn: sqlite3.Connection, updated_todo: Todo, expected_version: int | None = None) -> None:
+        # The version is compared in the UPDATE itself, so no other
+        # transaction gets between the check and the change
+        cur = conn.execute(
+            "UPDATE todos SET title = ?, titleKey = ?, description = ?, dueDate = ?,"
+            " version = version + 1 WHERE id = ? AND (? IS NULL OR version = ?)",
+            (updated_todo.title, updated_todo.titleKey, updated_todo.description,
+             updated_todo.dueDate, updated_todo.id, expected_version, expected_version),
+        )
+        if cur.rowcount == 0:
+            raise SqliteTodoRepository._not_changed(conn, updated_todo.id, expected_version)
+
+    @staticmethod
+    def _set_completed(
+        conn: sqlite3.Connection, todo_id: int, completed: bool, expected_version: int | None = None
+    ) -> None:
+        cur = conn.execute(
+            "UPDATE todos SET isCompleted = ?, version = version + 1"
+            " WHERE id = ? AND (? IS NULL OR version = ?)",
+            (int(bool(completed)), todo_id, expected_version, expected_version),
+        )
+        if cur.rowcount == 0:
+            raise SqliteTodoRepository._not_changed(conn, todo_id, expected_version)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, todo_id: int) -> None:
+        cur = conn.execute("DELETE FROM todos WHERE id = ?", (todo_id,))
+        if cur.rowcount == 0:
+            raise KeyError(f"Todo {todo_id} not found")
+
+    # -------------------------
+    # Migration
+    # -------------------------
+    def import_todos(self, todos: Iterable[Todo], last_id: int = 0) -> int:
+        """
+        Insert todos keeping their ids, in a single transaction.
+
+        last_id raises the id counter, so ids that were used and deleted in
+        the source are not handed out again. Returns the number imported.
+        """
+        conn = self._connection()
+        with conn:
+            count = 0
+            for todo in todos:
+                conn.execute(
+                    f"INSERT INTO todos ({COLUMNS}, titleKey) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (todo.id, todo.title, todo.description, todo.dueDate,
+                     int(todo.isCompleted), todo.createdAt, todo.version, todo.titleKey),
+                )
+                count += 1
+            self._touch(conn)
+            if last_id:
+                conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'todos'", (last_id,)
+                )
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT 'todos', ?"
+                    " WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'todos')",
+                    (last_id,),
+                )
+        return count
+
+    def is_empty(self) -> bool:
+        return self._connection().execute("SELECT 1 FROM todos LIMIT 1").fetchone() is None
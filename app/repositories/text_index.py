@@ -0,0 +1,98 @@
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator
+
+# Words are runs of letters and digits
+_WORD = re.compile(r"[^\W_]+")
+
+def tokenize(text: str | None) -> list[str]:
+    """
+    Split text into words, normalised to NFKC and case-folded, so "Straße"
+    and "STRASSE" or a composed and a decomposed "é" are the same word.
+    Every backend indexes and searches the words this returns.
+    """
+    return _WORD.findall(unicodedata.normalize("NFKC", text).casefold()) if text else []
+
+
+def words(*texts: str | None) -> str:
+    """
+    The words of texts as one string, separated by spaces.
+    """
+    return " ".join(word for text in texts for word in tokenize(text))
+
+
+class TextIndex:
+    """
+    Inverted index from words to the ids of the todos containing them.
+
+    The vocabulary is kept sorted, so the words starting with a prefix are a
+    contiguous range found by binary search. A query costs time in the number
+    of matching words and ids, not in the number of indexed todos.
+
+    The words of every todo are kept as well, so a todo can be removed
+    without its texts, which may no longer be loaded.
+    """
+
+    def __init__(self, documents: Iterable[tuple[int, Iterable[str | None]]] = ()):
+        self._postings: dict[str, set[int]] = {}
+        self._documents: dict[int, tuple[str, ...]] = {}
+        # Bulk build: sort the vocabulary once instead of inserting word by word
+        for todo_id, texts in documents:
+            words = self._documents[todo_id] = self._words_of(texts)
+            for word in words:
+                self._postings.setdefault(word, set()).add(todo_id)
+        self._words: list[str] = sorted(self._postings)
+
+    @staticmethod
+    def _words_of(texts: Iterable[str | None]) -> tuple[str, ...]:
+        return tuple(dict.fromkeys(word for text in texts for word in tokenize(text)))
+
+    def add(self, todo_id: int, *texts: str | None) -> None:
+        words = self._documents[todo_id] = self._words_of(texts)
+        for word in words:
+            ids = self._postings.get(word)
+            if ids is None:
+                ids = self._postings[word] = set()
+                insort(self._words, word)
+            ids.add(todo_id)
+
+    def remove(self, todo_id: int) -> None:
+        for word in self._documents.pop(todo_id, ()):
+            ids = self._postings.get(word)
+            if ids is None:
+                continue
+            ids.discard(todo_id)
+            if not ids:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def items(self) -> Iterator[tuple[str, set[int]]]:
+        """
+        Yield (word, ids) in word order.
+        """
+        for word in self._words:
+            yield word, self._postings[word]
+
+    def _prefixed(self, prefix: str) -> Iterable[set[int]]:
+        i = bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            yield self._postings[self._words[i]]
+            i += 1
+
+    def search(self, query: str) -> set[int] | None:
+        """
+        Return the ids of the todos containing a word starting with each
+        word of the query, or None when the query has no words.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        matches = []
+        for term in dict.fromkeys(terms):
+            ids = set().union(*self._prefixed(term))
+            if not ids:
+                return set()
+            matches.append(ids)
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:])
@@ -0,0 +1,358 @@
+from datetime import datetime, UTC
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+from ..models.todo import Todo
+from ..models.todo_page import TodoPage
+from ..models.list_options import Status, SortKey, Order, Cursor, DueWindow, today_ordinal
+from .pagination import OrderingKey, Position, SEGMENTS, due_counts, due_runs, paginate, run_ids, walk_runs
+from .text_index import TextIndex
+
+def ordering_keys(todo: Todo) -> Iterator[tuple[SortKey, int, OrderingKey]]:
+    """
+    Yield the (sort key, segment, ordering key) entries of a todo.
+    """
+    yield SortKey.CREATED_AT, 0, (todo.createdAtUs, todo.id)
+    if todo.dueDateOrdinal is not None:
+        yield SortKey.DUE_DATE, 0, (todo.dueDateOrdinal, todo.id)
+    else:
+        yield SortKey.DUE_DATE, 1, (0, todo.id)
+    yield SortKey.TITLE, 0, (todo.titleKey, todo.id)
+
+def _texts(todo: Todo) -> tuple[str, str | None]:
+    """
+    The searchable texts of a todo.
+    """
+    return todo.title, todo.description
+
+# Loads the descriptions of summaries, by id
+Details = Callable[[list[Todo]], dict[int, str]]
+
+def _no_details(summaries: list[Todo]) -> dict[int, str]:
+    raise ValueError("The collection holds summaries but has no way to load their details")
+
+def _lookup(parts: list["TodoCollection"], todo_id: int) -> Todo:
+    """
+    Find a todo in the first of the collections holding it.
+    """
+    for part in parts:
+        todo = part._by_id.get(todo_id)
+        if todo is not None:
+            return todo
+    raise KeyError(f"Todo {todo_id} not found")
+
+class TodoCollection:
+    """
+    In-memory set of todos indexed by id.
+
+    Keeps the insertion order of the data file and a high-water mark of
+    allocated ids, so ids are never handed out twice even after the item
+    with the highest id was deleted.
+
+    For every sort key and completion state it also maintains a presorted
+    ordering that is updated on each change, so listing never has to sort,
+    and a word index of titles and descriptions for searching.
+
+    It may hold summaries, todos whose description was left in the storage.
+    The word index is then built on the first search, reading their
+    descriptions through details, so listings never load them.
+
+    version and modified describe the last change of the whole collection.
+    """
+
+    def __init__(
+        self,
+        todos: Iterable[Todo] = (),
+        last_id: int = 0,
+        version: int = 0,
+        modified: datetime | None = None,
+        details: Details = _no_details,
+    ):
+        self._by_id: dict[int, Todo] = {}
+        # (isCompleted, sort key) -> segments of sorted ordering keys
+        self._orderings: dict[tuple[bool, SortKey], list[list[OrderingKey]]] = {
+            (completed, sort_key): [[] for _ in range(segments)]
+            for completed in (False, True)
+            for sort_key, segments in SEGMENTS.items()
+        }
+        self.last_id = last_id
+        self.version = version
+        self.modified = modified
+
+        todos = list(todos)
+        for todo in todos:
+            self._by_id[todo.id] = todo
+            if todo.id > self.last_id:
+                self.last_id = todo.id
+        # Bulk build: sort once instead of inserting one by one
+        for todo in self._by_id.values():
+            for sort_key, segment, key in ordering_keys(todo):
+                self._orderings[(todo.isCompleted, sort_key)][segment].append(key)
+        for segments in self._orderings.values():
+            for keys in segments:
+                keys.sort()
+        self._details = details
+        self._text: TextIndex | None = None
+        # Word index of an earlier load, with the todo versions it was up to
+        # date with, brought up to date on the first search
+        self._earlier_text: tuple[TextIndex, dict[int, int]] | None = None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Todo]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, todo_id: int) -> bool:
+        return todo_id in self._by_id
+
+    # -------------------------
+    # Orderings
+    # -------------------------
+    def _index(self, todo: Todo) -> None:
+        for sort_key, segment, key in ordering_keys(todo):
+            insort(self._orderings[(todo.isCompleted, sort_key)][segment], key)
+
+    def _unindex(self, todo: Todo) -> None:
+        for sort_key, segment, key in ordering_keys(todo):
+            keys = self._orderings[(todo.isCompleted, sort_key)][segment]
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    @staticmethod
+    def _states(status: Status) -> list[bool]:
+        if status == Status.PENDING:
+            return [False]
+        if status == Status.COMPLETED:
+            return [True]
+        return [False, True]
+
+    def _parts(self, states: list[bool], archive: "TodoCollection | None") -> list["TodoCollection"]:
+        """
+        The collections a listing of the given states reads. The archive
+        only holds completed todos.
+        """
+        return [self] if archive is None or True not in states else [self, archive]
+
+    @staticmethod
+    def _runs(parts: list["TodoCollection"], states: list[bool], sort_key: SortKey) -> Callable[[int], list[list[OrderingKey]]]:
+        """
+        Return runs(segment) for walk_runs() over the orderings of the
+        given states in all parts.
+        """
+        def runs(segment: int) -> list[list[OrderingKey]]:
+            return [part._orderings[(completed, sort_key)][segment] for part in parts for completed in states]
+
+        return runs
+
+    @staticmethod
+    def _matching_orderings(
+        parts: list["TodoCollection"], ids: set[int], states: list[bool], sort_key: SortKey
+    ) -> list[list[OrderingKey]]:
+        """
+        Build the segments of sorted ordering keys of the todos with the
+        given ids and states. Sorts just those, so it costs time in their
+        number rather than in the size of the collection.
+        """
+        segments = [[] for _ in range(SEGMENTS[sort_key])]
+        for todo_id in ids:
+            todo = _lookup(parts, todo_id)
+            if todo.isCompleted in states:
+                for key_sort, segment, key in ordering_keys(todo):
+                    if key_sort == sort_key:
+                        segments[segment].append(key)
+        for keys in segments:
+            keys.sort()
+        return segments
+
+    def ordering(self, completed: bool, sort_key: SortKey, segment: int) -> list[OrderingKey]:
+        """
+        The sorted ordering keys of one segment of the todos with the given
+        completion state. Must not be modified.
+        """
+        return self._orderings[(completed, sort_key)][segment]
+
+    def _due_ordering(self, completed: bool, segment: int) -> list[OrderingKey]:
+        return self._orderings[(completed, SortKey.DUE_DATE)][segment]
+
+    def due_counts(self, status: Status) -> dict[DueWindow, int]:
+        """
+        The number of todos with the given status in each due window.
+        """
+        return due_counts(self._due_ordering, self._states(status), today_ordinal())
+
+    def take_text_index(self, earlier: "TodoCollection") -> None:
+        """
+        Take over the word index of earlier, a previous load of the same
+        storage. The first search then indexes just the todos added or
+        changed since instead of reading every description again.
+        """
+        if earlier._text is not None:
+            self._earlier_text = (earlier._text, {todo.id: todo.version for todo in earlier})
+            earlier._text = None
+        elif earlier._earlier_text is not None:
+            self._earlier_text, earlier._earlier_text = earlier._earlier_text, None
+
+    def _text_index(self) -> TextIndex:
+        if self._text is None and self._earlier_text is not None:
+            text, versions = self._earlier_text
+            self._earlier_text = None
+            for todo_id in versions.keys() - self._by_id.keys():
+                text.remove(todo_id)
+            changed = [todo for todo in self._by_id.values() if versions.get(todo.id) != todo.version]
+            summaries = [todo for todo in changed if todo.detailsAt is not None]
+            descriptions = self._details(summaries) if summaries else {}
+            for todo in changed:
+                text.remove(todo.id)
+                text.add(todo.id, todo.title, descriptions.get(todo.id, todo.description))
+            self._text = text
+        if self._text is None:
+            summaries = [todo for todo in self._by_id.values() if todo.detailsAt is not None]
+            descriptions = self._details(summaries) if summaries else {}
+            self._text = TextIndex(
+                (todo.id, (todo.title, descriptions.get(todo.id, todo.description)))
+                for todo in self._by_id.values()
+            )
+        return self._text
+
+    def _index_text(self, todo: Todo) -> None:
+        if self._text is not None:
+            description = todo.description
+            if todo.detailsAt is not None:
+                description = self._details([todo]).get(todo.id)
+            self._text.add(todo.id, todo.title, description)
+
+    def words(self) -> Iterator[tuple[str, set[int]]]:
+        """
+        The word index: each indexed word, in sorted order, with the ids of
+        the todos containing it.
+        """
+        return self._text_index().items()
+
+    def ordered(
+        self, status: Status, sort_key: SortKey, order: Order, archive: "TodoCollection | None" = None
+    ) -> Iterator[Todo]:
+        """
+        Walk all todos with the given status in sort order, merged with the
+        archived ones.
+        """
+        states = self._states(status)
+        parts = self._parts(states, archive)
+        for _, (_, todo_id) in walk_runs(self._runs(parts, states, sort_key), sort_key, order == Order.DESC):
+            yield _lookup(parts, todo_id)
+
+    def page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+        archive: "TodoCollection | None" = None,
+    ) -> TodoPage:
+        """
+        Return one page of todos with the given status in sort order,
+        restricted to the ones matching the search query and to the ones
+        in the due window if given.
+
+        The todos of archive, a collection of completed todos moved out of
+        this one, are merged in.
+        """
+        states = self._states(status)
+        parts = self._parts(states, archive)
+        reverse = order == Order.DESC
+        matches = None
+        if query:
+            found = [part._text_index().search(query) for part in parts]
+            # None when the query has no words, the same for every part
+            matches = None if found[0] is None else set().union(*found)
+        window = None
+        if due != DueWindow.ANY:
+            windows = [due_runs(part._due_ordering, states, due, today_ordinal()) for part in parts]
+            window = windows[0] if len(windows) == 1 else (
+                lambda segment: [keys for runs in windows for keys in runs(segment)]
+            )
+        if window is not None and matches is None and sort_key == SortKey.DUE_DATE:
+            # The window is a range of the due date ordering
+            runs = window
+        elif window is not None or matches is not None:
+            if window is not None:
+                in_window = run_ids(window, SortKey.DUE_DATE)
+                matches = in_window if matches is None else matches & in_window
+            # The matches get their own ordering, sorted once for this page
+            segments = self._matching_orderings(parts, matches, states, sort_key)
+            runs = lambda segment: [segments[segment]]
+        else:
+            runs = self._runs(parts, states, sort_key)
+
+        def walk(start: Position | None, backward: bool, limit: int) -> list[tuple[Position, Todo]]:
+            positions = islice(walk_runs(runs, sort_key, reverse, start, backward), limit)
+            return [(position, _lookup(parts, position[1][1])) for position in positions]
+
+        return paginate(walk, sort_key, page_size, cursor)
+
+    # -------------------------
+    # CRUD
+    # -------------------------
+    def get(self, todo_id: int) -> Todo:
+        try:
+            return self._by_id[todo_id]
+        except KeyError:
+            raise KeyError(f"Todo {todo_id} not found") from None
+
+    def touch(self) -> None:
+        """
+        Record a change of the collection.
+        """
+        self.version += 1
+        self.modified = datetime.now(UTC)
+
+    def next_id(self) -> int:
+        """
+        Allocate a new id.
+        """
+        self.last_id += 1
+        return self.last_id
+
+    def put(self, todo: Todo) -> None:
+        """
+        Insert a todo, or replace the one with the same id.
+        """
+        existing = self._by_id.get(todo.id)
+        if existing is not None:
+            self._unindex(existing)
+            if self._text is not None:
+                self._text.remove(existing.id)
+        self._by_id[todo.id] = todo
+        self._index(todo)
+        self._index_text(todo)
+        if todo.id > self.last_id:
+            self.last_id = todo.id
+
+    def update(self, todo_id: int, **changes) -> Todo:
+        """
+        Change fields of a stored todo in place.
+        """
+        todo = self.get(todo_id)
+        texts = (*_texts(todo), todo.detailsAt)
+        self._unindex(todo)
+        for name, value in changes.items():
+            setattr(todo, name, value)
+        self._index(todo)
+        if self._text is not None and (*_texts(todo), todo.detailsAt) != texts:
+            self._text.remove(todo.id)
+            self._index_text(todo)
+        return todo
+
+    def remove(self, todo_id: int) -> Todo:
+        try:
+            todo = self._by_id.pop(todo_id)
+        except KeyError:
+            raise KeyError(f"Todo {todo_id} not found") from None
+        self._unindex(todo)
+        if self._text is not None:
+            self._text.remove(todo.id)
+        return todo
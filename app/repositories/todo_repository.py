@@ -0,0 +1,183 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List
+from ..models.bulk_result import BulkResult
+from ..models.data_version import DataVersion
+from ..models.todo import Todo
+from ..models.todo_page import TodoPage
+from ..models.list_options import Status, SortKey, Order, Cursor, DueWindow
+
+# Number of todos iter_all() reads at a time
+ITER_CHUNK_SIZE = 500
+
+
+class VersionConflict(Exception):
+    """
+    Raised by a change that was made against another version of the todo
+    than the stored one, which is left as it is.
+    """
+
+    def __init__(self, todo_id: int, expected: int, current: int):
+        super().__init__(f"Todo {todo_id} is at version {current}, the change was made at {expected}")
+        self.todo_id = todo_id
+        self.expected = expected
+        self.current = current
+
+
+def check_version(todo_id: int, current: int, expected: int | None) -> None:
+    """
+    Raise VersionConflict unless expected is None or the current version.
+    """
+    if expected is not None and expected != current:
+        raise VersionConflict(todo_id, expected, current)
+
+
+class TodoRepository(ABC):
+    """
+    Storage of todo items.
+
+    Implementations own persistence, id allocation and the filtered, sorted
+    and paginated reads, so each backend can answer them in the cheapest
+    way it has. Lookups of missing ids raise KeyError.
+
+    update() and set_completed() take the version of the todo the change was
+    made at. They compare it with the stored version and make the change in
+    the same step, raising VersionConflict if the two differ. Without an
+    expected version the change overwrites whatever is stored.
+
+    Listed todos are summaries: their description may be left out (None),
+    so listings do not depend on the size of descriptions. get() and
+    list_all() return whole todos.
+    """
+
+    @abstractmethod
+    def list_all(self) -> List[Todo]:
+        """
+        Return all todos, newest first.
+        """
+
+    def iter_all(self) -> Iterator[Todo]:
+        """
+        Yield all whole todos, oldest first, reading them in chunks, so they
+        are never all in memory at once. Todos changed meanwhile may be
+        yielded before or after the change.
+        """
+        return reversed(self.list_all())
+
+    @abstractmethod
+    def list_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        """
+        Return one keyset page of the todos with the given status. With a
+        query, only todos whose title or description has a word starting
+        with each of its words are listed. With a due window, only todos
+        due in it are listed.
+        """
+
+    def iter_page(
+        self,
+        status: Status,
+        sort_key: SortKey,
+        order: Order,
+        page_size: int,
+        cursor: Cursor | None = None,
+        query: str | None = None,
+        due: DueWindow = DueWindow.ANY,
+    ) -> TodoPage:
+        """
+        Like list_page(), but the page may produce its items lazily while it
+        is iterated. Its cursors are only final once the items are exhausted.
+        """
+        return self.list_page(status, sort_key, order, page_size, cursor, query, due)
+
+    @abstractmethod
+    def due_counts(self, status: Status) -> dict[DueWindow, int]:
+        """
+        Return the number of todos with the given status in each due window
+        (all but DueWindow.ANY), relative to the current date.
+        """
+
+    @abstractmethod
+    def version(self) -> DataVersion:
+        """
+        Return the version of the whole collection. It grows with every
+        change, so it can validate anything derived from the collection.
+        """
+
+    @abstractmethod
+    def todo_version(self, todo_id: int) -> int:
+        """
+        Return the version of one todo without loading the rest of it.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Return the number of stored todos.
+        """
+
+    def count_unarchived(self) -> int:
+        """
+        Like count(), but leaves out archived todos, so it never reads an
+        archive. Backends without one count everything.
+        """
+        return self.count()
+
+    @abstractmethod
+    def get(self, todo_id: int) -> Todo:
+        ...
+
+    @abstractmethod
+    def add(self, todo: Todo) -> Todo:
+        """
+        Store a new todo under a newly allocated id. Ids are never reused.
+        """
+
+    @abstractmethod
+    def update(self, updated_todo: Todo, expected_version: int | None = None) -> Todo:
+        """
+        Replace the title, description and due date of a stored todo.
+        """
+
+    @abstractmethod
+    def set_completed(self, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+        ...
+
+    @abstractmethod
+    def delete(self, todo_id: int) -> None:
+        ...
+
+    # Bulk changes. The defaults apply the changes one by one, backends
+    # override them to apply a whole batch in one pass with one write.
+
+    def add_many(self, todos: Iterable[Todo]) -> List[Todo]:
+        return [self.add(todo) for todo in todos]
+
+    def update_many(self, updated_todos: Iterable[Todo]) -> BulkResult:
+        by_id = {t.id: t for t in updated_todos}
+        return self._each(by_id, lambda todo_id: self.update(by_id[todo_id]))
+
+    def set_completed_many(self, todo_ids: Iterable[int], completed: bool) -> BulkResult:
+        return self._each(todo_ids, lambda todo_id: self.set_completed(todo_id, completed))
+
+    def delete_many(self, todo_ids: Iterable[int]) -> BulkResult:
+        return self._each(todo_ids, self.delete)
+
+    @staticmethod
+    def _each(todo_ids: Iterable[int], change) -> BulkResult:
+        result = BulkResult()
+        for todo_id in dict.fromkeys(todo_ids):
+            try:
+                change(todo_id)
+            except KeyError:
+                result.not_found.append(todo_id)
+            else:
+                result.succeeded.append(todo_id)
+        return result
@@ -1,122 +1,123 @@
-import json
-import os
-from typing import List
-from pathlib import Path
+from typing import Iterable, Iterator, List
+from ..models.bulk_result import BulkResult
+from ..models.data_version import DataVersion
 from ..models.todo import Todo
-from ..models.list_options import ListOptions
-from app.constants import CHARACTER_ENCODING
+from ..models.todo_page import TodoPage
+from ..models.list_options import ListOptions, Status, SortKey, Order, Cursor, DueWindow
+from ..repositories.todo_repository import TodoRepository
+
 
 class TodoService:
-    def __init__(self, data_file: str):
-        self.data_file_path = Path(data_file)
+    """
+    Todo use cases on top of a pluggable storage repository.
+    """
 
-    # -------------------------
-    # Persistence helpers
-    # -------------------------
-    def _load(self) -> List[Todo]:
-        if not self.data_file_path.exists():
-            return []
-        with self.data_file_path.open("r", encoding=CHARACTER_ENCODING) as f:
-            data = json.load(f)
-        return [Todo(**item) for item in data]
-
-    def _save(self, todos: List[Todo]) -> None:
-        # Ensure parent directory exists
-        if not self.data_file_path.parent.is_dir():
-            self.data_file_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.data_file_path.open("w", encoding=CHARACTER_ENCODING) as f:
-            json.dump([t.to_dict() for t in todos], f, indent=2)
+    def __init__(self, repository: TodoRepository):
+        self.repository = repository
 
     # -------------------------
     # List / filter / sort
     # -------------------------
     def list(self) -> List[Todo]:
-        return self.list_filtered()
+        return self.repository.list_all()
+
+    def iter_all(self) -> Iterator[Todo]:
+        """
+        Like list(), but oldest first and read lazily in chunks, for
+        exporting all todos.
+        """
+        return self.repository.iter_all()
+
+    @staticmethod
+    def _page_args(list_options: ListOptions) -> tuple:
+        cursor = Cursor.decode(list_options.cursor) if list_options.cursor else None
+        return (
+            Status(list_options.status),
+            SortKey(list_options.sort),
+            Order(list_options.order),
+            list_options.page_size,
+            cursor,
+            list_options.query,
+            DueWindow(list_options.due),
+        )
 
     def list_filtered(
         self,
         list_options: ListOptions
-    ) -> List[Todo]:
-        todos = self._load()
+    ) -> TodoPage:
+        return self.repository.list_page(*self._page_args(list_options))
 
-        # ---- filter ----
-        status = list_options.status
-        if status == "completed":
-            todos = [t for t in todos if t.isCompleted]
-        elif status in ("pending", "incomplete"):
-            todos = [t for t in todos if not t.isCompleted]
+    def stream_filtered(
+        self,
+        list_options: ListOptions
+    ) -> TodoPage:
+        """
+        Like list_filtered(), but items may be produced lazily while the page
+        is iterated, for streaming them into the response.
+        """
+        return self.repository.iter_page(*self._page_args(list_options))
 
-        # ---- sort ----
-        sort_key = list_options.sort
-        reverse = list_options.order == "desc"
+    def due_counts(self, list_options: ListOptions) -> dict[DueWindow, int]:
+        """
+        The number of todos of each due window, among those with the status
+        of the list options.
+        """
+        return self.repository.due_counts(Status(list_options.status))
 
-        if sort_key == "title":
-            todos.sort(key=lambda t: (t.title or "").lower(), reverse=reverse)
+    def version(self) -> DataVersion:
+        return self.repository.version()
 
-        elif sort_key == "duedate":
-            # Items without dueDate always go last
-            todos.sort(
-                key=lambda t: (t.dueDate is None, t.dueDate or ""),
-                reverse=reverse,
-            )
+    def todo_version(self, todo_id: int) -> int:
+        return self.repository.todo_version(todo_id)
 
-        else:  # createdAt
-            todos.sort(key=lambda t: t.createdAt or "", reverse=reverse)
+    def count(self) -> int:
+        return self.repository.count()
 
-        return todos
+    def count_unarchived(self) -> int:
+        return self.repository.count_unarchived()
 
     # -------------------------
     # CRUD
     # -------------------------
     def get(self, todo_id: int) -> Todo:
-        for todo in self._load():
-            if todo.id == todo_id:
-                return todo
-        raise KeyError(f"Todo {todo_id} not found")
+        return self.repository.get(todo_id)
 
     def add(
         self,
         todo: Todo
     ) -> Todo:
-        todos = self._load()
-        next_id = max((t.id for t in todos), default=0) + 1
-
-        todo.id=next_id
-
-        todos.append(todo)
-        self._save(todos)
-        return todo
+        return self.repository.add(todo)
 
     def update(
         self,
-        updated_todo: Todo
+        updated_todo: Todo,
+        expected_version: int | None = None,
     ) -> Todo:
-        todos = self._load()
-        for todo in todos:
-            if todo.id == updated_todo.id:
-                todo.title = updated_todo.title
-                todo.description = updated_todo.description
-                todo.dueDate = updated_todo.dueDate
-                self._save(todos)
-                return todo
-
-        raise KeyError(f"Todo {updated_todo.id} not found")
-
-    def set_completed(self, todo_id: int, completed: bool) -> Todo:
-        todos = self._load()
-        for todo in todos:
-            if todo.id == todo_id:
-                todo.isCompleted = bool(completed)
-                self._save(todos)
-                return todo
-
-        raise KeyError(f"Todo {todo_id} not found")
+        """
+        Raises VersionConflict if the todo is no longer at expected_version.
+        """
+        return self.repository.update(updated_todo, expected_version)
+
+    def set_completed(self, todo_id: int, completed: bool, expected_version: int | None = None) -> Todo:
+        """
+        Raises VersionConflict if the todo is no longer at expected_version.
+        """
+        return self.repository.set_completed(todo_id, completed, expected_version)
 
     def delete(self, todo_id: int) -> None:
-        todos = self._load()
-        remaining = [t for t in todos if t.id != todo_id]
+        self.repository.delete(todo_id)
+
+    # -------------------------
+    # Bulk changes
+    # -------------------------
+    def add_many(self, todos: Iterable[Todo]) -> List[Todo]:
+        return self.repository.add_many(todos)
+
+    def update_many(self, updated_todos: Iterable[Todo]) -> BulkResult:
+        return self.repository.update_many(updated_todos)
 
-        if len(remaining) == len(todos):
-            raise KeyError(f"Todo {todo_id} not found")
+    def set_completed_many(self, todo_ids: Iterable[int], completed: bool) -> BulkResult:
+        return self.repository.set_completed_many(todo_ids, completed)
 
-        self._save(remaining)
+    def delete_many(self, todo_ids: Iterable[int]) -> BulkResult:
+        return self.repository.delete_many(todo_ids)
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, TextIO
+from werkzeug.datastructures import MultiDict
+from ..forms.todo_form import TodoForm
+from ..models.import_result import ImportResult, RejectedRecord
+from ..models.todo import Todo, iso_to_epoch_us
+from .todo_service import TodoService
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+# Media type of each format
+MEDIA_TYPES = {
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv",
+}
+
+# Fields of an exported todo, in CSV column order
+FIELDS = ("id", "title", "description", "dueDate", "isCompleted", "createdAt", "version")
+# Fields checked by TodoForm, the others are optional and ids are always
+# newly allocated
+FORM_FIELDS = ("title", "description", "dueDate")
+
+# Number of valid records added with one write
+IMPORT_CHUNK_SIZE = 5000
+# Number of rejected records described in an ImportResult
+MAX_REPORTED_ERRORS = 100
+# Characters of exported text collected before they are handed out
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+_TRUE = ("true", "1", "yes")
+_FALSE = ("false", "0", "no", "")
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict | None]]:
+    """
+    Yield the (line number, record) pairs of an NDJSON or CSV stream. A
+    line that is not a JSON object gives None.
+    """
+    if fmt == FORMAT_CSV:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    if fmt != FORMAT_NDJSON:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def _flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = "" if value is None else str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError("isCompleted: Not a valid boolean value.")
+
+
+def _to_todo(form: TodoForm, record: dict | None) -> Todo:
+    """
+    Validate a record with the rules of the add form. Raises ValueError
+    describing every invalid field.
+    """
+    if record is None:
+        raise ValueError("Not a JSON object.")
+    form.process(formdata=MultiDict({
+        name: str(record[name]) for name in FORM_FIELDS if record.get(name) is not None
+    }))
+    if not form.validate():
+        raise ValueError(" ".join(
+            f"{name}: {message}" for name, messages in form.errors.items() for message in messages
+        ))
+    todo = form.to_model()
+    todo.isCompleted = _flag(record.get("isCompleted"))
+    created_at = record.get("createdAt")
+    if created_at:
+        try:
+            iso_to_epoch_us(str(created_at))
+        except ValueError:
+            raise ValueError("createdAt: Not a valid datetime value.") from None
+        todo.createdAt = str(created_at)
+    return todo
+
+
+def import_todos(
+    service: TodoService,
+    stream: TextIO,
+    fmt: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> ImportResult:
+    """
+    Add the todos of an NDJSON or CSV stream.
+
+    Records are validated like the add form and the valid ones are added in
+    chunks of chunk_size, each with one write that allocates their ids, so
+    only one chunk is held in memory. A chunk that was added stays added
+    when a later one fails.
+    """
+    result = ImportResult()
+    # One form validates every record, which saves building it each time
+    form = TodoForm(formdata=None, meta={"csrf": False})
+    chunk: list[Todo] = []
+    for number, record in read_records(stream, fmt):
+        try:
+            chunk.append(_to_todo(form, record))
+        except ValueError as e:
+            result.rejected += 1
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append(RejectedRecord(number, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            result.imported += len(service.add_many(chunk))
+            chunk = []
+    if chunk:
+        result.imported += len(service.add_many(chunk))
+    return result
+
+
+def _csv_row(todo: Todo) -> tuple:
+    return (
+        todo.id, todo.title, todo.description or "", todo.dueDate or "",
+        "true" if todo.isCompleted else "false", todo.createdAt, todo.version,
+    )
+
+
+def export_todos(todos: Iterable[Todo], fmt: str) -> Iterator[str]:
+    """
+    Yield the todos as NDJSON or CSV text, in pieces of about
+    EXPORT_BUFFER_SIZE characters.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if fmt == FORMAT_CSV:
+        writer.writerow(FIELDS)
+    for todo in todos:
+        if fmt == FORMAT_CSV:
+            writer.writerow(_csv_row(todo))
+        else:
+            buffer.write(json.dumps(todo.to_dict(), separators=(",", ":")) + "\n")
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,7 @@
+"""ASGI entrypoint for production servers"""
+from app import create_app
+from app.asgi_adapter import ThreadedWsgiToAsgi
+from app.constants import KEY_ASGI_THREADS
+
+flask_app = create_app()
+app = ThreadedWsgiToAsgi(flask_app, flask_app.config[KEY_ASGI_THREADS])
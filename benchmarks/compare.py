@@ -0,0 +1,56 @@
+"""
+Compare two benchmark result files.
+
+Usage: python -m benchmarks.compare BASELINE.json CURRENT.json [--threshold 1.2]
+
+Prints the median time of every benchmark in both runs and their ratio.
+Exits with status 1 when a benchmark got slower than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _key(result: dict) -> tuple:
+    return (result["size"], result["backend"], result["name"], json.dumps(result["params"], sort_keys=True))
+
+
+def _load(path: str) -> dict[tuple, dict]:
+    report = json.loads(Path(path).read_text())
+    return {_key(result): result for result in report["results"]}
+
+
+def compare(baseline: dict[tuple, dict], current: dict[tuple, dict], threshold: float) -> list[tuple]:
+    """
+    Return (key, baseline ms, current ms, ratio) of the benchmarks in both
+    runs that got slower than threshold.
+    """
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before = baseline[key]["median_ms"]
+        after = current[key]["median_ms"]
+        ratio = after / before if before else float("inf")
+        size, backend, name, params = key
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{size:>9} {backend:<8} {name:<22} {params:<70} {before:>10.3f} {after:>10.3f} {ratio:>6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append((key, before, after, ratio))
+    return regressions
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="median time ratio that counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv[1:])
+
+    regressions = compare(_load(args.baseline), _load(args.current), args.threshold)
+    print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
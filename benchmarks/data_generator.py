@@ -0,0 +1,88 @@
+"""
+Synthetic todo collections for benchmarks.
+
+The output is deterministic for a given seed, so runs on different commits
+measure the same data.
+"""
+import json
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, UTC
+from pathlib import Path
+from typing import Iterator
+from app.constants import CHARACTER_ENCODING
+from app.models.todo import Todo
+from app.repositories.file_todo_repository import FileTodoRepository, META_SUFFIX
+
+WORDS = (
+    "buy call email fix plan review write read book pay clean check send "
+    "order update renew prepare schedule cancel return backup deploy test "
+    "milk report invoice car garden kitchen taxes dentist meeting slides "
+    "budget ticket laptop printer flight hotel birthday gift library bank"
+).split()
+
+
+@dataclass(frozen=True)
+class DataSpec:
+    """
+    Shape of a generated collection.
+    """
+    size: int
+    # Share of completed todos
+    completed_ratio: float = 0.3
+    # Share of todos with a due date, spread over due_spread_days from today
+    due_ratio: float = 0.7
+    due_spread_days: int = 365
+    # Average description length in characters, 0 for no descriptions
+    description_length: int = 80
+    seed: int = 0
+
+
+def generate_todos(spec: DataSpec) -> Iterator[Todo]:
+    """
+    Yield spec.size todos with ids 1..size, oldest first.
+    """
+    rng = random.Random(spec.seed)
+    created = datetime(2024, 1, 1, tzinfo=UTC)
+    today = date.today()
+    for todo_id in range(1, spec.size + 1):
+        created += timedelta(seconds=rng.randint(1, 600))
+        due_date = None
+        if rng.random() < spec.due_ratio:
+            due_date = (today + timedelta(days=rng.randint(0, spec.due_spread_days))).isoformat()
+        description = None
+        if spec.description_length:
+            length = rng.randint(spec.description_length // 2, spec.description_length * 3 // 2)
+            description = _text(rng, length)
+        yield Todo(
+            id=todo_id,
+            title=_text(rng, rng.randint(10, 40)).capitalize(),
+            description=description,
+            dueDate=due_date,
+            isCompleted=rng.random() < spec.completed_ratio,
+            createdAt=created.isoformat(),
+        )
+
+
+def _text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def write_data_file(path: Path, spec: DataSpec) -> None:
+    """
+    Write a generated collection as a JSON data file, the way the file
+    storage modes store it, with the descriptions in the details file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding=CHARACTER_ENCODING) as f:
+        json.dump([t.to_dict() for t in generate_todos(spec)], f)
+    meta = {"lastId": spec.size, "version": 1, "modified": datetime.now(UTC).isoformat()}
+    path.with_name(path.name + META_SUFFIX).write_text(json.dumps(meta), encoding=CHARACTER_ENCODING)
+    # Moves the descriptions out of the data file
+    FileTodoRepository(str(path)).compact()
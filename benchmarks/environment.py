@@ -0,0 +1,48 @@
+"""
+Setup shared by the benchmarks: applications on a generated collection and
+the commit the results belong to.
+"""
+import subprocess
+from pathlib import Path
+from flask import Flask
+from app import create_app
+from app.constants import STORAGE_MODE_SQLITE, STORAGE_MODE_SNAPSHOT
+from app.repositories.snapshot_todo_repository import SnapshotTodoRepository
+from app.repositories.sqlite_todo_repository import SqliteTodoRepository
+from .data_generator import DataSpec, generate_todos, write_data_file
+
+
+def create_benchmark_app(backend: str, directory: Path, spec: DataSpec) -> Flask:
+    """
+    An application storing the collection of spec in directory with the
+    given storage mode.
+    """
+    data_file = directory / "todos.json"
+    db_file = directory / "todos.sqlite3"
+    if backend == STORAGE_MODE_SQLITE:
+        SqliteTodoRepository(str(db_file)).import_todos(generate_todos(spec), last_id=spec.size)
+    else:
+        write_data_file(data_file, spec)
+        if backend == STORAGE_MODE_SNAPSHOT:
+            # Publish the snapshot up front, like a server that ran before
+            SnapshotTodoRepository(str(data_file)).count()
+    return create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "SECRET_KEY": "benchmark",
+        "DATA_FILE": str(data_file),
+        "SQLITE_FILE": str(db_file),
+        "STORAGE_MODE": backend,
+    })
+
+
+def git_commit() -> str | None:
+    """
+    The commit checked out, or None outside a git work tree.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,384 @@
+"""
+Load test with concurrent clients replaying a mix of page requests.
+
+Usage: python -m benchmarks.load [--url http://127.0.0.1:8000]
+                                 [--backend json] [--size 1000] [--workers 2]
+                                 [--clients 8] [--duration 10] [--requests N]
+                                 [--mix index=50,view=20,add=10,update=10,complete=5,delete=5]
+                                 [--output results.json]
+
+Without --url the target is built in this process with create_app() on a
+generated collection, --workers apps sharing one data file like the workers
+of a server. With --url it is a running server, e.g. make wsgi.
+
+Every client owns a share of the existing todos and only changes those, so
+once the clients are done the final export must show each of them as its
+client last wrote it. Todos that differ are reported as lost updates.
+Throughput, latency percentiles and errors are written as JSON.
+"""
+import argparse
+import http.client
+import json
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlencode, urlsplit
+from app import create_app
+from app.constants import STORAGE_MODE_JSON
+from .data_generator import DataSpec
+from .environment import create_benchmark_app, git_commit
+
+OPERATIONS = ("index", "view", "add", "update", "complete", "delete")
+DEFAULT_MIX = {"index": 50, "view": 20, "add": 10, "update": 10, "complete": 5, "delete": 5}
+# Statuses of a successful request, changes answer with a redirect
+EXPECTED_STATUS = {
+    "index": (200, 304),
+    "view": (200, 304),
+    "add": (302,),
+    "update": (302,),
+    "complete": (302,),
+    "delete": (302,),
+}
+# Lost updates listed in the report, the count covers all
+MAX_REPORTED_LOST = 20
+CSRF_TOKEN = re.compile(rb'name="csrf_token"[^>]*value="([^"]+)"')
+
+# (status, body) of a request
+Response = tuple[int, bytes]
+Send = Callable[[str, str, dict | None], Response]
+
+
+class AppClient:
+    """
+    Sends requests to an application in this process through its test client.
+    """
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def send(self, method: str, path: str, data: dict | None = None) -> Response:
+        response = self._client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """
+    Sends requests to a running server over one kept-alive connection, with
+    the session cookie the CSRF token is bound to.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self._connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self._prefix = parts.path.rstrip("/")
+        self._cookies: dict[str, str] = {}
+
+    def send(self, method: str, path: str, data: dict | None = None) -> Response:
+        headers = {}
+        if self._cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self._cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            self._connection.request(method, self._prefix + path, body, headers)
+            response = self._connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self._connection.close()
+            raise
+        for header in response.headers.get_all("Set-Cookie") or ():
+            name, _, value = header.split(";", 1)[0].partition("=")
+            self._cookies[name.strip()] = value
+        return response.status, content
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+@dataclass
+class ClientRun:
+    """
+    What one client did: latencies in milliseconds and errors by operation,
+    and the state it last wrote of each todo it owns (None when deleted).
+    """
+    latencies: dict[str, list[float]] = field(default_factory=lambda: {op: [] for op in OPERATIONS})
+    errors: dict[str, int] = field(default_factory=lambda: {op: 0 for op in OPERATIONS})
+    expected: dict[int, dict | None] = field(default_factory=dict)
+    added: list[str] = field(default_factory=list)
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """
+    Parse a mix like "index=50,add=10" into operation weights.
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}")
+        mix[name] = int(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    The p-th percentile (nearest rank) of sorted values.
+    """
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _latency_summary(values: list[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"requests": 0}
+    return {
+        "requests": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def _export(send: Send) -> dict[int, dict]:
+    status, body = send("GET", "/export", None)
+    if status != 200:
+        raise RuntimeError(f"GET /export answered {status}")
+    return {todo["id"]: todo for todo in map(json.loads, body.splitlines()) if todo}
+
+
+def _csrf_token(send: Send) -> str | None:
+    """
+    The CSRF token of the client session, None when CSRF is disabled.
+    """
+    status, body = send("GET", "/add", None)
+    match = CSRF_TOKEN.search(body)
+    return match.group(1).decode() if match else None
+
+
+def run_client(send: Send, number: int, owned: dict[int, dict], mix: dict[str, int],
+               deadline: float, requests: int | None, seed: int) -> ClientRun:
+    """
+    Send requests of the mix until the deadline or the number of requests
+    is reached, and record the state each change should leave behind.
+    """
+    rng = random.Random(seed + number)
+    result = ClientRun(expected={todo_id: dict(todo) for todo_id, todo in owned.items()})
+    live = list(owned)
+    token = _csrf_token(send)
+    operations, weights = zip(*mix.items())
+    sent = 0
+
+    while time.perf_counter() < deadline and (requests is None or sent < requests):
+        op = rng.choices(operations, weights)[0]
+        if op in ("view", "update", "complete", "delete") and not live:
+            op = "index"
+        todo_id = rng.choice(live) if live else None
+        data = None
+        if op == "index":
+            method, path = "GET", "/?" + urlencode({"page_size": 20, "sort": rng.choice(("createdAt", "dueDate", "title"))})
+        elif op == "view":
+            method, path = "GET", f"/view/{todo_id}"
+        elif op == "add":
+            title = f"Load {number}-{sent}"
+            method, path, data = "POST", "/add", {"title": title}
+        elif op == "update":
+            title = f"Updated {number}-{sent}"
+            method, path = "POST", f"/update/{todo_id}"
+            data = {"title": title, "description": result.expected[todo_id].get("description") or "",
+                    "dueDate": result.expected[todo_id].get("dueDate") or ""}
+        else:
+            method, path = "GET", f"/{op}/{todo_id}"
+        if data is not None and token is not None:
+            data["csrf_token"] = token
+
+        started = time.perf_counter()
+        try:
+            status, _ = send(method, path, data)
+        except (OSError, http.client.HTTPException):
+            status = None
+        result.latencies[op].append((time.perf_counter() - started) * 1000)
+        sent += 1
+
+        if status not in EXPECTED_STATUS[op]:
+            result.errors[op] += 1
+            continue
+        if op == "add":
+            result.added.append(title)
+        elif op == "update":
+            result.expected[todo_id]["title"] = title
+        elif op == "complete":
+            result.expected[todo_id]["isCompleted"] = True
+        elif op == "delete":
+            result.expected[todo_id] = None
+            live.remove(todo_id)
+    return result
+
+
+def lost_updates(runs: list[ClientRun], final: dict[int, dict]) -> list[dict]:
+    """
+    Compare the final todos with what the clients last wrote.
+    """
+    lost = []
+    for run in runs:
+        for todo_id, expected in run.expected.items():
+            actual = final.get(todo_id)
+            if expected is None:
+                if actual is not None:
+                    lost.append({"id": todo_id, "expected": "deleted", "found": actual})
+            elif actual is None:
+                lost.append({"id": todo_id, "expected": expected, "found": "missing"})
+            elif (actual["title"], actual["isCompleted"]) != (expected["title"], expected["isCompleted"]):
+                lost.append({"id": todo_id, "expected": expected, "found": actual})
+    titles = {todo["title"] for todo in final.values()}
+    for run in runs:
+        lost += [{"added": title, "found": "missing"} for title in run.added if title not in titles]
+    return lost
+
+
+def run_load(senders: list[Send], clients: int, mix: dict[str, int],
+             duration: float, requests: int | None, seed: int = 0) -> dict:
+    """
+    Run clients concurrent clients, client n sending through
+    senders[n % len(senders)], and report the results.
+    """
+    initial = _export(senders[0])
+    runs: list[ClientRun | None] = [None] * clients
+
+    def client(number: int) -> None:
+        owned = {todo_id: todo for todo_id, todo in initial.items() if todo_id % clients == number}
+        runs[number] = run_client(senders[number % len(senders)], number, owned, mix,
+                                  deadline, requests, seed)
+
+    threads = [threading.Thread(target=client, args=(n,), name=f"load-client-{n}") for n in range(clients)]
+    started = time.perf_counter()
+    deadline = started + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    lost = lost_updates(runs, _export(senders[0]))
+    latencies = {op: [ms for run in runs for ms in run.latencies[op]] for op in OPERATIONS}
+    errors = {op: sum(run.errors[op] for run in runs) for op in OPERATIONS}
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "clients": clients,
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "errors": sum(errors.values()),
+        "latency": {
+            "all": _latency_summary([ms for values in latencies.values() for ms in values]),
+            **{op: {**_latency_summary(latencies[op]), "errors": errors[op]} for op in OPERATIONS if mix.get(op)},
+        },
+        "lost_updates": len(lost),
+        "lost_update_examples": lost[:MAX_REPORTED_LOST],
+    }
+
+
+def in_process_senders(backend: str, directory: Path, spec: DataSpec, workers: int) -> list[Send]:
+    """
+    Build workers apps on one generated collection, each with its own
+    repository, like the workers of a server.
+    """
+    first = create_benchmark_app(backend, directory, spec)
+    config = {key: first.config[key] for key in (
+        "TESTING", "WTF_CSRF_ENABLED", "SECRET_KEY", "DATA_FILE", "SQLITE_FILE", "STORAGE_MODE",
+    )}
+    apps = [first] + [create_app(config) for _ in range(workers - 1)]
+
+    def sender(app) -> Send:
+        # A test client per thread, they keep per-client state
+        local = threading.local()
+
+        def send(method: str, path: str, data: dict | None) -> Response:
+            if not hasattr(local, "client"):
+                local.client = AppClient(app)
+            return local.client.send(method, path, data)
+
+        return send
+
+    return [sender(app) for app in apps]
+
+
+def http_senders(url: str) -> list[Send]:
+    """
+    One sender to a running server, with a connection per thread.
+    """
+    local = threading.local()
+
+    def send(method: str, path: str, data: dict | None) -> Response:
+        if not hasattr(local, "client"):
+            local.client = HttpClient(url)
+        return local.client.send(method, path, data)
+
+    return [send]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--url", help="base URL of a running server, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--backend", default=STORAGE_MODE_JSON, help="storage mode of the in-process target (default: %(default)s)")
+    parser.add_argument("--size", type=int, default=1000, help="todos generated for the in-process target (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=2, help="in-process apps sharing the data (default: %(default)s)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run (default: %(default)s)")
+    parser.add_argument("--requests", type=int, help="requests per client, stops earlier than --duration")
+    parser.add_argument("--mix", default=",".join(f"{op}={weight}" for op, weight in DEFAULT_MIX.items()),
+                        help="operation weights (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DataSpec.seed)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.clients < 1 or args.workers < 1:
+        parser.error("--clients and --workers must be at least 1")
+
+    meta = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.now(UTC).isoformat(),
+        "mix": mix,
+        "duration_s": args.duration,
+        "requests_per_client": args.requests,
+    }
+    if args.url:
+        meta["target"] = args.url
+        result = run_load(http_senders(args.url), args.clients, mix, args.duration, args.requests, args.seed)
+    else:
+        meta["target"] = {"backend": args.backend, "size": args.size, "workers": args.workers}
+        with tempfile.TemporaryDirectory() as directory:
+            senders = in_process_senders(args.backend, Path(directory), DataSpec(size=args.size, seed=args.seed), args.workers)
+            result = run_load(senders, args.clients, mix, args.duration, args.requests, args.seed)
+
+    text = json.dumps({"meta": meta, **result}, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    return 1 if result["lost_updates"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,278 @@
+"""
+Benchmarks of TodoService and the HTTP routes on generated collections.
+
+Usage: python -m benchmarks.run [--sizes 1000,10000] [--backends json,journal,sqlite]
+                                [--repeat 20] [--output results.json]
+
+Every storage mode is filled with the same generated todos. The results are
+written as JSON, compare two runs with python -m benchmarks.compare.
+
+The concurrency benchmarks time batches of simultaneous requests served one
+after the other, and on threads of their own, through a thread pool and the
+ASGI entry point, where their storage work overlaps.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from statistics import mean, median
+from typing import Callable
+from urllib.parse import parse_qsl
+from app.asgi_adapter import ThreadedWsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from app.controllers.todo_controller import list_options_resolver
+from app.forms.list_options_form import ListOptionsForm
+from app.models.list_options import ListOptions, Status, SortKey, Order
+from app.models.todo import Todo
+from app.services.todo_service import TodoService
+from app.constants import STORAGE_MODE_JSON, STORAGE_MODE_JOURNAL, STORAGE_MODE_SQLITE, STORAGE_MODE_SNAPSHOT
+from .data_generator import DataSpec
+from .environment import create_benchmark_app, git_commit
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+BACKENDS = (STORAGE_MODE_JSON, STORAGE_MODE_JOURNAL, STORAGE_MODE_SQLITE, STORAGE_MODE_SNAPSHOT)
+# Word that occurs in generated titles and descriptions
+SEARCH_WORD = "buy"
+# Query strings of the index page parsed by the list options benchmark
+INDEX_QUERIES = (
+    "", "status=pending&sort=title&order=asc", "sort=dueDate&order=asc&due=upcoming", f"q={SEARCH_WORD}",
+    "page_size=25&status=completed", "status=bogus",
+)
+# Parses per timed call of the list options benchmark
+PARSES = 100
+# Simultaneous requests of the concurrency benchmarks
+CONCURRENCY = 8
+
+
+def _timings(call: Callable[[int], object], repeat: int) -> dict:
+    """
+    Time repeat calls of call(i) and summarize them in milliseconds.
+    """
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        call(i)
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": len(times),
+        "min_ms": round(min(times), 4),
+        "median_ms": round(median(times), 4),
+        "mean_ms": round(mean(times), 4),
+        "max_ms": round(max(times), 4),
+    }
+
+
+def bench_service(service: TodoService, spec: DataSpec, repeat: int) -> list[dict]:
+    rng = random.Random(spec.seed)
+    results = []
+
+    def record(name: str, call: Callable[[int], object], **params) -> None:
+        results.append({"name": name, "params": params, **_timings(call, repeat)})
+
+    # The first call of a fresh worker loads the collection
+    results.append({"name": "cold_load", "params": {}, **_timings(lambda i: service.list_filtered(ListOptions()), 1)})
+
+    for status, sort_key, order, query in product(Status, SortKey, Order, (None, SEARCH_WORD)):
+        options = ListOptions(status=status, sort=sort_key, order=order, query=query)
+        record("list_filtered", lambda i: service.list_filtered(options),
+               status=status.value, sort=sort_key.value, order=order.value, query=query)
+
+    cursor = service.list_filtered(ListOptions()).next_cursor
+    if cursor:
+        record("list_filtered", lambda i: service.list_filtered(ListOptions(cursor=cursor)), page="next")
+
+    ids = rng.sample(range(1, spec.size + 1), min(repeat, spec.size))
+    record("get", lambda i: service.get(ids[i % len(ids)]))
+    record("update", lambda i: service.update(Todo(id=ids[i % len(ids)], title=f"Updated {i}")))
+    record("set_completed", lambda i: service.set_completed(ids[i % len(ids)], i % 2 == 0))
+    record("add", lambda i: service.add(Todo(id=0, title=f"Added {i}")))
+    record("delete", lambda i: service.delete(ids[i]))
+    return results
+
+
+def bench_routes(app, spec: DataSpec, repeat: int) -> list[dict]:
+    rng = random.Random(spec.seed + 1)
+    results = []
+    client = app.test_client()
+
+    def record(name: str, call: Callable[[int], object], **params) -> None:
+        results.append({"name": name, "params": params, **_timings(call, repeat)})
+
+    for query_string in ("", "status=pending&sort=title&order=asc", "sort=dueDate&order=asc", f"q={SEARCH_WORD}"):
+        record("GET /", lambda i: client.get(f"/?{query_string}").data, query=query_string)
+
+    etag = client.get("/").headers["ETag"]
+    record("GET / (not modified)", lambda i: client.get("/", headers={"If-None-Match": etag}).data)
+
+    # Ids that are still there after the service benchmarks deleted some
+    ids = [t.id for t in rng.sample(app.todo_service.list(), repeat)]
+    record("GET /view/<id>", lambda i: client.get(f"/view/{ids[i]}").data)
+    record("POST /add", lambda i: client.post("/add", data={"title": f"Added {i}"}))
+    record("POST /update/<id>", lambda i: client.post(f"/update/{ids[i]}", data={"title": f"Updated {i}"}))
+    record("GET /complete/<id>", lambda i: client.get(f"/complete/{ids[i]}"))
+    record("GET /delete/<id>", lambda i: client.get(f"/delete/{ids[i]}"))
+
+    # Turning the query string into list options, PARSES times per call
+    queries = [MultiDict(parse_qsl(query, keep_blank_values=True)) for query in INDEX_QUERIES]
+
+    def parse_form(i: int) -> None:
+        for n in range(PARSES):
+            form = ListOptionsForm(queries[n % len(queries)])
+            if not form.validate():
+                form.set_defaults()
+            form.to_model()
+
+    def parse_resolver(i: int) -> None:
+        for n in range(PARSES):
+            list_options_resolver.resolve(queries[n % len(queries)])
+
+    with app.test_request_context():
+        record("parse list options", parse_form, path="form", parses=PARSES)
+        record("parse list options", parse_resolver, path="resolver", parses=PARSES)
+    return results
+
+
+async def _asgi_get(asgi_app, path: str, query_string: str = "") -> bytes:
+    """
+    Send one GET request to an ASGI application and return the body.
+    """
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "root_path": "", "query_string": query_string.encode(), "headers": [],
+    }
+    body = []
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: dict) -> None:
+        body.append(message.get("body", b""))
+
+    await asgi_app(scope, receive, send)
+    return b"".join(body)
+
+
+def bench_concurrency(app, repeat: int) -> list[dict]:
+    """
+    Time batches of CONCURRENCY simultaneous calls, one after the other
+    against on a thread each.
+    """
+    results = []
+    service = app.todo_service
+    pool = ThreadPoolExecutor(max_workers=CONCURRENCY)
+    asgi_app = ThreadedWsgiToAsgi(app, CONCURRENCY)
+    client = app.test_client()
+    options = [ListOptions(query=SEARCH_WORD, sort=sort_key) for sort_key in SortKey]
+
+    def record(name: str, call: Callable[[int], object], **params) -> None:
+        results.append({"name": name, "params": {"concurrency": CONCURRENCY, **params}, **_timings(call, repeat)})
+
+    def sync_batch(i: int) -> None:
+        for n in range(CONCURRENCY):
+            service.list_filtered(options[n % len(options)])
+
+    def threaded_batch(i: int) -> None:
+        list(pool.map(service.list_filtered, (options[n % len(options)] for n in range(CONCURRENCY))))
+
+    record("list_filtered batch", sync_batch, path="sync")
+    record("list_filtered batch", threaded_batch, path="threads")
+
+    # Simultaneous writes share commits when they arrive together
+    def sync_adds(i: int) -> None:
+        for n in range(CONCURRENCY):
+            service.add(Todo(id=0, title=f"Burst {i} {n}"))
+
+    def threaded_adds(i: int) -> None:
+        list(pool.map(service.add, (Todo(id=0, title=f"Burst {i} {n}") for n in range(CONCURRENCY))))
+
+    record("add batch", sync_adds, path="sync")
+    record("add batch", threaded_adds, path="threads")
+
+    def wsgi_batch(i: int) -> None:
+        for n in range(CONCURRENCY):
+            client.get(f"/?q={SEARCH_WORD}&n={n}").data
+
+    async def asgi_batch() -> None:
+        await asyncio.gather(*(_asgi_get(asgi_app, "/", f"q={SEARCH_WORD}&n={n}") for n in range(CONCURRENCY)))
+
+    record("GET / batch", wsgi_batch, path="wsgi")
+    record("GET / batch", lambda i: asyncio.run(asgi_batch()), path="asgi")
+    pool.shutdown()
+    return results
+
+
+def run(sizes: list[int], backends: list[str], spec: DataSpec, repeat: int) -> dict:
+    results = []
+    for size, backend in product(sizes, backends):
+        print(f"Benchmarking {backend} with {size} todos", file=sys.stderr)
+        size_spec = DataSpec(**{**spec.__dict__, "size": size})
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_benchmark_app(backend, Path(directory), size_spec)
+            benchmarks = (
+                bench_service(app.todo_service, size_spec, repeat)
+                + bench_routes(app, size_spec, repeat)
+                + bench_concurrency(app, repeat)
+            )
+            for result in benchmarks:
+                results.append({"size": size, "backend": backend, **result})
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": datetime.now(UTC).isoformat(),
+            "repeat": repeat,
+            "spec": {key: value for key, value in spec.__dict__.items() if key != "size"},
+        },
+        "results": results,
+    }
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated collection sizes (default: %(default)s)")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="comma separated storage modes (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per benchmark (default: %(default)s)")
+    parser.add_argument("--completed-ratio", type=float, default=DataSpec.completed_ratio)
+    parser.add_argument("--due-ratio", type=float, default=DataSpec.due_ratio)
+    parser.add_argument("--due-spread-days", type=int, default=DataSpec.due_spread_days)
+    parser.add_argument("--description-length", type=int, default=DataSpec.description_length)
+    parser.add_argument("--seed", type=int, default=DataSpec.seed)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv[1:])
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    spec = DataSpec(
+        size=0,
+        completed_ratio=args.completed_ratio,
+        due_ratio=args.due_ratio,
+        due_spread_days=args.due_spread_days,
+        description_length=args.description_length,
+        seed=args.seed,
+    )
+    # Every mutation benchmark needs its own existing todo
+    if args.repeat > min(sizes) // 2:
+        parser.error("--repeat must be at most half of the smallest size")
+
+    report = run(sizes, args.backends.split(","), spec, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,8 +1,18 @@
+import csv
+import gzip
+import io
 import json
+import pstats
+import time
 import pytest
 from app import create_app
 from freezegun import freeze_time
 from app.forms.todo_form import TodoForm
+from app.forms.list_options_form import ListOptionsForm
+from app.forms.list_options_resolver import ListOptionsResolver
+from app.models.list_options import Cursor, SortKey
+from werkzeug.datastructures import MultiDict
+from app.models.todo import Todo
 from app.constants import CHARACTER_ENCODING
 
 @pytest.fixture
@@ -28,6 +38,15 @@ def _read_json(path):
     with open(path, "r", encoding=CHARACTER_ENCODING) as f:
         return json.load(f)
 
+def _read_details(path):
+    # Descriptions are kept in JSON lines next to the data file
+    details = {}
+    for details_file in path.parent.glob(path.name + ".details.*"):
+        for line in details_file.read_text(encoding=CHARACTER_ENCODING).splitlines():
+            item = json.loads(line)
+            details[item["id"]] = item["description"]
+    return details
+
 def test_add_and_list(client, data_file):
     r = client.post(
         "/add",
@@ -40,7 +59,8 @@ def test_add_and_list(client, data_file):
     todos = _read_json(data_file)
     assert len(todos) == 1
     assert todos[0]["title"] == "Test Task"
-    assert todos[0]["description"] == "Test description"
+    assert "description" not in todos[0]
+    assert _read_details(data_file)[todos[0]["id"]] == "Test description"
     assert todos[0]["dueDate"] == "2026-01-31"
     assert todos[0]["isCompleted"] is False
     assert todos[0]["createdAt"]
@@ -57,7 +77,7 @@ def test_add_and_list_description_duedate_empty(client, data_file):
     todos = _read_json(data_file)
     assert len(todos) == 1
     assert todos[0]["title"] == "Test Task"
-    assert todos[0]["description"] == None
+    assert "detailsAt" not in todos[0]
     assert todos[0]["dueDate"] == None
     assert todos[0]["isCompleted"] is False
     assert todos[0]["createdAt"]
@@ -84,7 +104,7 @@ def test_view_update(client, data_file):
 
     todos = _read_json(data_file)
     assert todos[0]["title"] == "Todo 2"
-    assert todos[0]["description"] == "Todo 2 description"
+    assert _read_details(data_file)[todos[0]["id"]] == "Todo 2 description"
     assert todos[0]["dueDate"] == "2026-02-01"
 
 def test_complete_incomplete(client, data_file):
@@ -183,3 +203,474 @@ def test_to_model_after_validation_ok(app):
         assert form.validate() is True
         todo = form.to_model(todo_id=1)
         assert todo.title == "Test 1"
+
+def test_blank_cursor_means_the_first_page(app):
+    with app.test_request_context():
+        form = ListOptionsForm(MultiDict({"cursor": " "}))
+        assert form.validate() is True
+        assert form.to_model().cursor is None
+
+def test_invalid_list_options_apply_defaults(client):
+    client.post("/add", data={"title": "Todo 1"})
+    r = client.get("/?status=bogus&sort=title")
+    assert r.status_code == 200
+    assert b"Invalid filter or sort parameters" in r.data
+    assert b"Todo 1" in r.data
+
+def test_resolver_agrees_with_the_form(app):
+    resolver = ListOptionsResolver()
+    cursor = Cursor(sort=SortKey.TITLE, segment=0, value="a", id=3).encode()
+    cases = [
+        {}, {"status": "pending"}, {"status": ""}, {"status": "  "}, {"status": "Pending"}, {"status": " pending"},
+        {"due": "upcoming"}, {"due": "later"}, {"sort": "title", "order": "asc"}, {"sort": "rank"}, {"order": "up"},
+        {"page_size": "25"}, {"page_size": " "}, {"page_size": "+25"}, {"page_size": "025"}, {"page_size": "30"},
+        {"page_size": "many"}, {"cursor": cursor}, {"cursor": " "}, {"cursor": "not-a-cursor"},
+        {"q": " buy milk "}, {"q": "   "}, {"q": "x" * 200}, {"q": "x" * 201}, {"status": "completed", "q": "buy"},
+        [("status", "pending"), ("status", "bogus")], [("status", "bogus"), ("status", "pending")],
+    ]
+    with app.test_request_context():
+        for case in cases:
+            args = MultiDict(case)
+            form = ListOptionsForm(args)
+            valid = form.validate()
+            if not valid:
+                form.set_defaults()
+            assert resolver.resolve(args) == (form.to_model(), valid), case
+
+def test_resolver_shares_options_without_cursor_or_query():
+    resolver = ListOptionsResolver()
+    # A blank cursor is the first page
+    assert resolver.resolve(MultiDict({"cursor": " "})) == (resolver.default, True)
+    options, _ = resolver.resolve(MultiDict({"status": "pending", "sort": "title"}))
+    assert resolver.resolve(MultiDict({"sort": "title", "status": "pending"}))[0] is options
+    assert resolver.resolve(MultiDict({"status": "bogus"})) == (resolver.default, False)
+
+def test_index_paginates(client):
+    for i in range(12):
+        client.post("/add", data={"title": f"task-{i:02d}"})
+
+    r = client.get("/?sort=title&order=asc&page_size=10")
+    html = r.data.decode(CHARACTER_ENCODING)
+    assert "task-09" in html
+    assert "task-10" not in html
+    assert "Next" in html
+
+    cursor = html.split("cursor=")[1].split('"')[0]
+    r2 = client.get(f"/?sort=title&order=asc&page_size=10&cursor={cursor}")
+    html2 = r2.data.decode(CHARACTER_ENCODING)
+    assert "task-10" in html2 and "task-11" in html2
+    assert "task-09" not in html2
+    assert "Previous" in html2
+
+def test_index_search(client):
+    for title in ("Buy milk", "Call plumber", "Buy bread"):
+        client.post("/add", data={"title": title})
+    r = client.get("/?q=buy&sort=title&order=asc")
+    html = r.data.decode(CHARACTER_ENCODING)
+    assert "Buy bread" in html and "Buy milk" in html
+    assert "Call plumber" not in html
+
+def test_blank_cursor_shows_the_first_page(client):
+    for i in range(12):
+        client.post("/add", data={"title": f"task-{i:02d}"})
+    r = client.get("/?sort=title&order=asc&page_size=10&cursor=%20")
+    assert r.status_code == 200
+    assert b"task-00" in r.data
+    assert b"Invalid filter or sort parameters" not in r.data
+
+def test_invalid_cursor_applies_defaults(client):
+    r = client.get("/?cursor=not-a-cursor")
+    assert r.status_code == 200
+    assert b"Invalid filter or sort parameters" in r.data
+
+@pytest.mark.parametrize("storage_mode", ["json", "sqlite", "snapshot"])
+def test_cursor_values_must_fit_their_sort_key(tmp_path, data_file, storage_mode):
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "DATA_FILE": str(data_file),
+        "SQLITE_FILE": str(tmp_path / "data/todos.sqlite3"),
+        "STORAGE_MODE": storage_mode,
+    })
+    client = app.test_client()
+    client.post("/add/bulk", data={"titles": "\n".join(f"Todo {i}" for i in range(12)), "dueDate": "2026-03-01"})
+    for sort, segment, value in [
+        (SortKey.CREATED_AT, 0, "a"), (SortKey.TITLE, 0, 5), (SortKey.DUE_DATE, 0, "2026-03-01"), (SortKey.DUE_DATE, 2, 0),
+    ]:
+        cursor = Cursor(sort=sort, segment=segment, value=value, id=3).encode()
+        r = client.get(f"/?sort={sort}&page_size=10&cursor={cursor}")
+        assert r.status_code == 200
+        assert b"Invalid filter or sort parameters" in r.data
+
+    # Cursors of the pager links go on from where the page ended
+    html = client.get("/?sort=dueDate&order=asc&page_size=10").data.decode(CHARACTER_ENCODING)
+    cursor = html.split("cursor=")[1].split('"')[0]
+    html = client.get(f"/?sort=dueDate&order=asc&page_size=10&cursor={cursor}").data.decode(CHARACTER_ENCODING)
+    assert "Invalid filter" not in html
+    assert "Todo 10" in html and "Todo 11" in html
+    assert "Todo 9" not in html
+
+def test_index_not_modified_until_data_changes(client):
+    client.post("/add", data={"title": "Todo 1"})
+    r = client.get("/?sort=title")
+    etag = r.headers["ETag"]
+    assert r.headers["Last-Modified"]
+
+    assert client.get("/?sort=title", headers={"If-None-Match": etag}).status_code == 304
+    # Another query string is another page
+    assert client.get("/?sort=dueDate", headers={"If-None-Match": etag}).status_code == 200
+
+    client.get("/complete/1")
+    r2 = client.get("/?sort=title", headers={"If-None-Match": etag})
+    assert r2.status_code == 200
+    assert r2.headers["ETag"] != etag
+
+def test_view_not_modified_until_todo_changes(client):
+    client.post("/add", data={"title": "Todo 1"})
+    client.post("/add", data={"title": "Todo 2"})
+    r = client.get("/view/1")
+    etag = r.headers["ETag"]
+    assert client.get("/view/1", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/view/1", headers={"If-Modified-Since": r.headers["Last-Modified"]}).status_code == 304
+
+    # Changing another todo keeps the ETag of this one
+    client.get("/complete/2")
+    assert client.get("/view/1", headers={"If-None-Match": etag}).status_code == 304
+
+    client.get("/complete/1")
+    assert client.get("/view/1", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/view/3", headers={"If-None-Match": etag}).status_code == 404
+
+def test_add_bulk(client, data_file):
+    r = client.post("/add/bulk", data={"titles": "Todo 1\n\n  Todo 2  \n", "dueDate": "2030-01-01"})
+    assert r.status_code == 302
+    data = _read_json(data_file)
+    assert [(t["id"], t["title"], t["dueDate"]) for t in data] == [
+        (1, "Todo 1", "2030-01-01"),
+        (2, "Todo 2", "2030-01-01"),
+    ]
+
+    r = client.post("/add/bulk", data={"titles": "x" * 201})
+    assert b"at most 200 characters" in r.data
+
+def test_bulk_complete_and_delete(client, data_file):
+    client.post("/add/bulk", data={"titles": "Todo 1\nTodo 2\nTodo 3"})
+
+    r = client.post("/bulk/complete", data={"ids": ["1", "3"]})
+    assert r.status_code == 302
+    assert [t["isCompleted"] for t in _read_json(data_file)] == [True, False, True]
+
+    r = client.post("/bulk/delete", data={"ids": ["2", "3", "9"]}, headers={"Accept": "application/json"})
+    assert r.get_json() == {"succeeded": [2, 3], "not_found": [9]}
+    assert [t["id"] for t in _read_json(data_file)] == [1]
+
+    assert client.post("/bulk/incomplete", data={"ids": ["x"]}).status_code == 400
+
+def test_bulk_forms_require_csrf_token(data_file):
+    app = create_app({"TESTING": True, "SECRET_KEY": "test", "DATA_FILE": str(data_file)})
+    with app.test_client() as client:
+        client.application.todo_service.add(Todo(id=0, title="Todo 1"))
+        assert client.post("/bulk/complete", data={"ids": ["1"]}).status_code == 400
+
+        html = client.get("/").data.decode(CHARACTER_ENCODING)
+        token = html.split('name="csrf_token" type="hidden" value="')[1].split('"')[0]
+        r = client.post("/bulk/complete", data={"ids": ["1"], "csrf_token": token})
+        assert r.status_code == 302
+        assert client.application.todo_service.get(1).isCompleted
+
+def test_import_requires_csrf_token_and_a_data_content_type(data_file):
+    app = create_app({"TESTING": True, "SECRET_KEY": "test", "DATA_FILE": str(data_file)})
+    with app.test_client() as client:
+        body = '{"title": "Imported"}\n'
+        assert client.post("/import", data=body, content_type="text/plain").status_code == 415
+        assert client.post("/import", data=body, content_type="application/x-ndjson").status_code == 400
+
+        html = client.get("/add").data.decode(CHARACTER_ENCODING)
+        token = html.split('name="csrf_token" type="hidden" value="')[1].split('"')[0]
+        r = client.post("/import", data=body, content_type="application/x-ndjson", headers={"X-CSRFToken": token})
+        assert r.json["imported"] == 1
+
+def test_compressed_pages_keep_csrf_tokens_per_session(data_file):
+    app = create_app({"TESTING": True, "SECRET_KEY": "test", "DATA_FILE": str(data_file)})
+    app.todo_service.add_many([Todo(id=0, title=f"Todo {i}") for i in range(1, 41)])
+    headers = {"Accept-Encoding": "gzip"}
+
+    def token(response):
+        html = gzip.decompress(response.data).decode(CHARACTER_ENCODING)
+        return html.split('name="csrf_token" type="hidden" value="')[1].split('"')[0]
+
+    first, second = app.test_client(), app.test_client()
+    r1 = first.get("/", headers=headers)
+    r2 = second.get("/", headers=headers)
+    assert r1.headers["Content-Encoding"] == r2.headers["Content-Encoding"] == "gzip"
+    assert "Set-Cookie" in r2.headers
+    assert token(r1) != token(r2)
+    assert len(app.compressed_pages) == 0
+
+    # A session holding a token gets its own page from the cache
+    again = first.get("/", headers=headers)
+    assert len(app.compressed_pages) == 1
+    assert first.get("/", headers=headers).data == again.data
+    r = second.post("/bulk/delete", data={"ids": ["1"], "csrf_token": token(second.get("/", headers=headers))})
+    assert r.status_code == 302
+
+def test_bulk_form_tokens_expire_and_pages_move_on_before(data_file):
+    app = create_app({"TESTING": True, "SECRET_KEY": "test", "DATA_FILE": str(data_file)})
+    app.todo_service.add_many([Todo(id=0, title="Todo 1"), Todo(id=0, title="Todo 2")])
+    client = app.test_client()
+    with freeze_time("2026-01-01 10:00:00"):
+        # The first page starts the session, the second one is kept
+        client.get("/")
+        r = client.get("/")
+    token = r.data.decode(CHARACTER_ENCODING).split('name="csrf_token" type="hidden" value="')[1].split('"')[0]
+    with freeze_time("2026-01-01 10:29:00"):
+        assert client.get("/", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+    with freeze_time("2026-01-01 10:31:00"):
+        assert client.get("/", headers={"If-None-Match": r.headers["ETag"]}).status_code == 200
+    with freeze_time("2026-01-01 10:59:00"):
+        assert client.post("/bulk/complete", data={"ids": ["1"], "csrf_token": token}).status_code == 302
+    with freeze_time("2026-01-01 11:01:00"):
+        assert client.post("/bulk/complete", data={"ids": ["2"], "csrf_token": token}).status_code == 400
+
+def test_server_timing_and_metrics(client):
+    client.post("/add", data={"title": "Todo 1"})
+    r = client.get("/?sort=title")
+    phases = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+    assert {"form", "query", "render", "total"} <= set(phases)
+
+    text = client.get("/metrics").data.decode(CHARACTER_ENCODING)
+    assert 'todo_requests_total{endpoint="todo.index",method="GET",status="200"}' in text
+    assert 'todo_phase_duration_seconds_count{phase="render"}' in text
+    assert "todo_items_scanned_total" in text
+
+def test_apps_count_their_own_requests(client, data_file):
+    other = create_app({"TESTING": True, "DATA_FILE": str(data_file)})
+    client.get("/")
+    assert 'todo_requests_total{endpoint="todo.index"' in client.get("/metrics").data.decode(CHARACTER_ENCODING)
+    text = other.test_client().get("/metrics").data.decode(CHARACTER_ENCODING)
+    assert 'todo_requests_total{endpoint="todo.index"' not in text
+
+def test_profiles_sampled_and_slow_requests(tmp_path, data_file, monkeypatch):
+    profile_dir = tmp_path / "profiles"
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "DATA_FILE": str(data_file),
+        "PROFILE_DIR": str(profile_dir),
+        "PROFILE_SLOW_MS": 20,
+        "PROFILE_SAMPLE_PERCENT": 100,
+        "PROFILE_INTERVAL_MS": 1,
+    })
+    list_filtered = app.todo_service.list_filtered
+
+    def slow_list_filtered(list_options):
+        time.sleep(0.05)
+        return list_filtered(list_options)
+
+    monkeypatch.setattr(app.todo_service, "list_filtered", slow_list_filtered)
+    with app.test_client() as client:
+        client.post("/add", data={"title": "Todo 1"})
+        client.get("/?sort=title&order=asc&q=todo")
+
+    names = sorted(path.name for path in profile_dir.iterdir() if "todo.index" in path.name)
+    assert [name.rsplit(".", 1)[1] for name in names] == ["collapsed", "pstats"]
+    assert "-all-title-asc-50-q=todo-1items-" in names[0]
+    collapsed = (profile_dir / names[0]).read_text()
+    assert "slow_list_filtered" in collapsed
+    # The view runs on the profiled thread
+    functions = {name for _, _, name in pstats.Stats(str(profile_dir / names[1])).stats}
+    assert {"slow_list_filtered", "render_template"} <= functions
+
+@pytest.mark.parametrize("storage_mode", ["json", "sqlite"])
+def test_index_streaming(tmp_path, data_file, storage_mode):
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "DATA_FILE": str(data_file),
+        "SQLITE_FILE": str(tmp_path / "data/todos.sqlite3"),
+        "STORAGE_MODE": storage_mode,
+        "STREAM_INDEX": True,
+    })
+    with app.test_client() as client:
+        r = client.get("/")
+        assert r.is_streamed
+        assert b"No to-do items yet." in r.data
+
+        for i in range(12):
+            client.post("/add", data={"title": f"task-{i:02d}"})
+        r = client.get("/?sort=title&order=asc&page_size=10")
+        html = r.data.decode(CHARACTER_ENCODING)
+        assert html.count("<tr>") == 11
+        assert "task-09" in html and "task-10" not in html
+        assert "Next" in html and "Previous" not in html
+
+def test_asgi_serves_requests_concurrently(app):
+    import asyncio
+    from app.asgi_adapter import ThreadedWsgiToAsgi
+
+    version = app.todo_service.version
+
+    def slow_version():
+        time.sleep(0.2)
+        return version()
+
+    app.todo_service.version = slow_version
+    asgi_app = ThreadedWsgiToAsgi(app, 4)
+
+    async def get(path):
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "root_path": "", "query_string": b"", "headers": [],
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_app(scope, receive, send)
+        return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+    async def main():
+        return await asyncio.gather(*(get("/") for _ in range(4)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    assert all(status == 200 and b"No to-do items yet." in body for status, body in responses)
+    # Four requests waiting on storage overlap instead of queueing
+    assert elapsed < 0.6
+
+def test_rows_are_rendered_once_per_version(app, client):
+    for i in range(3):
+        client.post("/add", data={"title": f"Todo {i}"})
+    client.get("/")
+    assert len(app.row_cache) == 3
+    misses = app.row_cache.misses
+
+    # Only the changed row is rendered again
+    client.get("/complete/2")
+    r = client.get("/")
+    assert app.row_cache.misses == misses + 1
+    assert b'href="/incomplete/2?version=2"' in r.data
+    assert r.data.count(b"Todo 0") == 1
+
+    # Links follow the mount point of the app
+    r = client.get("/", base_url="http://localhost/todos")
+    assert b'href="/todos/view/1"' in r.data
+    assert app.row_cache.misses == misses + 4
+
+def test_row_cache_evicts_least_recently_used_rows():
+    from app.filters.row_cache import RowCache
+
+    cache = RowCache(max_bytes=10)
+    for key in "abc":
+        cache.get(key, 1, lambda: "xxxx")
+    assert len(cache) == 2 and cache.size == 8
+    assert cache.get("c", 1, lambda: "stale") == "xxxx"
+    assert cache.get("c", 2, lambda: "new") == "new"
+    assert cache.get("a", 1, lambda: "yyyy") == "yyyy"
+
+def test_import_and_export_endpoints(client):
+    r = client.post(
+        "/import",
+        data='{"title": "a", "dueDate": "2026-01-02", "isCompleted": true}\n{"title": ""}\n',
+        content_type="application/x-ndjson",
+    )
+    assert r.json == {"imported": 1, "rejected": 1, "errors": [{"line": 2, "error": "title: Title is required."}]}
+    r = client.post("/import", data='title,description\nb,"two\nlines"\n', content_type="text/csv")
+    assert r.json["imported"] == 1
+
+    r = client.get("/export?format=csv")
+    assert r.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+    assert [(row["id"], row["title"], row["isCompleted"]) for row in rows] == [("1", "a", "true"), ("2", "b", "false")]
+    assert rows[1]["description"] == "two\nlines"
+    lines = client.get("/export").get_data(as_text=True).splitlines()
+    assert [json.loads(line)["dueDate"] for line in lines] == ["2026-01-02", None]
+
+    assert client.post("/import", data="a", content_type="text/plain").status_code == 415
+    assert client.get("/export?format=xml").status_code == 400
+
+def test_import_and_export_commands(app, tmp_path):
+    source = tmp_path / "in.ndjson"
+    source.write_text("".join(json.dumps({"title": f"Todo {i}"}) + "\n" for i in range(5)), encoding=CHARACTER_ENCODING)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["todos", "import", str(source), "--chunk-size", "2"])
+    assert result.exit_code == 0
+    assert "Imported 5 todos" in result.output
+    assert app.todo_service.version().version == 3
+
+    result = runner.invoke(args=["todos", "export", str(tmp_path / "out.csv")])
+    assert result.exit_code == 0
+    rows = list(csv.DictReader((tmp_path / "out.csv").open(encoding=CHARACTER_ENCODING, newline="")))
+    assert [row["title"] for row in rows] == [f"Todo {i}" for i in range(5)]
+
+    result = runner.invoke(args=["todos", "import", "-", "--format", "csv"], input="title\n\n")
+    assert result.exit_code == 0
+    result = runner.invoke(args=["todos", "import", "-", "--format", "csv"], input="title,dueDate\nx,soon\n")
+    assert result.exit_code == 1
+    assert "line 2: dueDate: Not a valid date value." in result.output
+
+@freeze_time("2026-03-10 12:00:00")
+def test_index_shows_due_windows(client):
+    client.post("/add", data={"title": "Late", "dueDate": "2026-03-01"})
+    client.post("/add", data={"title": "Soon", "dueDate": "2026-03-12"})
+    client.post("/add", data={"title": "Someday"})
+
+    r = client.get("/?due=overdue")
+    assert b"Late" in r.data and b"Soon" not in r.data
+    assert b"<strong>Overdue</strong>" in r.data
+    assert b"due=upcoming" in r.data
+    r = client.get("/?due=later")
+    assert b"Invalid filter or sort parameters" in r.data
+
+def test_stale_forms_and_links_answer_conflict(client):
+    client.post("/add", data={"title": "Todo 1"})
+    r = client.get("/update/1")
+    assert b'name="version" type="hidden" value="1"' in r.data
+
+    client.post("/update/1", data={"title": "Other", "version": "1"})
+    r = client.post("/update/1", data={"title": "Mine", "description": "Text", "version": "1"})
+    assert r.status_code == 409
+    assert b"Other" in r.data and b"Mine" in r.data
+    # The form now carries the stored version, saving again overwrites it
+    assert b'name="version" type="hidden" value="2"' in r.data
+    assert client.post("/update/1", data={"title": "Mine", "version": "2"}).status_code == 302
+
+    r = client.get("/complete/1?version=2")
+    assert r.status_code == 409
+    assert b"Mine" in r.data
+    assert b'href="/complete/1?version=3"' in r.data
+    assert client.get("/complete/1?version=3").status_code == 302
+    assert b"Completed" in client.get("/view/1").data
+
+def test_large_pages_are_compressed_once_per_version(app, client):
+    client.post("/add/bulk", data={"titles": "\n".join(f"Todo {i}" for i in range(1, 41))})
+    plain = client.get("/")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.vary
+
+    compressions = []
+    gzip_compress = app.compress_encodings["gzip"]
+    app.compress_encodings["gzip"] = lambda data, level: compressions.append(level) or gzip_compress(data, level)
+    headers = {"Accept-Encoding": "br;q=0.5, gzip"}
+    r = client.get("/", headers=headers)
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(r.data) == plain.data
+    assert r.headers["ETag"] == f'W/"{plain.headers["ETag"].strip(chr(34))}"'
+
+    # Served from the cache until the data changes
+    again = client.get("/", headers=headers)
+    assert again.data == r.data
+    assert compressions == [6]
+    assert client.get("/", headers={**headers, "If-None-Match": r.headers["ETag"]}).status_code == 304
+    client.get("/complete/1")
+    assert gzip.decompress(client.get("/", headers=headers).data) != plain.data
+    assert len(compressions) == 2
+
+    # Small pages are left alone
+    assert "Content-Encoding" not in client.get("/add", headers=headers).headers
@@ -0,0 +1,32 @@
+from benchmarks.data_generator import DataSpec, generate_todos
+from benchmarks.load import in_process_senders, lost_updates, parse_mix, run_load, ClientRun
+from benchmarks.run import run
+
+def test_generated_data_is_reproducible():
+    spec = DataSpec(size=50, completed_ratio=0.5, seed=3)
+    todos = list(generate_todos(spec))
+    assert [t.id for t in todos] == list(range(1, 51))
+    assert [t.to_dict() for t in todos] == [t.to_dict() for t in generate_todos(spec)]
+    assert 10 < sum(t.isCompleted for t in todos) < 40
+
+def test_run_reports_every_benchmark():
+    report = run([20], ["json", "sqlite"], DataSpec(size=0), repeat=2)
+    names = {(r["backend"], r["name"]) for r in report["results"]}
+    for backend in ("json", "sqlite"):
+        for name in ("cold_load", "list_filtered", "get", "add", "update", "set_completed", "delete", "GET /", "GET /view/<id>", "parse list options", "list_filtered batch", "add batch", "GET / batch"):
+            assert (backend, name) in names
+    assert all(r["runs"] >= 1 and r["min_ms"] <= r["max_ms"] for r in report["results"])
+
+def test_load_reports_latency_and_lost_updates(tmp_path):
+    senders = in_process_senders("journal", tmp_path, DataSpec(size=40), workers=2)
+    report = run_load(senders, 4, parse_mix("index=2,view=1,add=1,update=2,complete=1,delete=1"), 30, requests=15)
+    assert report["requests"] == 60
+    assert report["errors"] == 0
+    assert report["lost_updates"] == 0
+    assert report["latency"]["all"]["p50_ms"] <= report["latency"]["all"]["p99_ms"]
+    assert set(report["latency"]) == {"all", "index", "view", "add", "update", "complete", "delete"}
+
+def test_lost_updates_are_detected():
+    run = ClientRun(expected={1: {"title": "New", "isCompleted": True}, 2: None}, added=["Added"])
+    final = {1: {"id": 1, "title": "Old", "isCompleted": True}, 2: {"id": 2, "title": "Gone", "isCompleted": False}}
+    assert [entry.get("id", entry.get("added")) for entry in lost_updates([run], final)] == [1, 2, "Added"]
@@ -0,0 +1,398 @@
+import json
+import pytest
+from freezegun import freeze_time
+from app.models.todo import Todo
+from app.models.list_options import Status, SortKey, Order, Cursor, DueWindow
+from app.repositories.file_todo_repository import FileTodoRepository
+from app.repositories.todo_repository import VersionConflict
+from app.constants import CHARACTER_ENCODING
+
+@pytest.fixture
+def data_file(tmp_path):
+    return tmp_path / "data/todos.json"
+
+@pytest.fixture
+def repository(data_file):
+    return FileTodoRepository(str(data_file))
+
+def test_cache_reused_between_calls(repository):
+    repository.add(Todo(id=0, title="Todo 1"))
+    repository.list_page(Status.ALL, SortKey.CREATED_AT, Order.DESC, 50)
+    repository.get(1)
+
+    assert repository.cache_stats.misses == 1
+    assert repository.cache_stats.reloads == 0
+    assert repository.cache_stats.hits >= 2
+
+def test_cache_reloads_after_external_change(repository, data_file):
+    repository.add(Todo(id=0, title="Todo 1"))
+    assert repository.get(1).title == "Todo 1"
+
+    # Another worker writes the file
+    other = FileTodoRepository(str(data_file))
+    other.update(Todo(id=1, title="Changed"))
+
+    assert repository.get(1).title == "Changed"
+    assert repository.cache_stats.reloads == 1
+
+def test_list_filtered_does_not_reorder_cache(repository, data_file):
+    repository.add(Todo(id=0, title="b"))
+    repository.add(Todo(id=0, title="a"))
+    repository.list_page(Status.ALL, SortKey.TITLE, Order.ASC, 50)
+    repository.set_completed(1, True)
+
+    with open(data_file, "r", encoding=CHARACTER_ENCODING) as f:
+        assert [t["id"] for t in json.load(f)] == [1, 2]
+
+def _journal_repository(data_file, threshold=1000):
+    return FileTodoRepository(str(data_file), storage_mode="journal", journal_compact_threshold=threshold)
+
+def test_journal_appends_instead_of_rewriting(data_file):
+    repository = _journal_repository(data_file)
+    repository.add(Todo(id=0, title="Todo 1"))
+    repository.set_completed(1, True)
+
+    assert not data_file.exists()
+    journal = data_file.with_name("todos.json.journal")
+    assert len(journal.read_text(encoding=CHARACTER_ENCODING).splitlines()) == 2
+
+    # A fresh worker replays the journal
+    replayed = _journal_repository(data_file).get(1)
+    assert replayed.title == "Todo 1"
+    assert replayed.isCompleted is True
+
+def test_journal_picks_up_records_from_other_workers(data_file):
+    repository = _journal_repository(data_file)
+    other = _journal_repository(data_file)
+    repository.add(Todo(id=0, title="Todo 1"))
+    other.update(Todo(id=1, title="Changed"))
+    other.add(Todo(id=0, title="Todo 2"))
+
+    assert [t.title for t in repository.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50).items] == ["Changed", "Todo 2"]
+
+def test_journal_compacts_at_threshold(data_file):
+    repository = _journal_repository(data_file, threshold=3)
+    repository.add(Todo(id=0, title="Todo 1"))
+    repository.add(Todo(id=0, title="Todo 2"))
+    repository.delete(1)
+
+    assert not data_file.with_name("todos.json.journal").exists()
+    with open(data_file, "r", encoding=CHARACTER_ENCODING) as f:
+        assert [t["title"] for t in json.load(f)] == ["Todo 2"]
+
+def test_journal_imports_existing_json_and_exports_on_compact(data_file):
+    json_repository = FileTodoRepository(str(data_file))
+    json_repository.add(Todo(id=0, title="Todo 1"))
+
+    repository = _journal_repository(data_file)
+    repository.add(Todo(id=0, title="Todo 2"))
+    repository.compact()
+
+    assert [t.title for t in FileTodoRepository(str(data_file)).list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50).items] == ["Todo 1", "Todo 2"]
+
+def test_ids_are_not_reused_after_journal_compaction(data_file):
+    repository = _journal_repository(data_file)
+    repository.add(Todo(id=0, title="Todo 1"))
+    repository.add(Todo(id=0, title="Todo 2"))
+    repository.delete(2)
+    repository.compact()
+
+    assert _journal_repository(data_file).add(Todo(id=0, title="Todo 3")).id == 3
+
+def _add_from_worker(data_file, storage_mode, n):
+    repository = FileTodoRepository(str(data_file), storage_mode=storage_mode)
+    for i in range(n):
+        repository.add(Todo(id=0, title=f"Todo {i}"))
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_workers_do_not_lose_concurrent_changes(data_file, storage_mode):
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_add_from_worker, args=(data_file, storage_mode, 25)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    todos = FileTodoRepository(str(data_file), storage_mode=storage_mode).list_all()
+    assert sorted(t.id for t in todos) == list(range(1, 101))
+
+def test_concurrent_changes_share_commits(data_file, monkeypatch):
+    import threading
+
+    repository = FileTodoRepository(str(data_file), commit_window_ms=50)
+    repository.add(Todo(id=0, title="Todo 0"))
+    commits = []
+    commit = repository._commit
+    monkeypatch.setattr(repository, "_commit", lambda todos, *records: commits.append(len(records)) or commit(todos, *records))
+
+    errors = []
+
+    def change(i):
+        try:
+            if i == 0:
+                repository.delete(7)
+            else:
+                repository.add(Todo(id=0, title=f"Todo {i}"))
+        except KeyError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=change, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The missing id only fails its own change
+    assert len(errors) == 1
+    assert len(commits) < 7 and sum(commits) == 7
+    assert len(FileTodoRepository(str(data_file)).list_all()) == 8
+
+def test_fsync_policy(data_file, monkeypatch):
+    import os
+
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+
+    FileTodoRepository(str(data_file), fsync_policy="never").add(Todo(id=0, title="Todo 1"))
+    assert synced == []
+    repository = FileTodoRepository(str(data_file), fsync_policy="always")
+    repository.add(Todo(id=0, title="Todo 2"))
+    repository.add(Todo(id=0, title="Todo 3"))
+    # Meta file, then data file, each with the rename into the directory
+    assert len(synced) == 8
+
+    with pytest.raises(ValueError):
+        FileTodoRepository(str(data_file), fsync_policy="sometimes")
+
+def test_descriptions_are_kept_out_of_the_data_file(data_file):
+    repository = FileTodoRepository(str(data_file))
+    repository.add(Todo(id=0, title="Todo 1", description="x" * 5000))
+    repository.add(Todo(id=0, title="Todo 2"))
+
+    with open(data_file, "r", encoding=CHARACTER_ENCODING) as f:
+        data = json.load(f)
+    assert all("description" not in item for item in data)
+    assert data[0]["detailsAt"][0] == 1 and "detailsAt" not in data[1]
+
+    other = FileTodoRepository(str(data_file))
+    assert other.list_page(Status.ALL, SortKey.CREATED_AT, Order.DESC, 50).items[1].description is None
+    assert other.get(1).description == "x" * 5000
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_returned_todos_keep_their_descriptions(data_file, storage_mode):
+    repository = FileTodoRepository(str(data_file), storage_mode=storage_mode, journal_compact_threshold=2)
+    added = repository.add(Todo(id=0, title="Todo 1", description="Added"))
+    updated = repository.update(Todo(id=1, title="Todo 1", description="Updated"))
+    read = repository.get(1)
+    completed = repository.set_completed(1, True)
+    repository.compact()
+
+    assert added.description == "Added"
+    assert updated.description == "Updated"
+    assert read.description == "Updated"
+    assert completed.description == "Updated"
+
+def test_details_file_is_rewritten_once_mostly_garbage(data_file):
+    repository = FileTodoRepository(str(data_file))
+    repository.add(Todo(id=0, title="Todo 1", description="first"))
+    for i in range(40):
+        repository.update(Todo(id=1, title="Todo 1", description=f"{i}" * 4000))
+
+    details = sorted(data_file.parent.glob("todos.json.details.*"))
+    assert len(details) == 1 and details[0].name != "todos.json.details.1"
+    assert details[0].stat().st_size < 2 * 64 * 1024
+    assert FileTodoRepository(str(data_file)).get(1).description == "39" * 4000
+
+def test_data_file_with_inline_descriptions_is_split_on_compact(data_file):
+    data_file.parent.mkdir(parents=True)
+    todo = Todo(id=1, title="Todo 1", description="Inline")
+    data_file.write_text(json.dumps([todo.to_dict()]), encoding=CHARACTER_ENCODING)
+
+    repository = FileTodoRepository(str(data_file))
+    assert repository.get(1).description == "Inline"
+    repository.compact()
+    with open(data_file, "r", encoding=CHARACTER_ENCODING) as f:
+        assert "description" not in json.load(f)[0]
+    assert FileTodoRepository(str(data_file)).get(1).description == "Inline"
+
+def test_readers_never_see_the_new_version_before_the_new_todos(data_file):
+    repository = FileTodoRepository(str(data_file))
+    repository.add(Todo(id=0, title="Todo 1"))
+    reader = FileTodoRepository(str(data_file))
+    before = reader.version().version
+    seen = []
+    write_atomically = repository._write_atomically
+
+    def write_seen(path, *args):
+        if path == repository.data_file_path:
+            seen.append((reader.version().version, reader.count()))
+        return write_atomically(path, *args)
+
+    repository._write_atomically = write_seen
+    repository.add(Todo(id=0, title="Todo 2"))
+    assert seen == [(before, 1)]
+    assert reader.version().version > before
+    assert reader.count() == 2
+
+def test_word_index_is_kept_across_reloads(data_file):
+    writer = FileTodoRepository(str(data_file))
+    writer.add_many([Todo(id=0, title=f"Todo {i}", description=f"Text {i}") for i in range(1, 5)])
+    reader = FileTodoRepository(str(data_file))
+    assert _ids(reader.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50, query="text")) == [1, 2, 3, 4]
+
+    writer.update(Todo(id=2, title="Todo 2", description="Changed"))
+    writer.delete(3)
+    writer.add(Todo(id=0, title="Todo 5", description="Text 5"))
+    read = []
+    read_details = reader._read_details
+    reader._read_details = lambda summaries: read.extend(t.id for t in summaries) or read_details(summaries)
+    assert _ids(reader.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50, query="text")) == [1, 4, 5]
+    assert _ids(reader.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50, query="changed")) == [2]
+    assert sorted(read) == [2, 5]
+
+def _archiving_repository(data_file, storage_mode="json"):
+    return FileTodoRepository(str(data_file), storage_mode=storage_mode, archive_after_days=30)
+
+def _ids(page):
+    return [t.id for t in page.items]
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_todos_completed_long_ago_are_archived(data_file, storage_mode):
+    repository = _archiving_repository(data_file, storage_mode)
+    with freeze_time("2024-01-01"):
+        repository.add_many([Todo(id=0, title=f"Todo {i}", description=f"Text {i}") for i in range(1, 6)])
+        repository.set_completed_many([1, 3], True)
+    with freeze_time("2024-01-20"):
+        repository.set_completed(4, True)
+    with freeze_time("2024-02-15"):
+        repository.add(Todo(id=0, title="Todo 6"))
+        repository.compact()
+
+    with open(data_file, "r", encoding=CHARACTER_ENCODING) as f:
+        assert [t["id"] for t in json.load(f)] == [2, 4, 5, 6]
+    archive = data_file.with_name("todos.json.archive").read_text(encoding=CHARACTER_ENCODING)
+    assert [json.loads(line)["todo"]["id"] for line in archive.splitlines()] == [1, 3]
+    # The archive holds summaries, the descriptions have a file of their own
+    assert "Text" not in archive
+    assert "Text 3" in data_file.with_name("todos.json.archive.details").read_text(encoding=CHARACTER_ENCODING)
+
+    reader = _archiving_repository(data_file, storage_mode)
+    assert _ids(reader.list_page(Status.PENDING, SortKey.CREATED_AT, Order.ASC, 50)) == [2, 5, 6]
+    assert reader.count_unarchived() == 4
+    assert reader._archive is None
+    assert _ids(reader.list_page(Status.COMPLETED, SortKey.CREATED_AT, Order.ASC, 50)) == [1, 3, 4]
+    first = reader.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 4)
+    assert _ids(first) == [1, 2, 3, 4]
+    assert _ids(reader.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 4, Cursor.decode(first.next_cursor))) == [5, 6]
+    assert _ids(reader.list_page(Status.ALL, SortKey.TITLE, Order.DESC, 50, query="text")) == [5, 4, 3, 2, 1]
+    assert [t.id for t in reader.iter_all()] == [1, 2, 3, 4, 5, 6]
+    assert reader.count() == 6
+    assert reader.get(3).description == "Text 3"
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_changing_an_archived_todo_moves_it_back(data_file, storage_mode):
+    repository = _archiving_repository(data_file, storage_mode)
+    with freeze_time("2024-01-01"):
+        repository.add_many([Todo(id=0, title=f"Todo {i}") for i in range(1, 4)])
+        repository.set_completed_many([1, 2, 3], True)
+    with freeze_time("2024-03-01"):
+        repository.compact()
+        other = _archiving_repository(data_file, storage_mode)
+        assert other.count() == 3
+
+        repository.set_completed(1, False)
+        repository.delete(2)
+        assert _ids(repository.list_page(Status.PENDING, SortKey.CREATED_AT, Order.ASC, 50)) == [1]
+        assert _ids(repository.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50)) == [1, 3]
+        # Another worker's loaded archive is brought up to date
+        assert _ids(other.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50)) == [1, 3]
+        assert other.get(1).isCompleted is False
+        with pytest.raises(KeyError):
+            other.get(2)
+
+        archive = data_file.with_name("todos.json.archive")
+        assert len(archive.read_text(encoding=CHARACTER_ENCODING).splitlines()) == 5
+        repository.compact()
+        assert len(archive.read_text(encoding=CHARACTER_ENCODING).splitlines()) == 1
+        assert _ids(_archiving_repository(data_file, storage_mode).list_page(
+            Status.ALL, SortKey.CREATED_AT, Order.ASC, 50
+        )) == [1, 3]
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_due_counts_of_the_archive_are_counted_once_per_archive_change(data_file, storage_mode):
+    repository = _archiving_repository(data_file, storage_mode)
+    with freeze_time("2024-01-01"):
+        repository.add_many([Todo(id=0, title=f"Todo {i}", dueDate="2024-01-02") for i in range(1, 4)])
+        repository.set_completed_many([1, 2], True)
+    with freeze_time("2024-03-01"):
+        repository.compact()
+        reader = _archiving_repository(data_file, storage_mode)
+        assert reader.due_counts(Status.PENDING)[DueWindow.OVERDUE] == 1
+        assert reader.due_counts(Status.ALL)[DueWindow.OVERDUE] == 3
+        reader._archive = None
+        # Another change of the hot todos leaves the archive unread
+        repository.add(Todo(id=0, title="Todo 4"))
+        assert reader.due_counts(Status.COMPLETED)[DueWindow.OVERDUE] == 2
+        assert reader._archive is None
+
+        repository.set_completed(1, False)
+        assert reader.due_counts(Status.COMPLETED)[DueWindow.OVERDUE] == 1
+        assert reader.due_counts(Status.ALL)[DueWindow.OVERDUE] == 3
+
+def test_archive_records_with_descriptions_still_load(data_file):
+    data_file.parent.mkdir(parents=True)
+    with open(data_file, "w", encoding=CHARACTER_ENCODING) as f:
+        json.dump([{"id": 2, "title": "Todo 2", "isCompleted": False, "createdAt": "2024-01-01T00:00:00+00:00"}], f)
+    archived = {"id": 1, "title": "Todo 1", "description": "Inline", "isCompleted": True,
+                "createdAt": "2024-01-01T00:00:00+00:00", "completedAt": "2024-01-01T00:00:00+00:00"}
+    data_file.with_name("todos.json.archive").write_text(
+        json.dumps({"op": "archive", "todo": archived}) + "\n", encoding=CHARACTER_ENCODING
+    )
+    repository = _archiving_repository(data_file)
+    assert repository.get(1).description == "Inline"
+    repository.compact()
+    assert "Inline" not in data_file.with_name("todos.json.archive").read_text(encoding=CHARACTER_ENCODING)
+    reopened = _archiving_repository(data_file)
+    assert _ids(reopened.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 50, query="inline")) == [1]
+    reopened.update(Todo(id=1, title="Todo 1", description="Moved back"))
+    assert _archiving_repository(data_file).get(1).description == "Moved back"
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_editing_an_archived_todo_keeps_it_stored(data_file, storage_mode):
+    # Compacting on every commit archives in the commit moving the todo back
+    repository = FileTodoRepository(
+        str(data_file), storage_mode=storage_mode, journal_compact_threshold=1, archive_after_days=1
+    )
+    with freeze_time("2024-01-01"):
+        repository.add(Todo(id=0, title="Todo 1"))
+        repository.set_completed(1, True)
+    with freeze_time("2024-01-03"):
+        repository.add(Todo(id=0, title="Todo 2"))
+        repository.update(Todo(id=1, title="Edited"))
+
+        reopened = FileTodoRepository(str(data_file), storage_mode=storage_mode, archive_after_days=1)
+        assert reopened.get(1).title == "Edited"
+        assert reopened.count() == 2
+
+@pytest.mark.parametrize("storage_mode", ["json", "journal"])
+def test_stale_change_of_an_archived_todo_leaves_it_archived(data_file, storage_mode):
+    repository = _archiving_repository(data_file, storage_mode)
+    with freeze_time("2024-01-01"):
+        repository.add_many([Todo(id=0, title="Todo 1"), Todo(id=0, title="Todo 2")])
+        repository.set_completed(1, True)
+    with freeze_time("2024-03-01"):
+        repository.compact()
+        with pytest.raises(VersionConflict):
+            repository.update(Todo(id=1, title="Stale"), expected_version=1)
+        with pytest.raises(VersionConflict):
+            repository.set_completed(1, False, expected_version=1)
+        repository.add(Todo(id=0, title="Todo 3"))
+
+        reopened = _archiving_repository(data_file, storage_mode)
+        assert reopened.get(1).title == "Todo 1"
+        assert reopened.count() == 3
+        assert _ids(reopened.list_page(Status.COMPLETED, SortKey.CREATED_AT, Order.ASC, 50)) == [1]
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+from app.metrics.registry import STALE_AFTER_SECONDS, MetricsRegistry
+
+def test_export_renders_counters_and_histograms():
+    registry = MetricsRegistry()
+    registry.inc("todo_file_loads_total")
+    registry.inc("todo_requests_total", endpoint="todo.index", method="GET", status=200)
+    registry.observe("todo_phase_duration_seconds", 0.003, phase="load")
+    registry.observe("todo_phase_duration_seconds", 2.0, phase="load")
+
+    text = registry.export()
+    assert "todo_file_loads_total 1\n" in text
+    assert 'todo_requests_total{endpoint="todo.index",method="GET",status="200"} 1\n' in text
+    assert 'todo_phase_duration_seconds_bucket{phase="load",le="0.0025"} 0\n' in text
+    assert 'todo_phase_duration_seconds_bucket{phase="load",le="0.005"} 1\n' in text
+    assert 'todo_phase_duration_seconds_bucket{phase="load",le="+Inf"} 2\n' in text
+    assert 'todo_phase_duration_seconds_count{phase="load"} 2\n' in text
+    assert "# TYPE todo_request_duration_seconds histogram" in text
+
+def test_workers_sharing_a_directory_report_totals(tmp_path):
+    workers = [MetricsRegistry(str(tmp_path)) for _ in range(3)]
+    for worker in workers:
+        worker.inc("todo_bytes_read_total", 100)
+        worker.observe("todo_request_duration_seconds", 0.01, endpoint="todo.view")
+        worker.sync(force=True)
+    workers[0].inc("todo_bytes_read_total", 5)
+
+    text = workers[0].export()
+    assert "todo_bytes_read_total 305\n" in text
+    assert 'todo_request_duration_seconds_count{endpoint="todo.view"} 3\n' in text
+
+def test_files_of_exited_and_silent_workers_leave_the_totals(tmp_path):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    for worker in (exited.stdout.strip(), os.getpid()):
+        other = MetricsRegistry(str(tmp_path))
+        other.inc("todo_bytes_read_total", 100)
+        other.sync(force=True)
+        other._file.rename(tmp_path / f"metrics-{worker}-1.json")
+        other._file = None
+    silent = tmp_path / f"metrics-{os.getpid()}-1.json"
+    os.utime(silent, (time.time() - 2 * STALE_AFTER_SECONDS,) * 2)
+
+    registry = MetricsRegistry(str(tmp_path))
+    registry.sync(force=True)
+    assert "\ntodo_bytes_read_total " not in registry.export()
+    assert [path.name for path in tmp_path.glob("metrics-*.json") if path != registry._file] == [silent.name]
+
+    registry.close()
+    assert list(tmp_path.glob("metrics-*.json")) == [silent]
@@ -0,0 +1,93 @@
+import json
+import pytest
+from freezegun import freeze_time
+from app.models.todo import Todo
+from app.models.list_options import Status, SortKey, Order
+from app.repositories.file_todo_repository import FileTodoRepository
+from app.repositories.snapshot import Snapshot
+from app.repositories.snapshot_todo_repository import SnapshotTodoRepository
+
+@pytest.fixture
+def data_file(tmp_path):
+    return tmp_path / "data/todos.json"
+
+def test_imports_existing_data_file(data_file):
+    source = FileTodoRepository(str(data_file))
+    for i in range(3):
+        source.add(Todo(id=0, title=f"Todo {i}", description="Imported", dueDate="2030-01-0%d" % (i + 1)))
+    source.delete(3)
+
+    repository = SnapshotTodoRepository(str(data_file))
+    assert [t.to_dict() for t in repository.list_all()] == [t.to_dict() for t in source.list_all()]
+    assert repository.version() == source.version()
+    # Ids deleted before the import are not handed out again
+    assert repository.add(Todo(id=0, title="New")).id == 4
+
+def test_workers_map_the_latest_snapshot(data_file):
+    writer = SnapshotTodoRepository(str(data_file))
+    reader = SnapshotTodoRepository(str(data_file))
+    writer.add_many([Todo(id=0, title=f"Todo {i}") for i in range(5)])
+    assert reader.count() == 5
+
+    # A page being streamed keeps reading the snapshot it started on
+    page = reader.iter_page(Status.ALL, SortKey.TITLE, Order.ASC, 10)
+    items = iter(page.items)
+    assert next(items).title == "Todo 0"
+    writer.delete_many([2, 3])
+    assert [t.title for t in items] == ["Todo 1", "Todo 2", "Todo 3", "Todo 4"]
+
+    assert [t.title for t in reader.list_all()] == ["Todo 4", "Todo 3", "Todo 0"]
+    assert reader.get(5).version == 1
+    with pytest.raises(KeyError):
+        reader.get(2)
+
+def test_snapshot_is_binary_and_leaves_the_data_file(data_file):
+    repository = SnapshotTodoRepository(str(data_file))
+    repository.add(Todo(id=0, title="Todo 1"))
+    assert not data_file.exists()
+    snapshot = data_file.with_name("todos.json.snapshot").read_bytes()
+    assert snapshot.startswith(b"TODOSNAP")
+    with pytest.raises(ValueError):
+        json.loads(snapshot)
+
+def test_first_change_imports_data_file(data_file):
+    FileTodoRepository(str(data_file)).add(Todo(id=0, title="Todo 1"))
+    repository = SnapshotTodoRepository(str(data_file))
+    assert repository.add(Todo(id=0, title="Todo 2")).id == 2
+    assert repository.count() == 2
+
+@freeze_time("2026-01-01")
+def test_changes_copy_the_untouched_records(data_file, tmp_path, monkeypatch):
+    repository = SnapshotTodoRepository(str(data_file))
+    mirror = FileTodoRepository(str(tmp_path / "mirror/todos.json"))
+    for target in (repository, mirror):
+        target.add_many([
+            Todo(id=0, title=f"Todo {i % 7}", description=f"Text {i}", dueDate=f"2030-01-{i % 28 + 1:02d}" if i % 3 else None)
+            for i in range(40)
+        ])
+    decoded = []
+    todo = Snapshot.todo
+    monkeypatch.setattr(Snapshot, "todo", lambda self, number, details=True: decoded.append(number) or todo(self, number, details))
+
+    for target in (repository, mirror):
+        target.update(Todo(id=5, title="Renamed", description="Other words", dueDate=None))
+        target.set_completed_many([1, 12, 40], True)
+        target.delete_many([2, 30])
+        target.add(Todo(id=0, title="Todo 0 again", description="Text 41", dueDate="2030-01-01"))
+    # Every commit decodes just the todos it changes
+    assert sorted(decoded) == [0, 1, 4, 11, 29, 39]
+
+    for status in Status:
+        for sort_key in SortKey:
+            for order in Order:
+                pages = [
+                    [t.to_dict() for t in target.list_page(status, sort_key, order, 100).items]
+                    for target in (repository, mirror)
+                ]
+                assert pages[0] == pages[1]
+        assert repository.due_counts(status) == mirror.due_counts(status)
+    for query in ("text", "text 1", "other", "renamed", "todo 0", "again"):
+        found = [[t.id for t in target.list_page(Status.ALL, SortKey.CREATED_AT, Order.ASC, 100, query=query).items]
+                 for target in (repository, mirror)]
+        assert found[0] == found[1]
+    assert repository.add(Todo(id=0, title="New")).id == 42
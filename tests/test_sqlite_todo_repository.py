@@ -0,0 +1,105 @@
+import pytest
+from app import create_app
+from app.models.todo import Todo
+from app.repositories.file_todo_repository import FileTodoRepository
+from app.repositories.sqlite_todo_repository import SqliteTodoRepository
+from app.repositories.migrate import migrate_json_to_sqlite
+
+@pytest.fixture
+def data_file(tmp_path):
+    return tmp_path / "data/todos.json"
+
+@pytest.fixture
+def db_file(tmp_path):
+    return tmp_path / "data/todos.sqlite3"
+
+def test_uses_wal_journal_mode(db_file):
+    repository = SqliteTodoRepository(str(db_file))
+    assert repository._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_migrate_json_keeps_ids_and_high_water_mark(data_file, db_file):
+    source = FileTodoRepository(str(data_file))
+    source.add(Todo(id=0, title="Todo 1", dueDate="2026-01-31"))
+    source.add(Todo(id=0, title="Todo 2"))
+    source.add(Todo(id=0, title="Todo 3"))
+    source.set_completed(2, True)
+    source.delete(3)
+
+    assert migrate_json_to_sqlite(str(data_file), str(db_file)) == 2
+
+    target = SqliteTodoRepository(str(db_file))
+    assert target.get(1).dueDate == "2026-01-31"
+    assert target.get(2).isCompleted is True
+    assert target.add(Todo(id=0, title="Todo 4")).id == 4
+
+def test_migrate_refuses_non_empty_database(data_file, db_file):
+    SqliteTodoRepository(str(db_file)).add(Todo(id=0, title="Existing"))
+    with pytest.raises(RuntimeError):
+        migrate_json_to_sqlite(str(data_file), str(db_file))
+
+def test_app_uses_sqlite_storage_mode(db_file, data_file):
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "STORAGE_MODE": "sqlite",
+        "SQLITE_FILE": str(db_file),
+        "DATA_FILE": str(data_file),
+    })
+    with app.test_client() as client:
+        client.post("/add", data={"title": "Stored in SQLite"})
+        assert b"Stored in SQLite" in client.get("/").data
+
+    assert not data_file.exists()
+    assert SqliteTodoRepository(str(db_file)).get(1).title == "Stored in SQLite"
+
+def test_older_database_gets_description_as_last_column(db_file):
+    import sqlite3
+    from app.models.list_options import Status, SortKey, Order
+
+    db_file.parent.mkdir(parents=True)
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute(
+            "CREATE TABLE todos (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, titleKey TEXT NOT NULL,"
+            " description TEXT, dueDate TEXT, isCompleted INTEGER NOT NULL DEFAULT 0, createdAt TEXT NOT NULL)"
+        )
+        for i in (1, 2):
+            conn.execute(
+                "INSERT INTO todos (title, titleKey, description, createdAt) VALUES (?, ?, ?, ?)",
+                (f"Todo {i}", f"todo {i}", f"Details {i}", f"2026-01-0{i}T00:00:00+00:00"),
+            )
+        conn.execute("DELETE FROM todos WHERE id = 2")
+    conn.close()
+
+    repository = SqliteTodoRepository(str(db_file))
+    columns = [row["name"] for row in repository._connection().execute("PRAGMA table_info(todos)")]
+    assert columns[-1] == "description"
+    assert repository.get(1).description == "Details 1"
+    # Listings return summaries, the search still covers descriptions
+    page = repository.list_page(Status.ALL, SortKey.TITLE, Order.ASC, 10, query="details")
+    assert [(t.id, t.description) for t in page.items] == [(1, None)]
+    assert repository.add(Todo(id=0, title="Todo 3")).id == 3
+
+def test_older_full_text_index_is_rebuilt_with_the_shared_tokenizer(db_file):
+    from app.models.list_options import Status, SortKey, Order
+
+    repository = SqliteTodoRepository(str(db_file))
+    repository.add(Todo(id=0, title="Straße fegen"))
+    conn = repository._connection()
+    with conn:
+        for trigger in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER todos_fts_{trigger}")
+        conn.execute("DROP TABLE todos_fts")
+        conn.execute(
+            "CREATE VIRTUAL TABLE todos_fts USING fts5 (title, description, content='todos',"
+            " content_rowid='id', tokenize='unicode61 remove_diacritics 0')"
+        )
+        conn.execute(
+            "CREATE TRIGGER todos_fts_insert AFTER INSERT ON todos BEGIN"
+            " INSERT INTO todos_fts (rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        conn.execute("INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')")
+
+    reopened = SqliteTodoRepository(str(db_file))
+    page = reopened.list_page(Status.ALL, SortKey.TITLE, Order.ASC, 10, query="STRASSE")
+    assert [t.id for t in page.items] == [1]
@@ -0,0 +1,32 @@
+import pytest
+from app.models.todo import Todo
+
+@pytest.mark.parametrize("created_at", [
+    "2026-01-01T10:00:00+00:00",
+    "2026-01-01T10:00:00.123456+00:00",
+])
+def test_to_dict_round_trips_json_shape(created_at):
+    item = {
+        "id": 7,
+        "title": "Write Tests",
+        "description": "Some description",
+        "dueDate": "2026-01-31",
+        "isCompleted": True,
+        "createdAt": created_at,
+        "version": 3,
+    }
+    assert Todo(**item).to_dict() == item
+
+def test_precomputed_sort_keys_follow_changes():
+    todo = Todo(id=1, title="Straße", dueDate="2026-01-31")
+    assert todo.titleKey == "strasse"
+    assert todo.dueDateOrdinal < Todo(id=2, title="x", dueDate="2026-02-01").dueDateOrdinal
+
+    todo.title = "lower"
+    todo.dueDate = None
+    assert todo.titleKey == "lower"
+    assert todo.dueDateOrdinal is None
+    assert todo.dueDate is None
+
+def test_todo_is_slotted():
+    assert not hasattr(Todo(id=1, title="x"), "__dict__")
@@ -0,0 +1,287 @@
+import pytest
+from app.models.todo import Todo
+from app.models.list_options import ListOptions
+from app.services.todo_service import TodoService
+from app.repositories.file_todo_repository import FileTodoRepository
+from app.repositories.snapshot_todo_repository import SnapshotTodoRepository
+from app.repositories.sqlite_todo_repository import SqliteTodoRepository
+from app.repositories.todo_repository import VersionConflict
+
+BACKENDS = {
+    "json": lambda tmp_path: FileTodoRepository(str(tmp_path / "data/todos.json")),
+    "journal": lambda tmp_path: FileTodoRepository(str(tmp_path / "data/todos.json"), storage_mode="journal"),
+    "sqlite": lambda tmp_path: SqliteTodoRepository(str(tmp_path / "data/todos.sqlite3")),
+    "snapshot": lambda tmp_path: SnapshotTodoRepository(str(tmp_path / "data/todos.json")),
+}
+
+@pytest.fixture(params=list(BACKENDS))
+def make_service(request, tmp_path):
+    # Each call simulates a fresh worker on the same storage
+    return lambda: TodoService(BACKENDS[request.param](tmp_path))
+
+@pytest.fixture
+def service(make_service):
+    return make_service()
+
+def test_ids_are_not_reused_after_delete(service, make_service):
+    service.add(Todo(id=0, title="Todo 1"))
+    service.add(Todo(id=0, title="Todo 2"))
+    service.delete(2)
+
+    assert service.add(Todo(id=0, title="Todo 3")).id == 3
+    service.delete(3)
+    # The high-water mark survives a restart
+    assert make_service().add(Todo(id=0, title="Todo 4")).id == 4
+
+def test_missing_id_raises_key_error(service):
+    service.add(Todo(id=0, title="Todo 1"))
+    for call in (
+        lambda: service.get(5),
+        lambda: service.update(Todo(id=5, title="x")),
+        lambda: service.set_completed(5, True),
+        lambda: service.delete(5),
+    ):
+        with pytest.raises(KeyError):
+            call()
+
+def test_versions_grow_with_changes_and_survive_restart(service, make_service):
+    assert service.version().version == 0
+    service.add(Todo(id=0, title="Todo 1"))
+    service.add(Todo(id=0, title="Todo 2"))
+    assert service.todo_version(1) == 1
+
+    service.update(Todo(id=1, title="Todo 1b"))
+    service.set_completed(1, True)
+    service.delete(2)
+    assert service.todo_version(1) == 3
+    version = service.version()
+    assert version.version == 5
+    assert version.modified is not None
+
+    restarted = make_service()
+    assert restarted.version() == version
+    assert restarted.todo_version(1) == 3
+    assert restarted.get(1).version == 3
+    with pytest.raises(KeyError):
+        restarted.todo_version(2)
+
+def test_changes_at_a_stale_version_conflict(service, make_service):
+    service.add(Todo(id=0, title="Todo 1"))
+    other = make_service()
+    other.update(Todo(id=1, title="Other"), expected_version=1)
+
+    with pytest.raises(VersionConflict) as conflict:
+        service.update(Todo(id=1, title="Mine"), expected_version=1)
+    assert (conflict.value.expected, conflict.value.current) == (1, 2)
+    with pytest.raises(VersionConflict):
+        service.set_completed(1, True, expected_version=1)
+    stored = service.get(1)
+    assert (stored.title, stored.isCompleted, stored.version) == ("Other", False, 2)
+    assert service.version().version == 2
+
+    service.set_completed(1, True, expected_version=2)
+    with pytest.raises(KeyError):
+        service.update(Todo(id=5, title="x"), expected_version=1)
+    # Without an expected version the change goes through
+    assert service.update(Todo(id=1, title="Mine")).version == 4
+
+def test_bulk_changes_apply_as_one_change(service, make_service):
+    added = service.add_many([Todo(id=0, title=f"Todo {i}") for i in range(1, 6)])
+    assert [t.id for t in added] == [1, 2, 3, 4, 5]
+    assert service.version().version == 1
+
+    result = service.set_completed_many([1, 2, 2, 7], True)
+    assert (result.succeeded, result.not_found) == ([1, 2], [7])
+    result = service.update_many([Todo(id=3, title="Todo 3b"), Todo(id=8, title="x")])
+    assert (result.succeeded, result.not_found) == ([3], [8])
+    result = service.delete_many([4, 5])
+    assert (result.succeeded, result.not_found) == ([4, 5], [])
+    # A batch that changes nothing is not a change
+    assert service.delete_many([9]).not_found == [9]
+    assert service.version().version == 4
+
+    restarted = make_service()
+    assert [(t.id, t.title, t.isCompleted) for t in restarted.list()] == [
+        (3, "Todo 3b", False), (2, "Todo 2", True), (1, "Todo 1", True),
+    ]
+
+def test_search_matches_word_prefixes(service):
+    service.add(Todo(id=0, title="Buy milk", description="Semi-skimmed"))
+    service.add(Todo(id=0, title="Call plumber", dueDate="2030-01-02"))
+    service.add(Todo(id=0, title="buy bread", description="From the bakery", dueDate="2030-01-01"))
+    service.add(Todo(id=0, title="Bakery order"))
+    service.set_completed(3, True)
+
+    assert _titles(service, query="BUY", sort="title", order="asc") == ["buy bread", "Buy milk"]
+    assert _titles(service, query="bak", sort="title", order="asc") == ["Bakery order", "buy bread"]
+    assert _titles(service, query="bu bak") == ["buy bread"]
+    assert _titles(service, query="buy", status="pending") == ["Buy milk"]
+    assert _titles(service, query="bu", sort="dueDate", order="asc") == ["buy bread", "Buy milk"]
+    assert _titles(service, query="skim") == ["Buy milk"]
+    assert _titles(service, query="nothing") == []
+    # A query without words does not filter
+    assert len(_titles(service, query="!?")) == 4
+
+    service.update(Todo(id=1, title="Buy oat milk"))
+    service.delete(3)
+    assert _titles(service, query="buy") == ["Buy oat milk"]
+    assert _titles(service, query="skim") == []
+    assert _titles(service, query="oat") == ["Buy oat milk"]
+
+def test_search_folds_non_ascii_text_alike_on_every_backend(service, make_service):
+    service.add(Todo(id=0, title="Straße fegen", description="Ärger mit dem Nachbarn"))
+    service.add(Todo(id=0, title="Cafe\u0301 bestellen"))
+    service.add(Todo(id=0, title="ＣＡＦÉ au lait"))
+    service.add(Todo(id=0, title="Ωμέγα", description="naïve ﬁsh"))
+
+    for reader in (service, make_service()):
+        assert _titles(reader, query="STRASSE", sort="title", order="asc") == ["Straße fegen"]
+        assert _titles(reader, query="straß") == ["Straße fegen"]
+        assert _titles(reader, query="ärg") == ["Straße fegen"]
+        assert _titles(reader, query="café", sort="title", order="asc") == ["Cafe\u0301 bestellen", "ＣＡＦÉ au lait"]
+        assert _titles(reader, query="cafe") == []
+        assert _titles(reader, query="ΩΜΈΓΑ") == ["Ωμέγα"]
+        assert _titles(reader, query="naïve fish") == ["Ωμέγα"]
+
+def test_search_results_are_paginated(service):
+    for i in range(7):
+        service.add(Todo(id=0, title=f"match {i}"))
+        service.add(Todo(id=0, title=f"other {i}"))
+
+    first = service.list_filtered(ListOptions(sort="title", order="asc", page_size=5, query="mat"))
+    assert [t.title for t in first.items] == [f"match {i}" for i in range(5)]
+    second = service.list_filtered(
+        ListOptions(sort="title", order="asc", page_size=5, query="mat", cursor=first.next_cursor)
+    )
+    assert [t.title for t in second.items] == ["match 5", "match 6"]
+    assert second.next_cursor is None
+    back = service.list_filtered(
+        ListOptions(sort="title", order="asc", page_size=5, query="mat", cursor=second.prev_cursor)
+    )
+    assert [t.title for t in back.items] == [f"match {i}" for i in range(5)]
+
+def _titles(service, **options):
+    return [t.title for t in service.list_filtered(ListOptions(**options)).items]
+
+def test_due_date_sort_keeps_missing_dates_last(service):
+    service.add(Todo(id=0, title="none", dueDate=None))
+    service.add(Todo(id=0, title="late", dueDate="2026-03-01"))
+    service.add(Todo(id=0, title="early", dueDate="2026-02-01"))
+
+    assert _titles(service, sort="dueDate", order="asc") == ["early", "late", "none"]
+    assert _titles(service, sort="dueDate", order="desc") == ["late", "early", "none"]
+
+def test_orderings_follow_changes(service):
+    service.add(Todo(id=0, title="b"))
+    service.add(Todo(id=0, title="C"))
+    service.add(Todo(id=0, title="a"))
+    assert _titles(service, sort="title", order="asc") == ["a", "b", "C"]
+
+    service.update(Todo(id=1, title="d"))
+    service.set_completed(3, True)
+    assert _titles(service, sort="title", order="asc") == ["a", "C", "d"]
+    assert _titles(service, status="pending", sort="title", order="asc") == ["C", "d"]
+    assert _titles(service, status="completed", sort="title", order="asc") == ["a"]
+
+    service.delete(2)
+    assert _titles(service, sort="title", order="desc") == ["d", "a"]
+
+def _walk_pages(service, options):
+    pages = [service.list_filtered(options)]
+    while pages[-1].next_cursor:
+        pages.append(service.list_filtered(ListOptions(
+            status=options.status, sort=options.sort, order=options.order,
+            page_size=options.page_size, cursor=pages[-1].next_cursor,
+        )))
+    return pages
+
+@pytest.mark.parametrize("status", ["all", "pending", "completed"])
+@pytest.mark.parametrize("sort", ["createdAt", "dueDate", "title"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_keyset_pages_cover_listing(service, status, sort, order):
+    for i in range(23):
+        service.add(Todo(
+            id=0,
+            title=f"Todo {i % 7}",
+            dueDate=f"2026-02-{i % 5 + 1:02d}" if i % 3 else None,
+        ))
+        if i % 4 == 0:
+            service.set_completed(i + 1, True)
+
+    full = service.list_filtered(ListOptions(status=status, sort=sort, order=order, page_size=100))
+    pages = _walk_pages(service, ListOptions(status=status, sort=sort, order=order, page_size=4))
+    assert [t.id for p in pages for t in p.items] == [t.id for t in full.items]
+    assert pages[0].prev_cursor is None
+
+    # Walking back from the last page returns the same pages
+    for previous, page in zip(reversed(pages[:-1]), reversed(pages[1:])):
+        back = service.list_filtered(ListOptions(
+            status=status, sort=sort, order=order, page_size=4, cursor=page.prev_cursor,
+        ))
+        assert [t.id for t in back.items] == [t.id for t in previous.items]
+
+def test_listings_return_summaries(service, make_service):
+    service.add(Todo(id=0, title="Todo 1", description="Long details"))
+    service.add(Todo(id=0, title="Todo 2", description="More details"))
+    service.update(Todo(id=2, title="Todo 2", description=None))
+
+    for current in (service, make_service()):
+        page = current.list_filtered(ListOptions(query="details"))
+        assert [t.id for t in page.items] == [1]
+        assert current.get(1).description == "Long details"
+        assert current.get(2).description is None
+        assert [t.description for t in current.list()] == [None, "Long details"]
+
+def test_due_windows_and_counts_roll_over_at_midnight(service):
+    from freezegun import freeze_time
+
+    for title, due in [
+        ("old", "2026-03-01"), ("yesterday", "2026-03-09"), ("today", "2026-03-10"),
+        ("tomorrow", "2026-03-11"), ("in a week", "2026-03-17"), ("later", "2026-03-18"), ("undated", None),
+    ]:
+        service.add(Todo(id=0, title=title, dueDate=due))
+    service.set_completed(1, True)
+
+    with freeze_time("2026-03-10 23:59:00"):
+        assert _titles(service, due="overdue", sort="dueDate", order="asc") == ["old", "yesterday"]
+        assert _titles(service, due="overdue", status="pending") == ["yesterday"]
+        assert _titles(service, due="today") == ["today"]
+        assert _titles(service, due="upcoming", sort="title", order="asc") == ["in a week", "tomorrow"]
+        assert _titles(service, due="none", sort="dueDate") == ["undated"]
+        assert _titles(service, due="upcoming", query="tom") == ["tomorrow"]
+        assert service.due_counts(ListOptions()) == {"overdue": 2, "today": 1, "upcoming": 2, "none": 1}
+        assert service.due_counts(ListOptions(status="pending"))["overdue"] == 1
+
+    with freeze_time("2026-03-11 00:00:01"):
+        assert _titles(service, due="today") == ["tomorrow"]
+        assert service.due_counts(ListOptions()) == {"overdue": 3, "today": 1, "upcoming": 2, "none": 1}
+
+def test_due_window_pages_cover_window(service):
+    from freezegun import freeze_time
+
+    for i in range(12):
+        service.add(Todo(id=0, title=f"Todo {i}", dueDate=f"2026-03-{i % 6 + 1:02d}"))
+
+    with freeze_time("2026-03-04"):
+        options = ListOptions(due="overdue", sort="dueDate", order="desc", page_size=2)
+        pages = [service.list_filtered(options)]
+        while pages[-1].next_cursor:
+            pages.append(service.list_filtered(ListOptions(
+                due="overdue", sort="dueDate", order="desc", page_size=2, cursor=pages[-1].next_cursor,
+            )))
+    assert [t.dueDate for p in pages for t in p.items] == ["2026-03-03"] * 2 + ["2026-03-02"] * 2 + ["2026-03-01"] * 2
+
+def test_iter_all_reads_whole_todos_in_chunks(service, monkeypatch):
+    from app.repositories import file_todo_repository, sqlite_todo_repository
+
+    monkeypatch.setattr(file_todo_repository, "ITER_CHUNK_SIZE", 2)
+    monkeypatch.setattr(sqlite_todo_repository, "ITER_CHUNK_SIZE", 2)
+    for i in range(5):
+        service.add(Todo(id=0, title=f"Todo {i}", description=f"Details {i}"))
+
+    todos = service.iter_all()
+    assert next(todos).description == "Details 0"
+    # Changes between chunks neither break nor repeat the walk, the
+    # snapshot storage finishes on the snapshot it started with
+    service.delete(5)
+    assert [t.id for t in todos] in ([2, 3, 4], [2, 3, 4, 5])